@@ -0,0 +1,279 @@
+# aggregate_cube_v2.py
+# Materialized aggregate cube at domain × sentiment × day × video granularity.
+# Each cell stores additive measures only (counts, sums, sums of squares, histogram bin counts),
+# so cubes built from different batches of rows are merged by plain addition and every report
+# table (crosstab, extreme rate, monthly counts, like/length means & stds, probability / like /
+# length histograms) is a small group-by over the cube instead of a rescan of every comment.
+# Incremental: every ingested row is recorded in a ledger with a version hash of the fields it
+# contributed (sentiment, probabilities, like_count, length, day, video). A row seen again with the
+# same version is skipped. If the version changed (refreshed likes, --full rescoring with another
+# label), its old contribution is subtracted and the new one added, so the cube matches a rebuild.
+# Files: RESULTS_DIR/cube/cube.csv, RESULTS_DIR/cube/ingested_rows.csv (ledger, appended; last
+# version per key wins). A cube from before the ledger (ingested_keys.txt) is rebuilt by 'update'.
+# Usage:
+#     python aggregate_cube_v2.py update            # ingest new rows from WITH_SENT_CSV
+#     python aggregate_cube_v2.py update --rebuild  # start from scratch
+#     python aggregate_cube_v2.py show              # print the headline tables from the cube
+
+from settings import RESULTS_DIR, WITH_SENT_CSV
+import argparse, time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from dataset_v2 import EXTREME_THRESHOLD
+
+CUBE_DIR = RESULTS_DIR / "cube"
+CUBE_CSV = CUBE_DIR / "cube.csv"
+LEDGER_CSV = CUBE_DIR / "ingested_rows.csv"
+LEGACY_KEYS_TXT = CUBE_DIR / "ingested_keys.txt"
+CHUNK_ROWS = 200_000
+
+KEYS = ["domain", "sentiment", "day", "video_id"]
+PROBS = ["prob_positive", "prob_neutral", "prob_negative"]
+LEDGER_STR = ["key", "version", "domain", "sentiment", "published_at", "video_id"]
+LEDGER_NUM = ["like_count", "comment_length"] + PROBS
+PROB_BINS = 10                                                  # [0, .1), ..., [.9, 1]
+LIKE_EDGES = np.array([0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1_000, 5_000, 10_000, 100_000])
+LEN_EDGES = np.array([0, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500, 1_000, 2_000])
+
+# moment columns: <name>_sum / <name>_sumsq
+MOMENTS = {"like": "like_count", "len": "comment_length",
+           "pos": "prob_positive", "neu": "prob_neutral", "neg": "prob_negative"}
+
+
+def hist_cols(prefix, n):
+    return [f"{prefix}_h{i}" for i in range(n)]
+
+
+def _one_hot(bins, n):
+    return np.eye(n, dtype=np.int64)[bins]
+
+
+def _bin_edges(values, edges):
+    return np.clip(np.searchsorted(edges, values, side="right") - 1, 0, len(edges) - 1)
+
+
+def row_keys(df):
+    return df["comment_id"].astype(str) + "|" + df["domain"].astype(str)
+
+
+def ledger_rows(df):
+    """The fields build_partial reads, normalised (published_at → day, floats, rounded probs),
+    plus key and version hash. Cube contributions are built from these, so subtracting a stale
+    version removes exactly what was added."""
+    led = pd.DataFrame({
+        "key": row_keys(df).to_numpy(),
+        "domain": df["domain"].astype(str).to_numpy(),
+        "sentiment": df["sentiment"].astype(str).to_numpy(),
+        "published_at": pd.to_datetime(df["published_at"], errors="coerce", utc=True)
+                          .dt.strftime("%Y-%m-%d").fillna("").to_numpy(),
+        "video_id": (df["video_id"].astype(str) if "video_id" in df.columns else pd.Series("", index=df.index)).to_numpy(),
+        "like_count": pd.to_numeric(df.get("like_count", 0), errors="coerce"),
+        "comment_length": (df["comment_length"] if "comment_length" in df.columns
+                           else df["clean_text"].fillna("").astype(str).str.len()),
+    }, index=df.index)
+    for c in PROBS:
+        led[c] = df[c]
+    led[LEDGER_NUM] = led[LEDGER_NUM].astype(float).fillna(0)
+    led[PROBS] = led[PROBS].round(6)
+    fields = led.drop(columns="key")
+    led.insert(1, "version", pd.util.hash_pandas_object(fields, index=False).astype(str))
+    return led.reset_index(drop=True)
+
+
+def build_partial(df):
+    """Aggregate a frame of scored rows into cube cells."""
+    out = pd.DataFrame({
+        "domain": df["domain"].astype(str).to_numpy(),
+        "sentiment": df["sentiment"].astype(str).to_numpy(),
+        "day": pd.to_datetime(df["published_at"], errors="coerce", utc=True).dt.strftime("%Y-%m-%d").fillna("").to_numpy(),
+        "video_id": (df["video_id"].astype(str) if "video_id" in df.columns else pd.Series("", index=df.index)).to_numpy(),
+    })
+    vals = {
+        "like_count": pd.to_numeric(df.get("like_count", 0), errors="coerce"),
+        "comment_length": (df["comment_length"] if "comment_length" in df.columns
+                           else df["clean_text"].fillna("").astype(str).str.len()),
+    }
+    for c in ["prob_positive", "prob_neutral", "prob_negative"]:
+        vals[c] = df[c]
+    vals = {k: pd.Series(v, index=df.index).astype(float).fillna(0).to_numpy() for k, v in vals.items()}
+
+    out["n"] = 1
+    for name, col in MOMENTS.items():
+        out[f"{name}_sum"] = vals[col]
+        out[f"{name}_sumsq"] = vals[col] ** 2
+    out["n_extreme"] = ((vals["prob_positive"] > EXTREME_THRESHOLD) |
+                        (vals["prob_negative"] > EXTREME_THRESHOLD)).astype(np.int64)
+
+    blocks = [out]
+    for name, col in [("pos", "prob_positive"), ("neg", "prob_negative")]:
+        bins = np.clip((vals[col] * PROB_BINS).astype(int), 0, PROB_BINS - 1)
+        blocks.append(pd.DataFrame(_one_hot(bins, PROB_BINS), columns=hist_cols(name, PROB_BINS)))
+    blocks.append(pd.DataFrame(_one_hot(_bin_edges(vals["like_count"], LIKE_EDGES), len(LIKE_EDGES)),
+                               columns=hist_cols("like", len(LIKE_EDGES))))
+    blocks.append(pd.DataFrame(_one_hot(_bin_edges(vals["comment_length"], LEN_EDGES), len(LEN_EDGES)),
+                               columns=hist_cols("len", len(LEN_EDGES))))
+    cells = pd.concat(blocks, axis=1)
+    return cells.groupby(KEYS, sort=False, as_index=False).sum()
+
+
+def merge(*cubes):
+    cubes = [c for c in cubes if c is not None and len(c)]
+    if not cubes:
+        return None
+    if len(cubes) == 1:
+        return cubes[0]
+    return pd.concat(cubes, ignore_index=True).groupby(KEYS, sort=False, as_index=False).sum()
+
+
+def load_cube(path=CUBE_CSV):
+    if not path.exists():
+        return None
+    return pd.read_csv(path, dtype={k: str for k in KEYS}, keep_default_na=False)
+
+
+def require_cube(path=CUBE_CSV):
+    cube = load_cube(path)
+    if cube is None:
+        raise SystemExit(f"No cube at {path}; run 'aggregate_cube_v2.py update' first")
+    return cube
+
+
+def load_ledger(path=LEDGER_CSV):
+    """Last ingested version per key (indexed by key); None for a cube built before the ledger."""
+    if not path.exists():
+        return None if LEGACY_KEYS_TXT.exists() else pd.DataFrame(columns=LEDGER_STR[1:] + LEDGER_NUM,
+                                                                  index=pd.Index([], name="key"))
+    led = pd.read_csv(path, dtype={c: str for c in LEDGER_STR}, keep_default_na=False)
+    led[LEDGER_NUM] = led[LEDGER_NUM].astype(float)
+    return led.drop_duplicates("key", keep="last").set_index("key")
+
+
+def _negate(cells):
+    cells = cells.copy()
+    num = [c for c in cells.columns if c not in KEYS]
+    cells[num] = -cells[num]
+    return cells
+
+
+def _ingest(rows, cube, ledger):
+    """→ (cube, ledger, ledger rows written). New keys are added; changed versions are swapped."""
+    led = ledger_rows(rows).drop_duplicates("key", keep="last").set_index("key")
+    old = ledger["version"].reindex(led.index)
+    changed = old.notna() & (old != led["version"])
+    todo = led[old.isna() | changed]
+    if todo.empty:
+        return cube, ledger, todo
+    parts = [build_partial(todo.reset_index(drop=True))]
+    if changed.any():
+        stale = ledger.loc[changed[changed].index]
+        parts.append(_negate(build_partial(stale.reset_index(drop=True))))
+    cube = merge(cube, *parts)
+    cube = cube[cube["n"] != 0].reset_index(drop=True)
+    ledger = pd.concat([ledger.drop(index=todo.index, errors="ignore"), todo])
+    return cube, ledger, todo
+
+
+def _save(cube, ledger_part, mode):
+    CUBE_DIR.mkdir(parents=True, exist_ok=True)
+    cube.to_csv(CUBE_CSV, index=False)
+    write_header = mode == "w" or not LEDGER_CSV.exists()
+    ledger_part.reset_index().to_csv(LEDGER_CSV, mode=mode, header=write_header, index=False)
+
+
+def update_cube(rows, cube=None, ledger=None, save=True):
+    """Ingest scored rows: new rows are added, rows whose version changed are replaced.
+    Returns (cube, n_rows_ingested_or_replaced)."""
+    cube = load_cube() if cube is None else cube
+    ledger = load_ledger() if ledger is None else ledger
+    if ledger is None:
+        print(f"[cube] {CUBE_CSV} predates the row ledger; run 'python aggregate_cube_v2.py update --rebuild'")
+        return cube, 0
+    cube, ledger, todo = _ingest(rows.dropna(subset=["sentiment"]), cube, ledger)
+    if save and len(todo):
+        _save(cube, todo, mode="a")
+    return cube, len(todo)
+
+
+def update_from_csv(path=WITH_SENT_CSV, rebuild=False, chunksize=CHUNK_ROWS):
+    """One chunked pass over the scored CSV; only new or changed rows are aggregated."""
+    if not rebuild and load_ledger() is None:
+        print("[cube] no row ledger yet; rebuilding")
+        rebuild = True
+    if rebuild:
+        for p in (CUBE_CSV, LEDGER_CSV, LEGACY_KEYS_TXT):
+            p.unlink(missing_ok=True)
+    cube, ledger, total = load_cube(), load_ledger(), 0
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        cube, ledger, todo = _ingest(chunk.dropna(subset=["sentiment"]), cube, ledger)
+        total += len(todo)
+    if total:
+        _save(cube, ledger, mode="w")          # rewritten compacted: one version per key
+    return cube, total
+
+
+# ---- readers: report tables from the cube --------------------------------
+
+def counts(cube):
+    """crosstab(domain, sentiment)."""
+    return cube.pivot_table(index="domain", columns="sentiment", values="n", aggfunc="sum", fill_value=0)
+
+
+def extreme_rate(cube):
+    g = cube.groupby("domain")[["n_extreme", "n"]].sum()
+    return g["n_extreme"] / g["n"]
+
+
+def moments(cube, name, by=("domain", "sentiment")):
+    """Mean / std / n of a MOMENTS measure (e.g. 'like', 'len', 'pos') per group."""
+    g = cube.groupby(list(by))[["n", f"{name}_sum", f"{name}_sumsq"]].sum()
+    mean = g[f"{name}_sum"] / g["n"]
+    var = (g[f"{name}_sumsq"] / g["n"] - mean ** 2).clip(lower=0) * g["n"] / (g["n"] - 1).clip(lower=1)
+    return pd.DataFrame({"n": g["n"], "mean": mean, "std": np.sqrt(var)})
+
+
+def means(cube):
+    """Mean like_count / comment_length by domain × sentiment (same layout as Aggregates.means)."""
+    return pd.DataFrame({"like_count": moments(cube, "like")["mean"],
+                         "comment_length": moments(cube, "len")["mean"]})
+
+
+def monthly(cube):
+    dated = cube[cube["day"] != ""]
+    return (dated.groupby([dated["day"].str[:7].rename("month"), "domain", "sentiment"])["n"]
+                 .sum().rename("count").reset_index())
+
+
+def histogram(cube, prefix, by=("domain",)):
+    """Histogram bin counts of 'pos' / 'neg' / 'like' / 'len' per group (columns = bins)."""
+    cols = [c for c in cube.columns if c.startswith(prefix + "_h")]
+    return cube.groupby(list(by))[cols].sum()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Domain × sentiment × day × video aggregate cube")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    u = sub.add_parser("update")
+    u.add_argument("--input", type=str, default=str(WITH_SENT_CSV))
+    u.add_argument("--rebuild", action="store_true")
+    sub.add_parser("show")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    if args.cmd == "update":
+        cube, n = update_from_csv(Path(args.input), rebuild=args.rebuild)
+        size = 0 if cube is None else len(cube)
+        print(f"Ingested {n} new or changed rows → {CUBE_CSV} ({size} cells, {time.perf_counter() - t0:.2f}s)")
+        return
+
+    cube = require_cube()
+    print("Counts (domain × sentiment):\n", counts(cube))
+    print("\nExtreme rate:\n", extreme_rate(cube).round(3))
+    print("\nMeans:\n", means(cube).round(2))
+    print(f"\n({len(cube)} cells, {time.perf_counter() - t0:.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
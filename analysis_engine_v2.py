@@ -0,0 +1,176 @@
+# analysis_engine_v2.py
+# Single-load analysis entry point: read WITH_SENT_CSV once with compact dtypes, build the shared
+# aggregate layer (domain × sentiment counts, extreme rates, group means, monthly counts) and run
+# every report module against it. Each report module still runs standalone as before.
+# With --from_cube the aggregate layer is read from aggregate_cube_v2 instead of the comments,
+# and only reports that need no row-level data (module attribute NEEDS_ROWS = False) run.
+# --streaming does the same from one chunked pass over the CSV (streaming_stats_v2), for inputs
+# larger than RAM.
+# --sample K runs every report on a stratified sample (sampling_v2: at most K rows per domain ×
+# video × month, one streaming pass) with weighted tables, and prints 95% CIs for the proportions
+# and extreme rates first. Its figures and tables go to figures_v2_sample/ (SAMPLE_FIG_DIR).
+# Usage:
+#     python analysis_engine_v2.py                                  # all reports
+#     python analysis_engine_v2.py --reports cross_domain small_table
+#     python analysis_engine_v2.py --from_cube                      # tables from the cube only
+#     python analysis_engine_v2.py --streaming                      # tables from a chunked pass
+#     python analysis_engine_v2.py --sample 10                      # quick look with error bars
+# Load + per-report timings go to the pipeline_metrics_v2 run report (RESULTS_DIR/metrics/).
+
+from settings import WITH_SENT_CSV, FIG_DIR
+import argparse, importlib, time
+from functools import cached_property
+
+import pandas as pd
+
+import aggregate_cube_v2
+from dataset_v2 import EXTREME_THRESHOLD, SENTIMENT_ORDER, load_compact
+from pipeline_metrics_v2 import stage, start_run
+
+
+# report name → module exposing run(df, agg, **kwargs)
+REPORTS = {
+    "cross_domain":      "analyze_cross_domain_v2",
+    "domain_profiles":   "analyze_domain_profiles_v2",
+    "small_table":       "small_table",
+    "sentiment_results": "analyze_sentiment_results",
+}
+# output folder of each report (its run(fig_dir=...)) under the figure root; --sample runs use
+# SAMPLE_FIG_DIR so sample-weighted figures and tables never replace the full-data ones
+REPORT_DIRS = {
+    "cross_domain":      "cross_domain",
+    "domain_profiles":   "domain_profiles",
+    "small_table":       "cross_domain",
+    "sentiment_results": "sentiment_results",     # v1 script writes to figures/ by default
+}
+SAMPLE_FIG_DIR = FIG_DIR.with_name(f"{FIG_DIR.name}_sample")
+# extra kwargs when a report runs inside the engine
+ENGINE_KWARGS = {
+    "sentiment_results": {"show": False},
+}
+
+
+def load_dataset(path=WITH_SENT_CSV, mmap_text=False):
+    """Read the scored comments once with the compact dtypes every report expects (dataset_v2):
+    categoricals, float32 probabilities, int32 likes / lengths; video titles go to the separate
+    video table, which no report needs. mmap_text=True leaves clean_text in a memory-mapped store
+    (dataset_v2.text_of)."""
+    df, _videos = load_compact(path, mmap_text=mmap_text)
+    return df
+
+
+class Aggregates:
+    """Shared aggregate layer; each table is computed on first use and then reused by all reports.
+    Built from the comment rows (df) or, when cube is given, from the aggregate cube."""
+
+    def __init__(self, df=None, cube=None):
+        self.df = df
+        self.cube = cube
+
+    @property
+    def domains(self):
+        return sorted(self.counts.index)
+
+    @property
+    def has_probs(self):
+        return self.cube is not None or {"prob_positive", "prob_negative"}.issubset(self.df.columns)
+
+    @cached_property
+    def counts(self):
+        """crosstab(domain, sentiment) as counts."""
+        if self.cube is not None:
+            tab = aggregate_cube_v2.counts(self.cube)
+        else:
+            tab = pd.crosstab(self.df["domain"], self.df["sentiment"])
+        return tab.reindex(columns=SENTIMENT_ORDER, fill_value=0)
+
+    @cached_property
+    def proportions(self):
+        return self.counts.div(self.counts.sum(axis=1), axis=0)
+
+    @cached_property
+    def extreme(self):
+        """Per-row flag: prob_positive or prob_negative above EXTREME_THRESHOLD."""
+        df = self.df
+        return ((df["prob_positive"] > EXTREME_THRESHOLD) | (df["prob_negative"] > EXTREME_THRESHOLD)).astype(int)
+
+    @cached_property
+    def extreme_rate(self):
+        if self.cube is not None:
+            return aggregate_cube_v2.extreme_rate(self.cube)
+        return self.extreme.groupby(self.df["domain"], observed=True).mean()
+
+    @cached_property
+    def means(self):
+        """Mean like_count / comment_length by domain × sentiment."""
+        if self.cube is not None:
+            return aggregate_cube_v2.means(self.cube)
+        cols = [c for c in ["like_count", "comment_length"] if c in self.df.columns]
+        return self.df.groupby(["domain", "sentiment"], observed=True)[cols].mean()
+
+    @cached_property
+    def monthly(self):
+        """Comment counts by month × domain × sentiment (rows without a date are dropped)."""
+        if self.cube is not None:
+            return aggregate_cube_v2.monthly(self.cube)
+        df = self.df.dropna(subset=["published_at"])
+        month = df["published_at"].dt.tz_localize(None).dt.to_period("M").astype(str).rename("month")
+        return (df.groupby([month, df["domain"], df["sentiment"]], observed=True)
+                  .size().reset_index(name="count"))
+
+
+def run_reports(names=None, path=WITH_SENT_CSV, from_cube=False, streaming=False, mmap_text=False,
+                sample=None):
+    names = names or list(REPORTS)
+    fig_root = SAMPLE_FIG_DIR if sample else FIG_DIR
+    t0 = time.perf_counter()
+    if from_cube:
+        cube = aggregate_cube_v2.require_cube()
+        df, agg = None, Aggregates(cube=cube)
+        print(f"Loaded cube ({len(cube)} cells) in {time.perf_counter() - t0:.2f}s")
+    elif sample:
+        from sampling_v2 import load_sample, print_ci
+        with stage("analysis_sample") as st:
+            df, agg = load_sample(path, per_stratum=sample)
+            st.rows_out = len(df)
+        print(f"Sampled {len(df)} rows from {path} in {time.perf_counter() - t0:.2f}s")
+        print_ci(df)
+    elif streaming:
+        from streaming_stats_v2 import StreamingAggregates
+        df, agg = None, StreamingAggregates.from_path(path)
+        print(f"Streamed {agg.rows} rows from {path} in {time.perf_counter() - t0:.2f}s")
+    else:
+        with stage("analysis_load") as st:
+            df = load_dataset(path, mmap_text=mmap_text)
+            st.rows_out = len(df)
+        agg = Aggregates(df)
+        print(f"Loaded {len(df)} rows from {path} in {time.perf_counter() - t0:.2f}s")
+    for name in names:
+        t1 = time.perf_counter()
+        module = importlib.import_module(REPORTS[name])
+        if df is None and getattr(module, "NEEDS_ROWS", True):
+            print(f"[{name}] skipped: needs comment rows (not available with --from_cube / --streaming)")
+            continue
+        with stage(name, rows_in=None if df is None else len(df)):
+            module.run(df, agg, fig_dir=fig_root / REPORT_DIRS[name], **ENGINE_KWARGS.get(name, {}))
+        print(f"[{name}] done in {time.perf_counter() - t1:.2f}s")
+    print(f"All reports done in {time.perf_counter() - t0:.2f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run all analysis reports from a single dataset load")
+    parser.add_argument("--input", type=str, default=str(WITH_SENT_CSV))
+    parser.add_argument("--reports", type=str, nargs="+", choices=list(REPORTS), default=None)
+    src = parser.add_mutually_exclusive_group()
+    src.add_argument("--from_cube", action="store_true", help="build tables from the aggregate cube")
+    src.add_argument("--streaming", action="store_true", help="build tables in one chunked pass (no row load)")
+    src.add_argument("--sample", type=int, default=None, metavar="K",
+                     help="stratified sample, at most K rows per domain × video × month; weighted tables + CIs")
+    parser.add_argument("--mmap_text", action="store_true", help="keep clean_text memory-mapped, not in the frame")
+    args = parser.parse_args(argv)
+    start_run("analysis")
+    run_reports(args.reports, args.input, args.from_cube, args.streaming, args.mmap_text, args.sample)
+
+
+if __name__ == "__main__":
+    main()
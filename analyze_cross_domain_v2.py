@@ -2,80 +2,97 @@
 # Cross-domain comparison: sentiment proportions, extreme rates, engagement metrics, chi-square test.
 # Input: settings.WITH_SENT_CSV
 # Output figs: figures_v2/cross_domain/*.png
+# Also runs as a report module of analysis_engine_v2 (run(df, agg)).
+# Every figure is drawn from the shared aggregate tables (no raw-row seaborn calls), so this report
+# also runs from the aggregate cube (analysis_engine_v2 --from_cube) or from one chunked pass over
+# the CSV (--streaming, streaming_stats_v2) when the comments do not fit in memory.
 
 from settings import WITH_SENT_CSV, FIG_DIR
-import os
-import pandas as pd
+from pathlib import Path
 import matplotlib.pyplot as plt
 import seaborn as sns
 import scipy.stats as stats
 
+from plot_summaries_v2 import bar_from_means
+
 INPUT_CSV = WITH_SENT_CSV
 OUTPUT_DIR = FIG_DIR / "cross_domain"
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-sns.set(style="whitegrid", font_scale=1.05)
-
-df = pd.read_csv(INPUT_CSV)
-df["clean_text"] = df["clean_text"].astype(str).fillna("")
-if "comment_length" not in df.columns:
-    df["comment_length"] = df["clean_text"].str.len()
-if "like_count" in df.columns:
-    df["like_count"] = pd.to_numeric(df["like_count"], errors="coerce").fillna(0)
-
-# 1) Sentiment proportion by domain (normalized)
-prop = pd.crosstab(df["domain"], df["sentiment"], normalize="index")
-print("\nSentiment proportion by domain:\n", prop.round(3))
-
-plt.figure(figsize=(8,5))
-prop.reindex(index=sorted(prop.index)).plot(kind="bar", stacked=True, colormap="RdYlGn", figsize=(9,5))
-plt.title("Sentiment Proportions by Domain")
-plt.ylabel("Proportion")
-plt.tight_layout()
-plt.savefig(OUTPUT_DIR / "sentiment_proportion_by_domain.png", dpi=200)
-plt.close()
-
-# 2) Extreme sentiment rate (>0.9 on either pos or neg)
-has_probs = {"prob_positive","prob_negative"}.issubset(df.columns)
-if has_probs:
-    df["extreme"] = ((df["prob_positive"]>0.9) | (df["prob_negative"]>0.9)).astype(int)
-    extreme_prop = df.groupby("domain")["extreme"].mean().sort_values(ascending=False)
-    print("\nExtreme sentiment rate by domain:\n", extreme_prop.round(3))
-
-    plt.figure(figsize=(7,4))
-    extreme_prop.plot(kind="bar", color="#8e44ad")
-    plt.title("Extreme Sentiment Rate (>0.9)")
+NEEDS_ROWS = False
+
+
+def run(df, agg, fig_dir=OUTPUT_DIR):
+    fig_dir = Path(fig_dir)
+    fig_dir.mkdir(parents=True, exist_ok=True)
+    sns.set(style="whitegrid", font_scale=1.05)
+
+    # 1) Sentiment proportion by domain (normalized)
+    prop = agg.proportions
+    print("\nSentiment proportion by domain:\n", prop.round(3))
+
+    plt.figure(figsize=(8,5))
+    prop.reindex(index=sorted(prop.index)).plot(kind="bar", stacked=True, colormap="RdYlGn", figsize=(9,5))
+    plt.title("Sentiment Proportions by Domain")
     plt.ylabel("Proportion")
     plt.tight_layout()
-    plt.savefig(OUTPUT_DIR / "extreme_sentiment_by_domain.png", dpi=200)
-    plt.close()
+    plt.savefig(fig_dir / "sentiment_proportion_by_domain.png", dpi=200)
+    plt.close("all")
+
+    # 2) Extreme sentiment rate (>0.9 on either pos or neg)
+    if agg.has_probs:
+        extreme_prop = agg.extreme_rate.sort_values(ascending=False)
+        print("\nExtreme sentiment rate by domain:\n", extreme_prop.round(3))
+
+        plt.figure(figsize=(7,4))
+        extreme_prop.plot(kind="bar", color="#8e44ad")
+        plt.title("Extreme Sentiment Rate (>0.9)")
+        plt.ylabel("Proportion")
+        plt.tight_layout()
+        plt.savefig(fig_dir / "extreme_sentiment_by_domain.png", dpi=200)
+        plt.close()
+
+    # 3) Engagement metrics by domain × sentiment
+    order = ["negative","neutral","positive"]
+    means = agg.means
+    if "like_count" in means.columns:
+        plt.figure(figsize=(10,6))
+        bar_from_means(means, "domain", "sentiment", "like_count", order=agg.domains, hue_order=order)
+        plt.yscale("log")
+        plt.title("Average Like Count by Domain & Sentiment (log scale)")
+        plt.tight_layout()
+        plt.savefig(fig_dir / "likecount_by_domain_sentiment.png", dpi=200)
+        plt.close()
 
-# 3) Engagement metrics by domain × sentiment
-order = ["negative","neutral","positive"]
-if "like_count" in df.columns:
     plt.figure(figsize=(10,6))
-    sns.barplot(data=df, x="domain", y="like_count", hue="sentiment", order=sorted(df["domain"].unique()), hue_order=order, ci=None)
-    plt.yscale("log")
-    plt.title("Average Like Count by Domain & Sentiment (log scale)")
+    bar_from_means(means, "domain", "sentiment", "comment_length", order=agg.domains, hue_order=order)
+    plt.title("Average Comment Length by Domain & Sentiment")
     plt.tight_layout()
-    plt.savefig(OUTPUT_DIR / "likecount_by_domain_sentiment.png", dpi=200)
+    plt.savefig(fig_dir / "length_by_domain_sentiment.png", dpi=200)
     plt.close()
 
-plt.figure(figsize=(10,6))
-sns.barplot(data=df, x="domain", y="comment_length", hue="sentiment", order=sorted(df["domain"].unique()), hue_order=order, ci=None)
-plt.title("Average Comment Length by Domain & Sentiment")
-plt.tight_layout()
-plt.savefig(OUTPUT_DIR / "length_by_domain_sentiment.png", dpi=200)
-plt.close()
-
-# 4) Chi-square test (domain vs sentiment)
-tab = pd.crosstab(df["domain"], df["sentiment"])
-chi2, p, dof, exp = stats.chi2_contingency(tab)
-print("\nChi-square test (domain × sentiment):")
-print(f"Chi²={chi2:.2f}, dof={dof}, p-value={p:.3e}")
-if p < 0.05:
-    print("Conclusion: sentiment distribution differs significantly across domains.")
-else:
-    print("Conclusion: no significant difference across domains.")
-
-print(f"\nDone. Figures → {OUTPUT_DIR}")
+    # 4) Chi-square test (domain vs sentiment)
+    tab = agg.counts.loc[:, agg.counts.sum(axis=0) > 0]
+    chi2, p, dof, exp = stats.chi2_contingency(tab)
+    print("\nChi-square test (domain × sentiment):")
+    print(f"Chi²={chi2:.2f}, dof={dof}, p-value={p:.3e}")
+    if p < 0.05:
+        print("Conclusion: sentiment distribution differs significantly across domains.")
+    else:
+        print("Conclusion: no significant difference across domains.")
+
+    print(f"\nDone. Figures → {fig_dir}")
+
+
+if __name__ == "__main__":
+    import sys
+    from analysis_engine_v2 import Aggregates, load_dataset
+    if "--from_cube" in sys.argv:
+        from aggregate_cube_v2 import require_cube
+        run(None, Aggregates(cube=require_cube()))
+    elif "--streaming" in sys.argv:
+        from streaming_stats_v2 import StreamingAggregates
+        run(None, StreamingAggregates.from_path(INPUT_CSV))
+    else:
+        df = load_dataset(INPUT_CSV)
+        run(df, Aggregates(df))
@@ -2,13 +2,19 @@
 # Domain-level profiling: sentiment mix, confidence, likes/length by sentiment, and top keywords.
 # Input: settings.WITH_SENT_CSV (data2/processed/all_domains_with_sentiment.csv)
 # Output figs: figures_v2/domain_profiles/*.png
+# Also runs as a report module of analysis_engine_v2 (run(df, agg)).
+# Figures are rendered as independent jobs across a process pool (figure_jobs_v2); a figure whose
+# input data is unchanged since the last render is skipped. Jobs carry pre-aggregated summaries
+# (histogram counts, box statistics) rather than raw rows (plot_summaries_v2).
 
 from settings import WITH_SENT_CSV, FIG_DIR
-import os, re
-import pandas as pd
+from pathlib import Path
 import matplotlib.pyplot as plt
 import seaborn as sns
-from collections import Counter
+
+from figure_jobs_v2 import FigureJob, render_jobs
+from keyword_stats_v2 import METHODS as KEYWORD_METHODS, KeywordStats
+from plot_summaries_v2 import box_stats, boxplot_from_stats, hist_counts, hist_from_counts
 
 # Optional wordcloud; if missing, just skip this feature
 try:
@@ -21,85 +27,114 @@ INPUT_CSV = WITH_SENT_CSV
 OUTPUT_DIR = FIG_DIR / "domain_profiles"
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-sns.set(style="whitegrid", font_scale=1.05)
-
-# ---- Load data
-df = pd.read_csv(INPUT_CSV)
-df["clean_text"] = df["clean_text"].astype(str).fillna("")
-# Ensure required columns exist
-if "comment_length" not in df.columns:
-    df["comment_length"] = df["clean_text"].str.len()
-if "like_count" in df.columns:
-    df["like_count"] = pd.to_numeric(df["like_count"], errors="coerce").fillna(0)
+ORDER = ["negative","neutral","positive"]
 
-# ---- Helper for top keywords
-STOP = set("""the and is it to a of for in on with this that was are be you your from have not but can just when how why what who which its they them as at if so do we're i'm i've it's don't can't""".split())
 
-def top_words(texts, k=15):
-    allw = []
-    for t in texts:
-        ws = re.findall(r"[A-Za-z']+", str(t).lower())
-        allw.extend(w for w in ws if w not in STOP and len(w) > 2)
-    return Counter(allw).most_common(k)
+def _style():
+    sns.set(style="whitegrid", font_scale=1.05)
 
-domains = list(df["domain"].dropna().unique())
 
-for dom in domains:
-    sub = df[df["domain"] == dom].copy()
-    print(f"\n=== {dom.upper()} ===  n={len(sub)}")
-
-    # 1) Sentiment distribution
+# ---- Renderers (module-level so figure jobs can run them in worker processes)
+def plot_sentiment_bar(path, dom, counts):
+    _style()
     plt.figure(figsize=(6,4))
-    order = ["negative","neutral","positive"]
-    counts = sub["sentiment"].value_counts().reindex(order)
     counts.plot(kind="bar", color=["#E74C3C","#F1C40F","#2ECC71"])
     plt.title(f"Sentiment Distribution - {dom}")
     plt.ylabel("Count")
     plt.tight_layout()
-    plt.savefig(OUTPUT_DIR / f"{dom}_sentiment_bar.png", dpi=200)
-    plt.close()
-
-    # 2) Confidence hist (positive/negative)
-    if {"prob_positive","prob_negative"}.issubset(sub.columns):
-        plt.figure(figsize=(6,4))
-        sns.histplot(sub["prob_positive"], bins=30, label="Positive prob", alpha=0.6)
-        sns.histplot(sub["prob_negative"], bins=30, label="Negative prob", alpha=0.6)
-        plt.title(f"Sentiment Confidence - {dom}")
-        plt.xlabel("Probability")
-        plt.legend()
-        plt.tight_layout()
-        plt.savefig(OUTPUT_DIR / f"{dom}_confidence_hist.png", dpi=200)
-        plt.close()
-
-    # 3) Likes × Sentiment (log y)
-    if "like_count" in sub.columns:
-        plt.figure(figsize=(7,4))
-        sns.boxplot(data=sub, x="sentiment", y="like_count", order=order)
-        plt.yscale("log")
-        plt.title(f"Like Count by Sentiment (log) - {dom}")
-        plt.tight_layout()
-        plt.savefig(OUTPUT_DIR / f"{dom}_likes_by_sentiment.png", dpi=200)
-        plt.close()
+    plt.savefig(path, dpi=200)
 
-    # 4) Length × Sentiment
+def plot_confidence_hist(path, dom, edges, pos_counts, neg_counts):
+    _style()
+    plt.figure(figsize=(6,4))
+    hist_from_counts(pos_counts, edges, label="Positive prob")
+    hist_from_counts(neg_counts, edges, label="Negative prob")
+    plt.title(f"Sentiment Confidence - {dom}")
+    plt.xlabel("Probability")
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig(path, dpi=200)
+
+def plot_box_by_sentiment(path, title, column, stats, log=False):
+    _style()
     plt.figure(figsize=(7,4))
-    sns.boxplot(data=sub, x="sentiment", y="comment_length", order=order)
-    plt.title(f"Comment Length by Sentiment - {dom}")
+    boxplot_from_stats(stats, ORDER, ylabel=column)
+    plt.xlabel("sentiment")
+    if log:
+        plt.yscale("log")
+    plt.title(title)
     plt.tight_layout()
-    plt.savefig(OUTPUT_DIR / f"{dom}_length_by_sentiment.png", dpi=200)
-    plt.close()
-
-    # 5) Top keywords (pos/neg) + optional wordclouds
-    pos_kw = top_words(sub[sub["sentiment"]=="positive"]["clean_text"], k=15)
-    neg_kw = top_words(sub[sub["sentiment"]=="negative"]["clean_text"], k=15)
-    print("Top positive keywords:", pos_kw[:10])
-    print("Top negative keywords:", pos_kw[:10])
-
-    if HAS_WC:
-        for sent, kws, cmap in [("positive", pos_kw, "Greens"), ("negative", neg_kw, "Reds")]:
-            if kws:
-                wc = WordCloud(width=900, height=600, background_color="white", colormap=cmap)
-                wc.generate_from_frequencies({w:c for w,c in kws})
-                wc.to_file(str(OUTPUT_DIR / f"{dom}_{sent}_wordcloud.png"))
-
-print(f"\nDone. Figures → {OUTPUT_DIR}")
+    plt.savefig(path, dpi=200)
+
+def plot_wordcloud(path, freqs, cmap):
+    wc = WordCloud(width=900, height=600, background_color="white", colormap=cmap)
+    wc.generate_from_frequencies(freqs)
+    wc.to_file(str(path))
+
+
+def build_jobs(df, agg, keywords="frequency", fig_dir=OUTPUT_DIR):
+    """One FigureJob per output file in fig_dir, each carrying only the data its figure needs.
+    keywords: ranking for the top-keyword printout / wordclouds (see keyword_stats_v2)."""
+    fig_dir = Path(fig_dir)
+    kw = KeywordStats.build(df)   # tokenized once for every domain × sentiment
+    jobs = []
+    for dom, sub in df.groupby("domain", observed=True):
+        print(f"\n=== {dom.upper()} ===  n={len(sub)}")
+
+        # 1) Sentiment distribution
+        jobs.append(FigureJob(fig_dir / f"{dom}_sentiment_bar.png", plot_sentiment_bar,
+                              {"dom": dom, "counts": agg.counts.loc[dom].reindex(ORDER)}))
+
+        # 2) Confidence hist (positive/negative)
+        if {"prob_positive","prob_negative"}.issubset(sub.columns):
+            pos_counts, edges = hist_counts(sub["prob_positive"], bins=30)
+            neg_counts, _ = hist_counts(sub["prob_negative"], bins=30)
+            jobs.append(FigureJob(fig_dir / f"{dom}_confidence_hist.png", plot_confidence_hist,
+                                  {"dom": dom, "edges": edges, "pos_counts": pos_counts, "neg_counts": neg_counts}))
+
+        # 3) Likes × Sentiment (log y)
+        if "like_count" in sub.columns:
+            jobs.append(FigureJob(fig_dir / f"{dom}_likes_by_sentiment.png", plot_box_by_sentiment,
+                                  {"title": f"Like Count by Sentiment (log) - {dom}", "column": "like_count",
+                                   "stats": box_stats(sub, "like_count", "sentiment"),
+                                   "log": True}))
+
+        # 4) Length × Sentiment
+        jobs.append(FigureJob(fig_dir / f"{dom}_length_by_sentiment.png", plot_box_by_sentiment,
+                              {"title": f"Comment Length by Sentiment - {dom}", "column": "comment_length",
+                               "stats": box_stats(sub, "comment_length", "sentiment")}))
+
+        # 5) Top keywords (pos/neg) + optional wordclouds
+        pos_kw = kw.top((dom, "positive"), k=15, method=keywords)
+        neg_kw = kw.top((dom, "negative"), k=15, method=keywords)
+        print("Top positive keywords:", pos_kw[:10])
+        print("Top negative keywords:", neg_kw[:10])
+
+        if HAS_WC:
+            for sent, kws, cmap in [("positive", pos_kw, "Greens"), ("negative", neg_kw, "Reds")]:
+                if kws:
+                    jobs.append(FigureJob(fig_dir / f"{dom}_{sent}_wordcloud.png", plot_wordcloud,
+                                          {"freqs": kw.wordcloud_freqs((dom, sent), k=15, method=keywords),
+                                           "cmap": cmap}))
+    return jobs
+
+
+def run(df, agg, workers=None, force=False, keywords="frequency", fig_dir=OUTPUT_DIR):
+    Path(fig_dir).mkdir(parents=True, exist_ok=True)
+    jobs = build_jobs(df, agg, keywords, fig_dir)
+    rendered, skipped = render_jobs(jobs, workers=workers, force=force)
+    print(f"\nDone. Figures → {fig_dir} ({rendered} rendered, {skipped} unchanged)")
+
+
+if __name__ == "__main__":
+    import argparse
+    from analysis_engine_v2 import Aggregates, load_dataset
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=None, help="render processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="re-render even if inputs are unchanged")
+    parser.add_argument("--keywords", type=str, default="frequency", choices=KEYWORD_METHODS,
+                        help="keyword ranking: frequency / tfidf / log_odds (distinctive words)")
+    args = parser.parse_args()
+    df = load_dataset(INPUT_CSV)
+    run(df, Aggregates(df), workers=args.workers, force=args.force, keywords=args.keywords)
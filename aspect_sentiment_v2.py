@@ -0,0 +1,350 @@
+# aspect_sentiment_v2.py
+# Aspect-based sentiment: what the comments say about fit / comfort (sneaker), side effects (pharma),
+# taste / price (food), performance / bugs (steam), ... instead of one label per comment.
+#   lexicons   ASPECTS[domain][aspect] = terms. "word*" is a prefix and spaces match any whitespace.
+#              All terms of a domain compile into ONE alternation with a named group per aspect,
+#              so each sentence is scanned once whatever the number of aspects.
+#   matching   comments → sentences (vectorized str.findall). A vectorized str.contains on the
+#              combined pattern filters the sentences, and only the hits go through finditer to
+#              name the aspects. The window is the matched sentence, cut to WINDOW_CHARS around
+#              the first match when the sentence is longer.
+#   scoring    windows go through SentimentModel.score_texts in batches. A window equal to the
+#              whole comment reuses the comment's score from the input (no second model call) when
+#              the input's meta.json records the same (model, max_len, backend) config.
+#              Identical windows are scored once, and scores persist in ASPECT_DIR/window_scores.npz
+#              keyed by text hash, for one (model, max_len, backend) config, so reruns only score new text.
+#   streaming  the CSV is read in chunks. Mentions are appended to the output and aggregates
+#              summed per chunk, so memory stays at one chunk plus the score cache.
+# Output (RESULTS_DIR/aspects/):
+#   aspect_mentions.csv   comment_id, domain, aspect, sentence_no, window, source, sentiment, probs, like_count
+#   aspect_summary.csv    domain × aspect: mentions, comments mentioning, mention rate, sentiment
+#                         counts and shares, net (positive - negative share), likes on negative mentions
+# Usage:
+#     python aspect_sentiment_v2.py
+#     python aspect_sentiment_v2.py --domain steam --show
+
+from settings import RESULTS_DIR, WITH_SENT_CSV
+import argparse, json, re, time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from bert_sentiment_inference_v2 import (BACKENDS, BATCH_SIZE, MAX_LEN, MODEL_NAME, get_model, load_meta,
+                                         probs_to_frame, scoring_config)
+from dataset_v2 import SENTIMENT_ORDER
+from pipeline_metrics_v2 import stage, start_run
+
+ASPECT_DIR = RESULTS_DIR / "aspects"
+MENTIONS_CSV = ASPECT_DIR / "aspect_mentions.csv"
+SUMMARY_CSV = ASPECT_DIR / "aspect_summary.csv"
+SCORES_FILE = ASPECT_DIR / "window_scores.npz"
+CHUNK_ROWS = 100_000
+WINDOW_CHARS = 300
+SENT_PAT = r"[^.!?\n]+[.!?]*"
+PROB_COLS = ["prob_negative", "prob_neutral", "prob_positive"]      # model order
+
+ASPECTS = {
+    "sneaker": {
+        "fit": ["fit*", "sizing", "size*", "true to size", "tts", "narrow", "wide", "snug", "tight", "loose",
+                "half size", "toe box"],
+        "comfort": ["comfort*", "cushion*", "insole*", "arch support", "soft", "plush", "foam", "blister*",
+                    "heel slip*", "hurt*", "pain*"],
+        "durability": ["durab*", "fall apart", "fell apart", "falling apart", "lasted", "lasting", "last long",
+                       "wear out", "wore out", "crease*", "creasing", "sole separation", "quality"],
+        "price": ["price*", "pricing", "expensive", "cheap*", "overpriced", "worth", "resell*", "resale",
+                  "retail", "afford*", r"\$\d+"],
+        "style": ["look*", "colorway*", "colourway*", "design*", "style*", "ugly", "aesthetic*", "clean"],
+        "performance": ["grip", "traction", "responsive*", "bounce", "stability", "stable", "energy return",
+                        "speed", "pace"],
+    },
+    "pharma": {
+        "side_effects": ["side effect*", "nause*", "dizz*", "headache*", "drows*", "insomnia", "rash*",
+                         "allerg*", "reaction*", "withdrawal*", "weight gain", "tired*", "fatigue"],
+        "efficacy": ["works", "worked", "working", "effective*", "relie*", "helped", "helps", "cured", "symptom*",
+                     "no difference", "useless", "kicked in"],
+        "dosage": ["dose*", "dosage*", "mg", "pill*", "tablet*", "capsule*", "twice a day", "once a day"],
+        "price": ["price*", "cost*", "expensive", "cheap*", "insurance", "generic*", "afford*", "copay",
+                  r"\$\d+"],
+        "safety": ["safe*", "risk*", "danger*", "fda", "addict*", "overdose*", "toxic", "liver", "kidney*"],
+    },
+    "food": {
+        "taste": ["taste*", "tasty", "tasting", "flavo*", "delicious", "bland", "salty", "sweet", "spicy",
+                  "season*", "yummy", "gross", "disgusting"],
+        "price": ["price*", "pricing", "expensive", "cheap*", "overpriced", "worth", "value", "dollar*",
+                  "afford*", r"\$\d+"],
+        "portion": ["portion*", "serving*", "huge", "tiny", "small", "filling", "size*"],
+        "service": ["service", "staff", "wait*", "waiter*", "waitress*", "rude", "friendly", "drive thru",
+                    "drive through", "employee*"],
+        "quality": ["fresh", "stale", "quality", "soggy", "crisp*", "undercooked", "overcooked", "cold",
+                    "greasy", "raw", "burnt"],
+    },
+    "steam": {
+        "performance": ["fps", "frame*", "perform*", "optimi*", "stutter*", "lag*", "runs", "smooth*",
+                        "gpu", "cpu", "ram", "vram", "loading", "load times"],
+        "bugs": ["bug*", "glitch*", "crash*", "broken", "patch*", "fix*", "unplayable", "softlock*"],
+        "gameplay": ["gameplay", "mechanic*", "combat", "control*", "boss*", "difficult*", "story",
+                     "level*", "quest*", "puzzle*"],
+        "graphics": ["graphic*", "visual*", "texture*", "lighting", "ray tracing", "resolution", "4k",
+                     "art style", "animation*"],
+        "price": ["price*", "pricing", "expensive", "cheap*", "worth", "sale", "refund*", "full price",
+                  "overpriced", "free", r"\$\d+"],
+        "content": ["content", "hours", "dlc", "length", "replay*", "multiplayer", "co-op", "coop",
+                    "endgame", "update*"],
+    },
+}
+
+
+def _term(t):
+    """'side effect*' → r'side\\s+effect\\w*' (regex terms containing a backslash are kept)."""
+    if "\\" in t:
+        return t
+    t = re.escape(t.rstrip("*")) + (r"\w*" if t.endswith("*") else "")
+    return t.replace(r"\ ", r"\s+")
+
+
+def compile_lexicon(aspects, named=True):
+    """One case-insensitive pattern, a named group per aspect (m.lastgroup names the aspect).
+    named=False gives the same alternation without groups, for the vectorized str.contains filter."""
+    parts = [f"(?{f'P<{a}>' if named else ':'}{'|'.join(_term(t) for t in sorted(terms, key=len, reverse=True))})"
+             for a, terms in aspects.items()]
+    return re.compile(r"(?<!\w)(?:" + "|".join(parts) + r")(?!\w)", re.IGNORECASE)
+
+
+MATCHERS = {d: compile_lexicon(a) for d, a in ASPECTS.items()}
+FILTERS = {d: compile_lexicon(a, named=False) for d, a in ASPECTS.items()}
+
+
+def _window(sentence, start, end):
+    if len(sentence) <= WINDOW_CHARS:
+        return sentence
+    half = (WINDOW_CHARS - (end - start)) // 2
+    lo = max(0, min(start - half, len(sentence) - WINDOW_CHARS))
+    return sentence[lo:lo + WINDOW_CHARS].strip()
+
+
+def find_mentions(chunk):
+    """→ one row per (comment, sentence, aspect): row position in chunk (a RangeIndex), sentence_no,
+    aspect, window, whole (window is the entire comment)."""
+    out = []
+    for domain, part in chunk.groupby("domain", sort=False):
+        matcher = MATCHERS.get(domain)
+        if matcher is None:
+            continue
+        sents = part["clean_text"].str.findall(SENT_PAT).explode().dropna().str.strip()
+        sents = sents[sents.str.len() > 0]
+        if sents.empty:
+            continue
+        frame = pd.DataFrame({"pos": sents.index.to_numpy(), "sentence": sents.to_numpy()})
+        frame["sentence_no"] = frame.groupby("pos").cumcount()
+        hit = frame[frame["sentence"].str.contains(FILTERS[domain], regex=True)]
+        for pos, no, s in zip(hit["pos"], hit["sentence_no"], hit["sentence"]):
+            first = {}
+            for m in matcher.finditer(s):
+                first.setdefault(m.lastgroup, m.span())
+            out.extend((pos, no, domain, aspect, _window(s, a, b)) for aspect, (a, b) in first.items())
+    out = pd.DataFrame(out, columns=["pos", "sentence_no", "domain", "aspect", "window"])
+    out["whole"] = out["window"].to_numpy() == chunk["clean_text"].str.strip().to_numpy()[out["pos"]]
+    return out
+
+
+class WindowScores:
+    """Persistent window text hash → (negative, neutral, positive) probs for one scoring config
+    (bert_sentiment_inference_v2.scoring_config: model, max_len, backend). Scores stored under any
+    other config are dropped, since truncation length and backend change the probabilities."""
+
+    def __init__(self, config, path=SCORES_FILE):
+        self.config, self.path = json.dumps(config, sort_keys=True), Path(path)
+        self.keys, self.probs = np.zeros(0, np.uint64), np.zeros((0, 3), np.float32)
+        if self.path.exists():
+            z = np.load(self.path)
+            if "config" in z.files and str(z["config"]) == self.config:
+                self.keys, self.probs = z["keys"], z["probs"]
+        self._index = pd.Index(self.keys)
+        self.n_new = 0
+
+    @staticmethod
+    def hash(texts):
+        return pd.util.hash_array(np.asarray(texts, dtype=object))
+
+    def lookup(self, texts):
+        """→ (probs for texts, row mask of misses)."""
+        idx = self._index.get_indexer(self.hash(texts))
+        probs = np.zeros((len(texts), 3), np.float32)
+        hit = idx >= 0
+        probs[hit] = self.probs[idx[hit]]
+        return probs, ~hit
+
+    def add(self, texts, probs):
+        self.keys = np.concatenate([self.keys, self.hash(texts)])
+        self.probs = np.concatenate([self.probs, np.asarray(probs, np.float32)])
+        self._index = pd.Index(self.keys)
+        self.n_new += len(texts)
+
+    def save(self):
+        if not self.n_new:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(self.path, keys=self.keys, probs=self.probs, config=np.array(self.config))
+
+
+class _LazyModel:
+    """Loads the sentiment model on the first window that misses the cache."""
+
+    def __init__(self, model_name, max_len, backend):
+        self.args = (model_name, max_len)
+        self.backend = backend
+
+    def score_texts(self, texts, batch_size=BATCH_SIZE):
+        return get_model(*self.args, backend=self.backend).score_texts(texts, batch_size)
+
+
+def score_mentions(chunk, mentions, cache, model, batch_size=BATCH_SIZE, reuse=True):
+    """Sentiment columns for each mention; only windows not seen before reach the model."""
+    probs = np.zeros((len(mentions), 3), np.float32)
+    source = np.full(len(mentions), "window", dtype=object)
+    todo = np.ones(len(mentions), dtype=bool)
+    if reuse and set(PROB_COLS).issubset(chunk.columns):
+        comment = chunk[PROB_COLS].to_numpy(dtype=np.float32)[mentions["pos"].to_numpy()]
+        whole = mentions["whole"].to_numpy() & ~np.isnan(comment).any(axis=1)
+        probs[whole], source[whole], todo[whole] = comment[whole], "comment", False
+    windows = mentions["window"].to_numpy(dtype=object)
+    if todo.any():
+        cached, miss = cache.lookup(windows[todo])
+        sel = np.flatnonzero(todo)
+        probs[sel] = cached
+        if miss.any():
+            new = pd.unique(windows[sel[miss]])
+            scored = model.score_texts(list(new), batch_size)
+            new_probs = scored[PROB_COLS].to_numpy(dtype=np.float32)
+            cache.add(new, new_probs)
+            lut = pd.Index(new).get_indexer(windows[sel[miss]])
+            probs[sel[miss]] = new_probs[lut]
+    out = probs_to_frame(probs)
+    out["source"] = source
+    return out
+
+
+class AspectSummary:
+    """Per-chunk sums of mentions / comments / likes per domain × aspect × sentiment."""
+
+    def __init__(self):
+        self.mentions = None
+        self.comments = None
+        self.domain_rows = pd.Series(dtype="int64")
+
+    def update(self, chunk, m):
+        self.domain_rows = self.domain_rows.add(chunk["domain"].value_counts(), fill_value=0)
+        if m.empty:
+            return
+        m = m.assign(n=1, neg_likes=np.where(m["sentiment"] == "negative", m["like_count"], 0))
+        part = m.groupby(["domain", "aspect", "sentiment"])[["n", "like_count", "neg_likes",
+                                                             "prob_positive", "prob_negative"]].sum()
+        self.mentions = part if self.mentions is None else self.mentions.add(part, fill_value=0)
+        per_comment = m.drop_duplicates(["pos", "aspect"]).groupby(["domain", "aspect"]).size()
+        self.comments = per_comment if self.comments is None else self.comments.add(per_comment, fill_value=0)
+
+    def table(self):
+        if self.mentions is None:
+            return pd.DataFrame()
+        counts = self.mentions["n"].unstack("sentiment", fill_value=0).reindex(columns=SENTIMENT_ORDER, fill_value=0)
+        sums = self.mentions.groupby(level=["domain", "aspect"]).sum()
+        t = pd.DataFrame({"mentions": counts.sum(axis=1).astype(int),
+                          "comments": self.comments.reindex(counts.index).fillna(0).astype(int)})
+        t["mention_rate"] = t["comments"] / self.domain_rows.reindex(t.index.get_level_values("domain")).to_numpy()
+        for s in SENTIMENT_ORDER:
+            t[s] = counts[s].astype(int)
+        for s in SENTIMENT_ORDER:
+            t[f"share_{s}"] = counts[s] / t["mentions"]
+        t["net"] = t["share_positive"] - t["share_negative"]
+        t["mean_prob_negative"] = sums["prob_negative"] / t["mentions"]
+        t["like_sum"] = sums["like_count"]
+        t["negative_like_share"] = (sums["neg_likes"] / sums["like_count"].where(sums["like_count"] > 0)).fillna(0)
+        return t.reset_index().sort_values(["domain", "mentions"], ascending=[True, False]).reset_index(drop=True)
+
+
+def run(input_csv=WITH_SENT_CSV, domain=None, batch_size=BATCH_SIZE, model_name=MODEL_NAME,
+        max_len=MAX_LEN, backend="torch", reuse=True, chunksize=CHUNK_ROWS):
+    """Stream input_csv → aspect_mentions.csv + aspect_summary.csv. Returns the summary table."""
+    ASPECT_DIR.mkdir(parents=True, exist_ok=True)
+    config = scoring_config(model_name, max_len, backend)
+    cache = WindowScores(config)
+    model = _LazyModel(model_name, max_len, backend)
+    if reuse and load_meta(input_csv)["config"] != config:
+        print(f"[aspects] {input_csv} was scored with another config; rescoring whole-comment windows")
+        reuse = False
+    summary, header, n_rows, n_mentions = AspectSummary(), True, 0, 0
+    tmp = MENTIONS_CSV.with_suffix(".tmp")
+    usecols = {"comment_id", "domain", "clean_text", "like_count", *PROB_COLS}
+    for chunk in pd.read_csv(input_csv, chunksize=chunksize, usecols=lambda c: c in usecols,
+                             dtype={"comment_id": str}):
+        chunk = chunk.dropna(subset=["domain"])
+        if domain:
+            chunk = chunk[chunk["domain"] == domain]
+        chunk = chunk.reset_index(drop=True)
+        chunk["clean_text"] = chunk["clean_text"].fillna("").astype(str)
+        n_rows += len(chunk)
+        with stage("aspects_match", rows_in=len(chunk)) as st:
+            m = find_mentions(chunk)
+            st.rows_out = len(m)
+        if len(m):
+            with stage("aspects_score", rows_in=len(m)) as st:
+                scores = score_mentions(chunk, m, cache, model, batch_size, reuse)
+                st.rows_out = int((scores["source"] == "window").sum())
+            likes = pd.to_numeric(chunk.get("like_count", 0), errors="coerce")
+            m = pd.concat([m, scores], axis=1)
+            m["comment_id"] = chunk["comment_id"].to_numpy()[m["pos"]]
+            m["like_count"] = np.broadcast_to(np.nan_to_num(likes), len(chunk))[m["pos"]]
+            cols = ["comment_id", "domain", "aspect", "sentence_no", "window", "source", "sentiment",
+                    "prob_positive", "prob_neutral", "prob_negative", "like_count"]
+            m[cols].round(4).to_csv(tmp, mode="w" if header else "a", header=header, index=False)
+            header = False
+            n_mentions += len(m)
+        summary.update(chunk, m)
+    cache.save()
+    if header:
+        pd.DataFrame(columns=["comment_id", "domain", "aspect"]).to_csv(tmp, index=False)
+    tmp.replace(MENTIONS_CSV)
+    table = summary.table()
+    table.to_csv(SUMMARY_CSV, index=False)
+    print(f"{n_rows} comments → {n_mentions} aspect mentions ({cache.n_new} windows scored by the model)")
+    print(f"Saved → {MENTIONS_CSV}, {SUMMARY_CSV}")
+    return table
+
+
+def show(table, domain=None):
+    if domain:
+        table = table[table["domain"] == domain]
+    cols = ["domain", "aspect", "mentions", "mention_rate", "share_negative", "share_neutral", "share_positive",
+            "net", "negative_like_share"]
+    print(table[cols].round(3).to_string(index=False) if len(table) else "No aspect mentions.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aspect-based sentiment per domain")
+    parser.add_argument("--input", type=str, default=str(WITH_SENT_CSV))
+    parser.add_argument("--domain", type=str, default=None, choices=list(ASPECTS.keys()))
+    parser.add_argument("--batch_size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--max_len", type=int, default=MAX_LEN)
+    parser.add_argument("--model", type=str, default=MODEL_NAME)
+    parser.add_argument("--backend", type=str, default="torch", choices=BACKENDS)
+    parser.add_argument("--rescore", action="store_true",
+                        help="score single-sentence comments as windows too instead of reusing the comment score")
+    parser.add_argument("--show", action="store_true", help="print the saved summary, no scoring")
+    args = parser.parse_args(argv)
+
+    if args.show:
+        if not SUMMARY_CSV.exists():
+            raise SystemExit(f"No summary at {SUMMARY_CSV}; run without --show first")
+        show(pd.read_csv(SUMMARY_CSV), args.domain)
+        return
+    start_run("aspects")
+    t0 = time.perf_counter()
+    table = run(Path(args.input), args.domain, args.batch_size, args.model, args.max_len, args.backend,
+                reuse=not args.rescore)
+    print(f"Done in {time.perf_counter() - t0:.1f}s\n")
+    show(table, args.domain)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# benchmark_inference_v2.py
+# Benchmark the sentiment stage over a fixed sample of *_clean.csv rows across a grid of
+# batch sizes × MAX_LEN × torch thread counts × backends.
+# Every configuration runs in a fresh process (isolated peak RSS and thread settings) and
+# reports comments/sec, p50/p99 batch latency (tokenize + forward), peak RSS and label
+# agreement with the baseline configuration (torch, BATCH_SIZE, MAX_LEN, default threads).
+# Output: RESULTS_DIR/benchmarks/inference_<timestamp>.csv (+ .json), one row per config.
+# Usage:
+#     python benchmark_inference_v2.py
+#     python benchmark_inference_v2.py --sample 2000 --batch_sizes 8 32 128 --max_lens 64 128 \
+#         --threads 1 4 --backends torch torch-int8
+
+from settings import RESULTS_DIR
+import argparse, itertools, json, multiprocessing as mp, resource, time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from bert_sentiment_inference_v2 import BACKENDS, BATCH_SIZE, MAX_LEN, MODEL_NAME
+
+BENCH_DIR = RESULTS_DIR / "benchmarks"
+SOURCE_DIR = Path("data/processed")      # v1 cleaned CSVs, checked into the repo (data2/ is per-run output)
+SAMPLE_SIZE = 1000
+SAMPLE_SEED = 42
+WARMUP_BATCHES = 2
+
+
+def load_sample(source_dir=SOURCE_DIR, n=SAMPLE_SIZE, seed=SAMPLE_SEED):
+    """Fixed, reproducible sample of clean_text from every *_clean.csv in source_dir."""
+    files = sorted(p for p in Path(source_dir).glob("*_clean.csv"))
+    if not files:
+        raise FileNotFoundError(f"No *_clean.csv files in {source_dir}")
+    texts = pd.concat([pd.read_csv(p, usecols=["clean_text"]) for p in files], ignore_index=True)
+    texts = texts["clean_text"].dropna().astype(str)
+    texts = texts[texts.str.strip().astype(bool)]
+    return texts.sample(n=min(n, len(texts)), random_state=seed).tolist()
+
+
+def _bench_worker(cfg, texts, conn):
+    import torch
+    from bert_sentiment_inference_v2 import SentimentModel, probs_to_frame
+
+    if cfg["threads"]:
+        torch.set_num_threads(cfg["threads"])
+    t_load = time.perf_counter()
+    model = SentimentModel(cfg["model"], cfg["max_len"], backend=cfg["backend"])
+    load_s = time.perf_counter() - t_load
+
+    bs = cfg["batch_size"]
+    chunks = [texts[i:i + bs] for i in range(0, len(texts), bs)]
+    for chunk in chunks[:WARMUP_BATCHES]:
+        model.score_batches([model.tokenize(chunk)])
+
+    lat, probs = [], []
+    t0 = time.perf_counter()
+    for chunk in chunks:
+        tb = time.perf_counter()
+        probs.append(model.score_batches([model.tokenize(chunk)]))
+        lat.append(time.perf_counter() - tb)
+    wall = time.perf_counter() - t0
+
+    conn.send({
+        "load_s": load_s, "wall_s": wall, "latencies": lat,
+        "labels": probs_to_frame(np.concatenate(probs))["sentiment"].tolist(),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,  # KiB on Linux
+        "torch_threads": torch.get_num_threads(),
+    })
+    conn.close()
+
+
+def run_config(cfg, texts):
+    ctx = mp.get_context("spawn")
+    parent, child = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_bench_worker, args=(cfg, texts, child))
+    proc.start()
+    child.close()
+    try:
+        res = parent.recv()
+    except EOFError:
+        res = None
+    proc.join()
+    if res is None:
+        raise RuntimeError(f"benchmark worker failed for {cfg} (exit code {proc.exitcode})")
+    return res
+
+
+def summarize(cfg, res, n_texts, base_labels):
+    lat_ms = np.asarray(res["latencies"]) * 1000.0
+    agree = (np.mean(np.asarray(res["labels"]) == np.asarray(base_labels))
+             if base_labels is not None else 1.0)
+    return {
+        "backend": cfg["backend"], "batch_size": cfg["batch_size"], "max_len": cfg["max_len"],
+        "threads": res["torch_threads"], "n_comments": n_texts,
+        "comments_per_s": round(n_texts / res["wall_s"], 2),
+        "batch_p50_ms": round(float(np.percentile(lat_ms, 50)), 2),
+        "batch_p99_ms": round(float(np.percentile(lat_ms, 99)), 2),
+        "peak_rss_mb": round(res["peak_rss_mb"], 1),
+        "model_load_s": round(res["load_s"], 2),
+        "label_agreement": round(float(agree), 4),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sentiment inference benchmark grid")
+    parser.add_argument("--source_dir", type=str, default=str(SOURCE_DIR))
+    parser.add_argument("--sample", type=int, default=SAMPLE_SIZE)
+    parser.add_argument("--seed", type=int, default=SAMPLE_SEED)
+    parser.add_argument("--model", type=str, default=MODEL_NAME)
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[8, 16, 32, 64, 128])
+    parser.add_argument("--max_lens", type=int, nargs="+", default=[64, 128, 256])
+    parser.add_argument("--threads", type=int, nargs="+", default=[0], help="torch threads; 0 = torch default")
+    parser.add_argument("--backends", type=str, nargs="+", default=["torch"], choices=BACKENDS)
+    parser.add_argument("--out", type=str, default=None)
+    args = parser.parse_args(argv)
+
+    texts = load_sample(args.source_dir, args.sample, args.seed)
+    print(f"Benchmark sample: {len(texts)} comments from {args.source_dir}")
+
+    baseline = {"model": args.model, "backend": "torch", "batch_size": BATCH_SIZE,
+                "max_len": MAX_LEN, "threads": 0}
+    base_res = run_config(baseline, texts)
+    rows = [summarize(baseline, base_res, len(texts), None)]
+    print(rows[-1])
+
+    for backend, threads, max_len, bs in itertools.product(
+            args.backends, args.threads, args.max_lens, args.batch_sizes):
+        cfg = {"model": args.model, "backend": backend, "batch_size": bs,
+               "max_len": max_len, "threads": threads}
+        if cfg == baseline:
+            continue
+        rows.append(summarize(cfg, run_config(cfg, texts), len(texts), base_res["labels"]))
+        print(rows[-1])
+
+    table = pd.DataFrame(rows)
+    out = Path(args.out) if args.out else BENCH_DIR / f"inference_{datetime.now():%Y%m%d_%H%M%S}.csv"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    table.to_csv(out, index=False)
+    with open(out.with_suffix(".json"), "w", encoding="utf-8") as f:
+        json.dump({"sample": len(texts), "seed": args.seed, "source_dir": args.source_dir,
+                   "baseline": baseline, "results": rows}, f, indent=2)
+    print("\n" + table.to_string(index=False))
+    print(f"\nSaved → {out}")
+
+
+if __name__ == "__main__":
+    main()
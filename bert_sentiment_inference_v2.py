@@ -1,49 +1,333 @@
 # bert_sentiment_inference_v2.py
 # Run sentiment inference with RoBERTa and save probabilities/labels.
+# Token ids come from the tokenization pre-pass cache (tokenize_cache_v2.py); on a cold cache
+# tokenization runs in the background while the model scores the first batches.
+#
+# torch/transformers are imported only when a model is actually needed, and by default only
+# texts without a score in WITH_SENT_CSV are sent to the model, so "nothing new" runs return
+# without loading anything.
+# <output>.meta.json records the scoring config (model, max_len, backend, cascade) and the input
+# file signature of the last write. Scores from another config are not reused, and a run returns
+# early only when neither the input nor the config changed (new rows with known texts or
+# refreshed like_count are still merged and written).
+# Rows scored at fetch time (fetch_comments_v2 --score_url, kept through clean/merge) are reused
+# as well when the run uses the default config, the one sentiment_service_v2 serves.
+# Usage:
+#     python bert_sentiment_inference_v2.py               # incremental (score new texts only)
+#     python bert_sentiment_inference_v2.py --full        # rescore everything
+#     python bert_sentiment_inference_v2.py --watch 3600  # long-lived worker, model stays warm
+#     python bert_sentiment_inference_v2.py --sample 10   # quick look: stratified sample only
+#                                                         # → *_sample.csv + 95% CIs (sampling_v2)
+#     python bert_sentiment_inference_v2.py --embeddings  # also keep pooled sentence vectors
+#                                                         # (float16, row-aligned; embeddings_v2)
+# Stage timings / rows / RSS are reported via pipeline_metrics_v2 (PIPELINE_PROFILE=cprofile to profile).
+# API:
+#     from bert_sentiment_inference_v2 import get_model, run
+#     scores = get_model().score_texts(["love it", "trash"])
 
 from settings import MERGED_CSV, WITH_SENT_CSV
+import argparse, json, time
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
-import torch
-from torch.nn.functional import softmax
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+from pipeline_metrics_v2 import stage, start_run
 
 MODEL_NAME = "cardiffnlp/twitter-roberta-base-sentiment-latest"
 BATCH_SIZE = 32
 MAX_LEN = 128
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-
-tok = AutoTokenizer.from_pretrained(MODEL_NAME)
-model = AutoModelForSequenceClassification.from_pretrained(MODEL_NAME).to(DEVICE)
-model.eval()
-
-df = pd.read_csv(MERGED_CSV)
-texts = df["clean_text"].fillna("").astype(str).tolist()
-
-sentiments, ppos, pneu, pneg = [], [], [], []
-for i in range(0, len(texts), BATCH_SIZE):
-    batch = tok(
-        texts[i:i+BATCH_SIZE],
-        padding=True, truncation=True, max_length=MAX_LEN,
-        return_tensors="pt"
-    ).to(DEVICE)
-    with torch.no_grad():
-        logits = model(**batch).logits
-        probs = softmax(logits, dim=1).cpu().numpy()
-    for s in probs:
-        neg, neu, pos = s  # model order: [negative, neutral, positive]
-        if pos >= max(s):
-            label = "positive"
-        elif neg >= max(s):
-            label = "negative"
+SENT_COLS = ["sentiment", "prob_positive", "prob_neutral", "prob_negative"]
+# torch: fp32 eager | torch-int8: dynamic int8 quantization of Linear layers (CPU)
+# torch-bf16: bfloat16 weights/activations
+BACKENDS = ("torch", "torch-int8", "torch-bf16")
+STAGE_COL = "sentiment_stage"   # which model labeled the row: roberta / linear / lexicon (cascade)
+
+
+def probs_to_frame(probs):
+    """(n, 3) softmax rows in model order [negative, neutral, positive] → sentiment columns."""
+    probs = np.asarray(probs, dtype=np.float64).reshape(-1, 3)
+    neg, neu, pos = probs[:, 0], probs[:, 1], probs[:, 2]
+    top = probs.max(axis=1)
+    label = np.where(pos >= top, "positive", np.where(neg >= top, "negative", "neutral"))
+    return pd.DataFrame({"sentiment": label, "prob_positive": pos,
+                         "prob_neutral": neu, "prob_negative": neg})
+
+
+class SentimentModel:
+    """Tokenizer + classifier loaded once; score_texts() can be called repeatedly."""
+
+    def __init__(self, model_name=MODEL_NAME, max_len=MAX_LEN, device=None, backend="torch"):
+        import torch
+        from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend!r}; choose from {BACKENDS}")
+        self.torch = torch
+        self.model_name = model_name
+        self.max_len = max_len
+        self.backend = backend
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.tok = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForSequenceClassification.from_pretrained(model_name)
+        if backend == "torch-int8":
+            self.device = "cpu"  # dynamic quantization kernels are CPU-only
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif backend == "torch-bf16":
+            model = model.to(torch.bfloat16)
+        self.model = model.to(self.device)
+        self.model.eval()
+
+    def score_batches(self, batches, embeddings=None):
+        """Score an iterable of (input_ids, attention_mask) numpy batches → (n, 3) probs.
+        embeddings: optional list that receives one (batch, hidden) float16 array per batch, the
+        attention-masked mean of the last hidden layer (same forward pass, no second model run)."""
+        torch = self.torch
+        out = []
+        with torch.no_grad():
+            for input_ids, attention_mask in batches:
+                mask = torch.from_numpy(attention_mask).to(self.device)
+                res = self.model(
+                    input_ids=torch.from_numpy(input_ids).to(self.device),
+                    attention_mask=mask,
+                    output_hidden_states=embeddings is not None,
+                )
+                out.append(torch.softmax(res.logits.float(), dim=1).cpu().numpy())
+                if embeddings is not None:
+                    hidden, m = res.hidden_states[-1].float(), mask.unsqueeze(-1).float()
+                    pooled = (hidden * m).sum(dim=1) / m.sum(dim=1).clamp(min=1)
+                    embeddings.append(pooled.cpu().numpy().astype(np.float16))
+        return np.concatenate(out) if out else np.zeros((0, 3), dtype=np.float32)
+
+    def tokenize(self, texts):
+        """Tokenize in memory, bypassing the on-disk cache (small ad-hoc batches)."""
+        enc = self.tok(texts, padding=True, truncation=True, max_length=self.max_len, return_tensors="np")
+        return enc["input_ids"].astype(np.int64), enc["attention_mask"].astype(np.int64)
+
+    def score_texts(self, texts, batch_size=BATCH_SIZE, use_cache=True, embeddings=None):
+        """Score a list of strings → DataFrame with SENT_COLS, one row per text.
+        use_cache=False skips the token cache (small online requests of mostly unseen texts).
+        embeddings: optional list, filled with per-batch pooled vectors (see score_batches)."""
+        from tokenize_cache_v2 import stream_batches
+
+        texts = [str(t) for t in texts]
+        if not texts:
+            return probs_to_frame(np.zeros((0, 3)))
+        if use_cache:
+            batches = stream_batches(self.tok, texts, self.model_name, self.max_len, batch_size)
+        else:
+            batches = (self.tokenize(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size))
+        return probs_to_frame(self.score_batches(batches, embeddings))
+
+
+_MODELS = {}
+
+
+def get_model(model_name=MODEL_NAME, max_len=MAX_LEN, device=None, backend="torch"):
+    """Process-wide warm model; repeated calls reuse the already loaded weights."""
+    key = (model_name, max_len, device, backend)
+    if key not in _MODELS:
+        _MODELS[key] = SentimentModel(model_name, max_len, device, backend)
+    return _MODELS[key]
+
+
+def load_texts(path):
+    df = pd.read_csv(path)
+    df["clean_text"] = df["clean_text"].fillna("").astype(str)
+    return df
+
+
+def score_with_cascade(texts, threshold, stage1="auto", batch_size=BATCH_SIZE,
+                       model_name=MODEL_NAME, max_len=MAX_LEN, backend="torch"):
+    """Stage-1 classifier on every text; RoBERTa only where its max probability < threshold."""
+    from cascade_sentiment_v2 import gate, load_stage1
+
+    first = load_stage1(stage1)
+    probs = first.predict_proba(texts)
+    confident = gate(probs, threshold)
+    scores = probs_to_frame(probs)
+    scores[STAGE_COL] = first.name
+    rest = [t for t, ok in zip(texts, confident) if not ok]
+    if rest:
+        deep = get_model(model_name, max_len, backend=backend).score_texts(rest, batch_size)
+        deep[STAGE_COL] = "roberta"
+        deep.index = np.flatnonzero(~confident)
+        scores.loc[deep.index, SENT_COLS + [STAGE_COL]] = deep
+    print(f"Cascade: {int(confident.sum())}/{len(texts)} labeled by {first.name}, {len(rest)} by RoBERTa")
+    return scores
+
+
+def scoring_config(model_name=MODEL_NAME, max_len=MAX_LEN, backend="torch", cascade=None, stage1="auto"):
+    """What produced the scores; outputs written before meta files existed count as the defaults."""
+    cfg = {"model_name": model_name, "max_len": int(max_len), "backend": backend}
+    if cascade is not None:
+        cfg.update(cascade=float(cascade), stage1=stage1)
+    return cfg
+
+
+def meta_path(output_csv):
+    output_csv = Path(output_csv)
+    return output_csv.with_name(f"{output_csv.stem}.meta.json")
+
+
+def _input_signature(path):
+    st = Path(path).stat()
+    return [str(Path(path)), st.st_size, st.st_mtime_ns]
+
+
+def load_meta(output_csv):
+    path = meta_path(output_csv)
+    if not path.exists():
+        return {"config": scoring_config()}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def prescored(df):
+    """Scores already in the input (fetch-time scoring), one row per clean_text; None if absent."""
+    if not set(SENT_COLS).issubset(df.columns):
+        return None
+    pre = df.dropna(subset=SENT_COLS).drop_duplicates("clean_text", keep="last")
+    return pre[["clean_text"] + SENT_COLS].assign(**{STAGE_COL: "service"})
+
+
+def run(input_csv=MERGED_CSV, output_csv=WITH_SENT_CSV, full=False,
+        batch_size=BATCH_SIZE, model_name=MODEL_NAME, max_len=MAX_LEN, backend="torch",
+        cascade=None, stage1="auto", cube=False, sample=None, embeddings=False):
+    """Score input_csv into output_csv. Scores are keyed by clean_text, so unless full=True
+    only texts missing from the previous output reach the model; previous scores are reused only
+    if they came from the same scoring_config (meta_path(output_csv)). cascade=<threshold> routes
+    new texts through cascade_sentiment_v2 first; cube=True folds the newly scored rows into
+    aggregate_cube_v2. sample=K scores a stratified sample of input_csv (sampling_v2, at most K
+    rows per domain × video × month) into <output stem>_sample.csv and prints confidence
+    intervals. embeddings=True also writes the pooled sentence vectors of every output row
+    (embeddings_v2); texts without a stored vector go through the model even if already scored.
+    Returns rows scored."""
+    if embeddings and cascade is not None:
+        raise ValueError("embeddings come from the RoBERTa pass on every text; not available with cascade")
+    output_csv = Path(output_csv)
+    if sample and not output_csv.stem.endswith("_sample"):   # never overwrite the full output with a sample
+        output_csv = output_csv.with_name(f"{output_csv.stem}_sample{output_csv.suffix}")
+    with stage("inference_load") as st:
+        if sample:
+            from sampling_v2 import stratified_sample
+            df = stratified_sample(input_csv, per_stratum=sample)
+            df["clean_text"] = df["clean_text"].fillna("").astype(str)
         else:
-            label = "neutral"
-        sentiments.append(label)
-        ppos.append(float(pos)); pneu.append(float(neu)); pneg.append(float(neg))
+            df = load_texts(input_csv)
+        st.rows_out = len(df)
+    config = scoring_config(model_name, max_len, backend, cascade, stage1)
+    meta = load_meta(output_csv) if output_csv.exists() else {}
+    same_config = meta.get("config") == config
+    known = pd.DataFrame(columns=["clean_text"] + SENT_COLS + [STAGE_COL])
+    prev_texts = None
+    if not full and output_csv.exists():
+        prev = pd.read_csv(output_csv)
+        if set(SENT_COLS).issubset(prev.columns):
+            prev["clean_text"] = prev["clean_text"].fillna("").astype(str)
+            prev_texts = prev["clean_text"].tolist()
+            if STAGE_COL not in prev.columns:
+                prev[STAGE_COL] = "roberta"
+            if same_config:
+                known = prev[["clean_text"] + SENT_COLS + [STAGE_COL]]
+                known = known.drop_duplicates("clean_text", keep="last")
+            else:
+                print(f"Scoring config changed ({meta.get('config')} → {config}); "
+                      "previous scores not reused")
+    pre = prescored(df) if not full and config == scoring_config() else None
+    if pre is not None:
+        pre = pre[~pre["clean_text"].isin(known["clean_text"])]
+        if len(pre):
+            known = pd.concat([known, pre], ignore_index=True) if len(known) else pre
+            print(f"Reusing {len(pre)} fetch-time scores from {input_csv}")
+
+    todo = pd.Index(df["clean_text"].unique()).difference(known["clean_text"])
+    if embeddings:
+        from embeddings_v2 import embedded_texts
+        have = embedded_texts(output_csv, prev_texts)
+        todo = todo.union(pd.Index([t for t in df["clean_text"].unique() if t not in have]))
+    unchanged = same_config and meta.get("input") == _input_signature(input_csv)
+    if len(todo) == 0 and len(known) and not sample and unchanged:
+        print(f"Nothing new to score (input unchanged, {len(df)} rows already in {output_csv})")
+        return 0
+
+    new_vectors = {}
+    if len(todo):
+        model_kw = dict(batch_size=batch_size, model_name=model_name, max_len=max_len, backend=backend)
+        with stage("inference_score", rows_in=len(todo)) as st:
+            if cascade is not None:
+                scores = score_with_cascade(todo.tolist(), cascade, stage1, **model_kw)
+            else:
+                emb = [] if embeddings else None
+                model = get_model(model_name, max_len, backend=backend)
+                scores = model.score_texts(todo.tolist(), batch_size, embeddings=emb)
+                scores[STAGE_COL] = "roberta"
+                if embeddings:
+                    new_vectors = dict(zip(todo.tolist(), np.concatenate(emb)))
+            st.rows_out = len(scores)
+        scores.insert(0, "clean_text", todo.tolist())
+        known = pd.concat([known, scores], ignore_index=True) if len(known) else scores
+        known = known.drop_duplicates("clean_text", keep="last")
+
+    with stage("inference_write") as st:
+        out = df.drop(columns=[c for c in SENT_COLS + [STAGE_COL] if c in df.columns])
+        out = out.merge(known, on="clean_text", how="left")
+        out.to_csv(output_csv, index=False)
+        st.rows_out = len(out)
+    with open(meta_path(output_csv), "w", encoding="utf-8") as f:
+        json.dump({"config": config, "input": _input_signature(input_csv)}, f, indent=1)
+    print(f"Saved → {output_csv} ({len(out)} rows, {len(todo)} newly scored)")
+    if embeddings:
+        from embeddings_v2 import write_aligned
+        with stage("inference_embeddings") as st:
+            path = write_aligned(output_csv, out["clean_text"].tolist(), new_vectors, prev_texts)
+            st.rows_out = len(out)
+        print(f"Embeddings → {path} ({len(out)} rows, {len(new_vectors)} new vectors)")
+    if sample:
+        from sampling_v2 import print_ci
+        print_ci(out)
+        return len(todo)
+    if cube:
+        from aggregate_cube_v2 import update_cube
+        _, n_cube = update_cube(out)
+        print(f"Aggregate cube: {n_cube} new or changed rows ingested")
+    return len(todo)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="RoBERTa sentiment scoring for the merged comments CSV")
+    parser.add_argument("--input", type=str, default=str(MERGED_CSV))
+    parser.add_argument("--output", type=str, default=str(WITH_SENT_CSV))
+    parser.add_argument("--batch_size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--max_len", type=int, default=MAX_LEN)
+    parser.add_argument("--model", type=str, default=MODEL_NAME)
+    parser.add_argument("--backend", type=str, default="torch", choices=BACKENDS)
+    parser.add_argument("--full", action="store_true", help="rescore every row, ignoring previous output")
+    parser.add_argument("--cascade", type=float, default=None, metavar="THRESHOLD",
+                        help="stage-1 classifier first; RoBERTa only below this confidence (e.g. 0.9)")
+    parser.add_argument("--stage1", type=str, default="auto", choices=["auto", "linear", "lexicon"])
+    parser.add_argument("--cube", action="store_true", help="update the aggregate cube with new rows")
+    parser.add_argument("--sample", type=int, default=None, metavar="K",
+                        help="score a stratified sample only (at most K rows per domain × video × month)")
+    parser.add_argument("--embeddings", action="store_true",
+                        help="also store pooled sentence embeddings (float16, row-aligned) for embeddings_v2")
+    parser.add_argument("--watch", type=float, default=0,
+                        help="keep the model warm and re-run incrementally every N seconds")
+    args = parser.parse_args(argv)
+
+    kwargs = dict(input_csv=Path(args.input), output_csv=Path(args.output),
+                  batch_size=args.batch_size, model_name=args.model, max_len=args.max_len,
+                  backend=args.backend, cascade=args.cascade, stage1=args.stage1,
+                  cube=args.cube, sample=args.sample, embeddings=args.embeddings)
+    start_run("inference")
+    run(full=args.full, **kwargs)
+    while args.watch > 0:
+        time.sleep(args.watch)
+        try:
+            run(**kwargs)
+        except (FileNotFoundError, pd.errors.EmptyDataError) as e:
+            print(f"[watch] skipped: {e}")
 
-df["sentiment"]     = sentiments
-df["prob_positive"] = ppos
-df["prob_neutral"]  = pneu
-df["prob_negative"] = pneg
 
-df.to_csv(WITH_SENT_CSV, index=False)
-print(f"Saved → {WITH_SENT_CSV} ({len(df)} rows)")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# cascade_sentiment_v2.py
+# Confidence-gated cascade for sentiment scoring:
+#   stage 1  cheap classifier on every text (hashed bag-of-words softmax regression trained on
+#            RoBERTa labels from WITH_SENT_CSV, or a tiny lexicon when no model is trained)
+#   stage 2  RoBERTa, only for texts whose stage-1 max probability is below the threshold
+# The output records which stage labeled each row in `sentiment_stage`.
+# Usage:
+#     python cascade_sentiment_v2.py train                      # fit stage 1 on WITH_SENT_CSV
+#     python cascade_sentiment_v2.py report                     # speedup vs agreement table
+#     python bert_sentiment_inference_v2.py --cascade 0.9       # score with the cascade
+
+from settings import RESULTS_DIR, WITH_SENT_CSV
+import argparse, glob, time, zlib
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.optimize import minimize
+
+LABELS = ["negative", "neutral", "positive"]     # same order as the RoBERTa head
+LINEAR_MODEL_PATH = RESULTS_DIR / "cascade_linear.npz"
+N_FEATURES = 2 ** 18
+L2 = 1e-4
+THRESHOLD = 0.9
+TOKEN_PAT = r"[a-z']+|[\U0001F300-\U0001FAFF☀-➿]"
+
+POS_WORDS = set("""love loved loving lovely great amazing awesome best beautiful perfect excellent good nice
+fantastic incredible wonderful favorite favourite fire goat masterpiece recommend thanks thank helpful
+delicious tasty comfy comfortable enjoy enjoyed fun happy glad ❤ 😍 🔥 😂 👍""".split())
+NEG_WORDS = set("""hate hated terrible awful worst bad trash garbage horrible disgusting boring broken
+buggy scam waste overpriced ugly disappointing disappointed useless poor sucks crap refund lag laggy
+crash crashes mid 👎 🤮 😡""".split())
+NEGATORS = set("""not no never don't doesn't didn't isn't wasn't aren't can't won't""".split())
+
+
+def tokenize_series(texts):
+    """Lower-case token lists for a Series of texts (pandas vectorized findall)."""
+    return pd.Series(list(texts), dtype="object").fillna("").astype(str).str.lower().str.findall(TOKEN_PAT)
+
+
+def _stable_hash(s):
+    return zlib.crc32(s.encode("utf-8")) % N_FEATURES
+
+
+def featurize(texts):
+    """Hashed unigram + bigram counts as a CSR matrix (n_texts × N_FEATURES), L2-normalised.
+    Each distinct token is hashed once; rows are assembled from the exploded token frame."""
+    toks = tokenize_series(texts)
+    bigrams = toks.map(lambda ws: [a + " " + b for a, b in zip(ws, ws[1:])])
+    grams = (toks + bigrams).explode().dropna()
+    n = len(toks)
+    if grams.empty:
+        return sp.csr_matrix((n, N_FEATURES), dtype=np.float32)
+    codes, uniq = pd.factorize(grams.to_numpy())
+    cols = np.fromiter((_stable_hash(u) for u in uniq), dtype=np.int64, count=len(uniq))[codes]
+    rows = grams.index.to_numpy()
+    X = sp.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(n, N_FEATURES))
+    X.sum_duplicates()
+    X.data = np.log1p(X.data)
+    norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sp.diags(1.0 / norms).dot(X).tocsr()
+
+
+def _softmax(z):
+    z = z - z.max(axis=1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=1, keepdims=True)
+
+
+class LinearModel:
+    """Multinomial logistic regression over hashed n-grams (weights: N_FEATURES × 3)."""
+    name = "linear"
+
+    def __init__(self, W, b):
+        self.W, self.b = W, b
+
+    @classmethod
+    def fit(cls, texts, labels, l2=L2, maxiter=200):
+        X = featurize(texts)
+        y = pd.Categorical(labels, categories=LABELS).codes
+        keep = y >= 0
+        X, y = X[keep], y[keep]
+        Y = np.eye(3)[y]
+        n, d = X.shape
+
+        def loss_grad(theta):
+            W = theta[:d * 3].reshape(d, 3)
+            b = theta[d * 3:]
+            P = _softmax(X @ W + b)
+            loss = -np.log(P[np.arange(n), y] + 1e-12).mean() + 0.5 * l2 * (W * W).sum()
+            G = (P - Y) / n
+            gW = np.asarray(X.T @ G) + l2 * W
+            return loss, np.concatenate([gW.ravel(), G.sum(axis=0)])
+
+        res = minimize(loss_grad, np.zeros(d * 3 + 3), jac=True, method="L-BFGS-B",
+                       options={"maxiter": maxiter})
+        return cls(res.x[:d * 3].reshape(d, 3).astype(np.float32), res.x[d * 3:].astype(np.float32))
+
+    def predict_proba(self, texts):
+        return _softmax(np.asarray(featurize(texts) @ self.W) + self.b)
+
+    def save(self, path=LINEAR_MODEL_PATH):
+        np.savez_compressed(path, W=self.W, b=self.b)
+
+    @classmethod
+    def load(cls, path=LINEAR_MODEL_PATH):
+        z = np.load(path)
+        return cls(z["W"], z["b"])
+
+
+class LexiconModel:
+    """Word-list fallback: softmax over (negative hits, neutral prior, positive hits). A hit right
+    after a negator ("not good") is not counted. With weight 4 one clear hit gives ~0.95, so
+    single-polarity comments pass THRESHOLD; no hits (~0.45) or a tie (<0.5) go to stage 2."""
+    name = "lexicon"
+    weight = 4.0
+    neutral_prior = 0.5
+
+    def predict_proba(self, texts):
+        toks = tokenize_series(texts)
+        pos = toks.map(lambda ws: _hits(ws, POS_WORDS)).to_numpy(dtype=float)
+        neg = toks.map(lambda ws: _hits(ws, NEG_WORDS)).to_numpy(dtype=float)
+        z = np.stack([neg * self.weight, np.full_like(pos, self.neutral_prior), pos * self.weight], axis=1)
+        return _softmax(z)
+
+
+def _hits(words, lexicon):
+    return sum(w in lexicon and (i == 0 or words[i - 1] not in NEGATORS) for i, w in enumerate(words))
+
+
+def load_stage1(kind="auto"):
+    """linear if a trained model exists (or kind == 'linear'), otherwise the lexicon."""
+    if kind == "lexicon" or (kind == "auto" and not LINEAR_MODEL_PATH.exists()):
+        return LexiconModel()
+    return LinearModel.load()
+
+
+def gate(probs, threshold=THRESHOLD):
+    """Boolean mask of rows stage 1 is confident enough to keep."""
+    return np.asarray(probs).max(axis=1) >= threshold
+
+
+def teacher_labels(path=WITH_SENT_CSV):
+    """Rows labeled by RoBERTa (never train stage 1 on its own outputs)."""
+    df = pd.read_csv(path, usecols=lambda c: c in {"clean_text", "sentiment", "sentiment_stage"})
+    if "sentiment_stage" in df.columns:
+        df = df[df["sentiment_stage"].fillna("roberta") == "roberta"]
+    df = df.dropna(subset=["sentiment"])
+    df["clean_text"] = df["clean_text"].fillna("").astype(str)
+    return df.drop_duplicates("clean_text")
+
+
+def _holdout_mask(texts, frac=0.2):
+    h = np.fromiter((zlib.crc32(t.encode("utf-8")) for t in texts), dtype=np.int64, count=len(texts))
+    return (h % 1000) < int(frac * 1000)
+
+
+def _roberta_per_s(default):
+    """Baseline comments/sec from the newest benchmark_inference_v2 run, if any."""
+    files = sorted(glob.glob(str(RESULTS_DIR / "benchmarks" / "inference_*.csv")))
+    if not files:
+        return default
+    return float(pd.read_csv(files[-1])["comments_per_s"].iloc[0])
+
+
+def report(thresholds, roberta_per_s, out_path):
+    df = teacher_labels()
+    test = _holdout_mask(df["clean_text"].tolist())
+    train_df, test_df = df[~test], df[test]
+    print(f"Training stage 1 on {len(train_df)} rows, evaluating on {len(test_df)}")
+    stages = [LinearModel.fit(train_df["clean_text"], train_df["sentiment"]), LexiconModel()]
+    truth = test_df["sentiment"].to_numpy()
+    rows = []
+    for model in stages:
+        t0 = time.perf_counter()
+        probs = model.predict_proba(test_df["clean_text"])
+        s1_per_comment = (time.perf_counter() - t0) / max(1, len(test_df))
+        s1_labels = np.asarray(LABELS)[probs.argmax(axis=1)]
+        for th in thresholds:
+            ok = gate(probs, th)
+            coverage = float(ok.mean())
+            final = np.where(ok, s1_labels, truth)  # rows past the gate get the RoBERTa label
+            cost = s1_per_comment + (1 - coverage) / roberta_per_s
+            rows.append({
+                "stage1": model.name, "threshold": th, "coverage": round(coverage, 4),
+                "stage1_accuracy_on_covered": round(float((s1_labels[ok] == truth[ok]).mean()), 4) if ok.any() else np.nan,
+                "agreement_with_roberta": round(float((final == truth).mean()), 4),
+                "est_speedup": round((1.0 / roberta_per_s) / cost, 2),
+            })
+    table = pd.DataFrame(rows)
+    table.to_csv(out_path, index=False)
+    print(table.to_string(index=False))
+    print(f"\n(RoBERTa throughput assumed {roberta_per_s:.1f} comments/s) Saved → {out_path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cascade stage-1 training and trade-off report")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("train")
+    r = sub.add_parser("report")
+    r.add_argument("--thresholds", type=float, nargs="+", default=[0.6, 0.7, 0.8, 0.9, 0.95, 0.99])
+    r.add_argument("--roberta_per_s", type=float, default=None,
+                   help="RoBERTa comments/sec; default: newest benchmark_inference_v2 result, else 50")
+    r.add_argument("--out", type=str, default=str(RESULTS_DIR / "cascade_report.csv"))
+    args = parser.parse_args(argv)
+
+    if args.cmd == "train":
+        df = teacher_labels()
+        LinearModel.fit(df["clean_text"], df["sentiment"]).save()
+        print(f"Stage-1 linear model trained on {len(df)} rows → {LINEAR_MODEL_PATH}")
+    else:
+        report(args.thresholds, args.roberta_per_s or _roberta_per_s(50.0), args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
 import re
 import os
+import random
+from collections import Counter
 import pandas as pd
 from typing import Optional
 
+from text_cleaning import clean_v1
+
 # ========== 配置 ==========
 INPUT_CSV  = "data/raw/food_comments.csv"         # 改成你的输入
 OUTPUT_CSV = "data/processed/food_comments_clean.csv"
@@ -17,6 +21,10 @@ DOMAIN_KEYWORDS = [
 MIN_CHAR = 3           # 最短字符数
 MAX_CHAR = 2000        # 最长字符数
 MIN_WORDS = 2          # 最少英文词数（中文可忽略）
+
+DROPPED_SAMPLE_PER_REASON = 50   # 每种删除原因最多抽样保留多少行（蓄水池抽样），0 = 不抽样
+DROPPED_FULL_DUMP = False        # True 时仍然写出全部被删除行（*_dropped.csv）
+SAMPLE_SEED = 42
 # ==========================
 
 URL_RE   = re.compile(r"(https?://\S+|www\.\S+)", re.IGNORECASE)
@@ -35,12 +43,8 @@ SPAM_HINTS = [
 SPAM_RE = re.compile("|".join(SPAM_HINTS), re.IGNORECASE)
 
 def normalize(text: str) -> str:
-    t = text.strip()
-    t = re.sub(r"\s+", " ", t)
-    t = URL_RE.sub("<URL>", t)
-    t = EMAIL_RE.sub("<EMAIL>", t)
-    t = MENT_RE.sub("<USER>", t)
-    return t
+    # 共用清洗内核（text_cleaning.py，v1 规则：URL/邮箱/@ 替换为占位符）
+    return clean_v1(text)
 
 def english_word_count(text: str) -> int:
     # 简单按空白切分统计英文词（中文场景该值会偏低）
@@ -88,6 +92,38 @@ def domain_ok(text: str) -> bool:
         return True
     return any(re.search(pat, text, re.IGNORECASE) for pat in DOMAIN_KEYWORDS)
 
+class ReasonReservoir:
+    """按删除原因计数，并对每种原因做固定大小的蓄水池抽样（Algorithm R），内存与删除行数无关。"""
+
+    def __init__(self, k=DROPPED_SAMPLE_PER_REASON, seed=SAMPLE_SEED):
+        self.k = k
+        self.rng = random.Random(seed)
+        self.counts = Counter()
+        self.samples = {}
+
+    def offer(self, reason, row=None, n=1):
+        """row: 行号（iloc），只保存被抽中的行号；None 表示只计数。"""
+        self.counts[reason] += n
+        if self.k <= 0 or row is None:
+            return
+        bucket = self.samples.setdefault(reason, [])
+        seen = self.counts[reason]
+        if len(bucket) < self.k:
+            bucket.append(row)
+        else:
+            j = self.rng.randrange(seen)
+            if j < self.k:
+                bucket[j] = row
+
+    def stats_frame(self, total):
+        df = pd.DataFrame(sorted(self.counts.items(), key=lambda kv: -kv[1]), columns=["reason", "count"])
+        df["share_of_input"] = (df["count"] / max(1, total)).round(4)
+        return df
+
+    def sample_frame(self, df):
+        parts = [df.iloc[sorted(bucket)].assign(dropped_reason=reason) for reason, bucket in self.samples.items()]
+        return pd.concat(parts) if parts else df.iloc[:0]
+
 def main():
     os.makedirs(os.path.dirname(OUTPUT_CSV), exist_ok=True)
     df = pd.read_csv(INPUT_CSV)
@@ -101,8 +137,13 @@ def main():
     # 预清洗：去首尾空白
     df["text"] = df["text"].astype(str).fillna("").str.strip()
 
-    # 完全重复去重（文本、同视频）
+    n_input = len(df)
+    drops = ReasonReservoir()
+
+    # 完全重复去重（文本、同视频）——只计数
+    n0 = len(df)
     df = df.drop_duplicates(subset=["video_id","text"])
+    drops.offer("dup_exact", n=n0 - len(df))
 
     # 近似重复：标准化后去重
     df["norm_for_dupe"] = (df["text"]
@@ -110,13 +151,15 @@ def main():
                            .str.replace(r"[^\w\s]", "", regex=True)
                            .str.replace(r"\s+", " ", regex=True)
                            .str.strip())
+    n0 = len(df)
     df = df.drop_duplicates(subset=["video_id","norm_for_dupe"])
     df = df.drop(columns=["norm_for_dupe"])
+    drops.offer("dup_near", n=n0 - len(df))
 
     # 规则过滤
     reasons = []
     clean_texts = []
-    for t in df["text"].tolist():
+    for i, t in enumerate(df["text"].tolist()):
         reason: Optional[str] = None
         nt = normalize(t)
 
@@ -139,6 +182,8 @@ def main():
 
         reasons.append(reason)
         clean_texts.append(nt)
+        if reason is not None:
+            drops.offer(reason, i)
 
     df["clean_text"] = clean_texts
     df["dropped_reason"] = reasons
@@ -154,11 +199,22 @@ def main():
     kept_df.to_csv(OUTPUT_CSV, index=False)
     print(f"Saved cleaned -> {OUTPUT_CSV}")
     print(f"Kept {len(kept_df)} / {len(df)} rows ({len(kept_df)/max(1,len(df)):.1%})")
-    # 也可输出被删除样本，便于抽查
-    dropped = df[~keep]
-    if len(dropped) > 0:
-        dropped.to_csv(OUTPUT_CSV.replace(".csv","_dropped.csv"), index=False)
-        print(f"Dropped {len(dropped)} rows -> {OUTPUT_CSV.replace('.csv','_dropped.csv')}")
+    # 删除原因统计 + 每种原因的抽样（代替整份 *_dropped.csv，审计过滤规则用）
+    stats = drops.stats_frame(n_input)
+    stats_csv = OUTPUT_CSV.replace(".csv", "_drop_stats.csv")
+    stats.to_csv(stats_csv, index=False)
+    print(f"Drop reasons -> {stats_csv}")
+    print(stats.to_string(index=False))
+    sample = drops.sample_frame(df)
+    if len(sample) > 0:
+        sample_csv = OUTPUT_CSV.replace(".csv", "_dropped_sample.csv")
+        sample.to_csv(sample_csv, index=False)
+        print(f"Dropped sample ({DROPPED_SAMPLE_PER_REASON}/reason max) -> {sample_csv}")
+    if DROPPED_FULL_DUMP:
+        dropped = df[~keep]
+        if len(dropped) > 0:
+            dropped.to_csv(OUTPUT_CSV.replace(".csv","_dropped.csv"), index=False)
+            print(f"Dropped {len(dropped)} rows -> {OUTPUT_CSV.replace('.csv','_dropped.csv')}")
 
 if __name__ == "__main__":
     main()
@@ -3,7 +3,10 @@
 
 from settings import RAW_DIR, PROCESSED_DIR
 import pandas as pd
-import re
+
+from bert_sentiment_inference_v2 import SENT_COLS
+from pipeline_metrics_v2 import stage, start_run
+from text_cleaning import clean_v2
 
 IN_OUT = {
     "sneaker": ("sneaker_comments_raw.csv", "sneaker_comments_clean.csv"),
@@ -13,18 +16,21 @@ IN_OUT = {
 }
 
 def clean_text(s: str) -> str:
-    s = str(s or "")
-    s = re.sub(r"`{1,3}.*?`{1,3}", " ", s)           # code spans
-    s = re.sub(r"https?://\S+", " ", s)              # urls
-    s = re.sub(r"[@#]\w+", " ", s)                   # @mentions, #tags
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+    # shared kernel (text_cleaning.py, v2 profile): drop code spans, urls, @mentions, #tags
+    return clean_v2(s)
 
 def clean_one(domain, in_name, out_name):
     src = RAW_DIR / in_name
     dst = PROCESSED_DIR / out_name
-    df = pd.read_csv(src)
+    with stage(f"clean_{domain}") as st:
+        df = pd.read_csv(src)
+        st.rows_in = len(df)
+        df = _clean_frame(df, domain)
+        st.rows_out = len(df)
+        df.to_csv(dst, index=False)
+    print(f"[{domain}] Cleaned → {dst} ({len(df)} rows)")
 
+def _clean_frame(df, domain):
     # standardize columns if exist
     keep_cols = {
         "video_id": "video_id",
@@ -56,16 +62,15 @@ def clean_one(domain, in_name, out_name):
     if "like_count" in df.columns:
         df["like_count"] = pd.to_numeric(df["like_count"], errors="coerce").fillna(0).astype("int32")
 
-    # final column order (keep those that exist)
+    # final column order (keep those that exist); scores added at fetch time (--score_url) are kept
     cols = ["video_id","video_title","video_published_at",
             "comment_id","published_at","like_count",
-            "clean_text","comment_length","domain"]
+            "clean_text","comment_length","domain"] + SENT_COLS
     df = df[[c for c in cols if c in df.columns]].dropna(subset=["clean_text"])
     df = df[df["clean_text"].str.strip().astype(bool)]
-
-    df.to_csv(dst, index=False)
-    print(f"[{domain}] Cleaned → {dst} ({len(df)} rows)")
+    return df
 
 if __name__ == "__main__":
+    start_run("clean")
     for dom, (i,o) in IN_OUT.items():
         clean_one(dom, i, o)
@@ -0,0 +1,175 @@
+# comment_store_v2.py
+# Persistent raw-comment store shared by all fetch runs and domains (SQLite).
+#   comments       one row per comment_id. Re-fetching upserts it: like_count and text are
+#                  refreshed, first_seen is kept and last_seen is bumped.
+#   videos         title / publish date per video_id
+#   video_sources  which (domain, query) surfaced each video, so the overlap between domains is
+#                  recorded instead of lost (the same video can match "food review" and
+#                  "fast food review")
+# known(ids) is an indexed existence check. fetch_comments_v2 --store passes it to
+# iter_comment_pages so paging stops at comments fetched in an earlier run.
+# export() writes the old <domain>_comments_raw.csv layout (every run so far, deduplicated),
+# so clean_comments_v2 and the later steps are unchanged. Scores added at fetch time
+# (--score_url / --score_unix) are stored with the comment and exported as SENT_COLS; a re-fetch
+# without scores keeps them while the text is unchanged.
+# File: RAW_DIR/comment_store.sqlite
+# Usage:
+#     python fetch_comments_v2.py --domain food --store
+#     python comment_store_v2.py stats
+#     python comment_store_v2.py overlap
+#     python comment_store_v2.py export --domain food
+
+from settings import RAW_DIR
+import argparse, sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+
+from bert_sentiment_inference_v2 import SENT_COLS
+
+STORE_DB = RAW_DIR / "comment_store.sqlite"
+IN_BATCH = 500                 # ids per IN (...) lookup, below SQLite's variable limit
+RAW_COLS = ["video_id", "video_title", "video_published_at", "comment_id", "published_at",
+            "like_count", "text", "domain"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS comments (
+    comment_id TEXT PRIMARY KEY, video_id TEXT NOT NULL, published_at TEXT,
+    like_count INTEGER, text TEXT, first_seen TEXT, last_seen TEXT,
+    sentiment TEXT, prob_positive REAL, prob_neutral REAL, prob_negative REAL
+);
+CREATE INDEX IF NOT EXISTS ix_store_video ON comments(video_id);
+CREATE TABLE IF NOT EXISTS videos (
+    video_id TEXT PRIMARY KEY, video_title TEXT, video_published_at TEXT
+);
+CREATE TABLE IF NOT EXISTS video_sources (
+    video_id TEXT NOT NULL, domain TEXT NOT NULL, query TEXT NOT NULL, first_seen TEXT,
+    PRIMARY KEY (video_id, domain, query)
+);
+CREATE INDEX IF NOT EXISTS ix_sources_domain ON video_sources(domain, video_id);
+"""
+
+# a fetch-time score replaces the stored one; without one, the stored score survives only if the
+# text it was computed from is unchanged
+UPSERT = f"""
+INSERT INTO comments (comment_id, video_id, published_at, like_count, text, first_seen, last_seen,
+                      {", ".join(SENT_COLS)})
+VALUES (?, ?, ?, ?, ?, ?, ?, {", ".join("?" * len(SENT_COLS))})
+ON CONFLICT(comment_id) DO UPDATE SET
+    like_count = excluded.like_count, text = excluded.text, last_seen = excluded.last_seen,
+    {", ".join(f"{c} = COALESCE(excluded.{c}, CASE WHEN excluded.text IS comments.text THEN comments.{c} END)"
+               for c in SENT_COLS)}
+"""
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+class CommentStore:
+    def __init__(self, path=STORE_DB):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.con = sqlite3.connect(self.path)
+        self.con.executescript(SCHEMA)
+        have = {r[1] for r in self.con.execute("PRAGMA table_info(comments)")}
+        for col in SENT_COLS:                   # stores created before scores were kept
+            if col not in have:
+                kind = "TEXT" if col == "sentiment" else "REAL"
+                self.con.execute(f"ALTER TABLE comments ADD COLUMN {col} {kind}")
+
+    def close(self):
+        self.con.close()
+
+    def add_sources(self, video_ids, domain, query):
+        with self.con:
+            self.con.executemany("INSERT OR IGNORE INTO video_sources VALUES (?, ?, ?, ?)",
+                                 ((v, domain, query, _now()) for v in video_ids))
+
+    def known(self, comment_ids):
+        """Subset of comment_ids already in the store."""
+        ids, out = list(comment_ids), set()
+        for i in range(0, len(ids), IN_BATCH):
+            batch = ids[i:i + IN_BATCH]
+            cur = self.con.execute(
+                f"SELECT comment_id FROM comments WHERE comment_id IN ({','.join('?' * len(batch))})", batch)
+            out.update(r[0] for r in cur)
+        return out
+
+    def upsert(self, rows):
+        """Insert new comments / refresh known ones. Returns (n_new, n_updated)."""
+        if not rows:
+            return 0, 0
+        now = _now()
+        n_known = len(self.known({r["comment_id"] for r in rows}))
+        with self.con:
+            self.con.executemany(
+                "INSERT OR REPLACE INTO videos VALUES (?, ?, ?)",
+                {r["video_id"]: (r["video_id"], r.get("video_title", ""), r.get("video_published_at", ""))
+                 for r in rows}.values())
+            self.con.executemany(UPSERT, (
+                (r["comment_id"], r["video_id"], r.get("published_at", ""),
+                 int(pd.to_numeric(r.get("like_count"), errors="coerce") or 0), r.get("text", ""), now, now,
+                 *(r.get(c) for c in SENT_COLS))
+                for r in rows))
+        n_unique = len({r["comment_id"] for r in rows})
+        return n_unique - n_known, n_known
+
+    def export(self, domain, out_csv=None):
+        """Every stored comment of videos surfaced for `domain`, in the raw CSV layout, plus the
+        fetch-time scores (SENT_COLS) when any comment has one."""
+        df = pd.read_sql_query(
+            f"""SELECT c.video_id, v.video_title, v.video_published_at, c.comment_id, c.published_at,
+                      c.like_count, c.text, ? AS domain, {", ".join(f"c.{c}" for c in SENT_COLS)}
+               FROM comments c JOIN videos v ON v.video_id = c.video_id
+               WHERE c.video_id IN (SELECT video_id FROM video_sources WHERE domain = ?)
+               ORDER BY c.video_id, c.published_at""", self.con, params=(domain, domain))
+        if out_csv is not None:
+            scored = df["sentiment"].notna().any()
+            df[RAW_COLS + (SENT_COLS if scored else [])].to_csv(out_csv, index=False)
+        return df
+
+    def stats(self):
+        return pd.read_sql_query(
+            """SELECT s.domain, COUNT(DISTINCT s.video_id) AS videos, COUNT(DISTINCT s.query) AS queries,
+                      (SELECT COUNT(*) FROM comments c WHERE c.video_id IN
+                          (SELECT video_id FROM video_sources WHERE domain = s.domain)) AS comments
+               FROM video_sources s GROUP BY s.domain ORDER BY s.domain""", self.con)
+
+    def overlap(self):
+        """Videos (and their stored comments) surfaced by more than one domain, per domain pair."""
+        return pd.read_sql_query(
+            """WITH d AS (SELECT DISTINCT video_id, domain FROM video_sources)
+               SELECT a.domain AS domain_a, b.domain AS domain_b, COUNT(*) AS shared_videos,
+                      SUM((SELECT COUNT(*) FROM comments c WHERE c.video_id = a.video_id)) AS shared_comments
+               FROM d a JOIN d b ON a.video_id = b.video_id AND a.domain < b.domain
+               GROUP BY a.domain, b.domain ORDER BY shared_videos DESC""", self.con)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Persistent deduplicated comment store")
+    parser.add_argument("--db", type=str, default=str(STORE_DB))
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("stats", help="videos / queries / comments per domain")
+    sub.add_parser("overlap", help="videos shared between domains")
+    e = sub.add_parser("export", help="write <domain>_comments_raw.csv from the store")
+    e.add_argument("--domain", type=str, required=True)
+    e.add_argument("--out", type=str, default=None)
+    args = parser.parse_args(argv)
+
+    if not Path(args.db).exists():
+        raise SystemExit(f"No store at {args.db}; fetch with --store first")
+    store = CommentStore(args.db)
+    if args.cmd == "export":
+        out = Path(args.out) if args.out else RAW_DIR / f"{args.domain}_comments_raw.csv"
+        df = store.export(args.domain, out)
+        print(f"[{args.domain}] {len(df)} comments → {out}")
+    else:
+        res = store.stats() if args.cmd == "stats" else store.overlap()
+        print(res.to_string(index=False) if len(res) else "No rows.")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+# crawl_frontier_v2.py
+# Crawl frontier for video discovery beyond search results.
+# search.list costs 100 quota units per 50 results; the frontier uses it only to seed, then grows
+# through 1-unit calls:
+#   videos.list(statistics)        50 videos per call → channel, commentCount, publish date
+#   channels.list(contentDetails)  50 channels per call → uploads playlist id
+#   playlistItems.list             50 uploads per call, newest first (stops at the date window)
+# Videos are served highest expected comment yield first (min(commentCount, per_video_limit)).
+# A persistent seen-set means videos enqueued or fetched in earlier runs are never queued again;
+# a served video stays in the saved queue until mark_done(), so an interrupted fetch is retried.
+# When the queue and the unexpanded channels run dry, related queries (frequent title bigrams of
+# the best videos so far, not yet searched) seed the next round.
+# State: RESULTS_DIR/frontier/<domain>.json
+# Usage:
+#     python fetch_comments_v2.py --domain steam --discovery frontier
+#     python crawl_frontier_v2.py --domain steam --show 20      # inspect the queue
+
+from settings import RESULTS_DIR
+import argparse, heapq, json, re
+from collections import Counter
+from pathlib import Path
+
+from pipeline_metrics_v2 import stage
+
+FRONTIER_DIR = RESULTS_DIR / "frontier"
+ID_BATCH = 50                 # ids per videos.list / channels.list call
+MAX_CHANNEL_PAGES = 4         # uploads pages (×50) read per channel
+SEED_PAGES = 1                # search pages per query when seeding
+MIN_COMMENTS = 20             # videos with fewer comments are not worth a fetch
+STOP = set("review reviews the and for with you your this that from are was official video new vs".split())
+
+
+def _chunks(xs, n):
+    for i in range(0, len(xs), n):
+        yield xs[i:i + n]
+
+
+def _entry(meta):
+    # ties at the per-video cap go to the video with more comments (more choice under relevance order)
+    return (-meta["expected"], -meta["comment_count"], meta["video_id"], meta)
+
+
+class CrawlFrontier:
+    def __init__(self, domain, per_video_limit=500, published_after=None, path=None):
+        self.domain = domain
+        self.per_video_limit = per_video_limit
+        self.published_after = published_after          # RFC3339 string, compared lexicographically
+        self.path = Path(path) if path else FRONTIER_DIR / f"{domain}.json"
+        self.queue = []                # heap of _entry(meta): best expected yield on top
+        self.seen = set()              # every video ever enqueued or fetched
+        self.done = set()              # fetched videos
+        self.inflight = {}             # video_id → meta: served by pop(), not marked done yet
+        self.channels_pending = []     # channel ids whose uploads are not expanded yet
+        self.channels_done = set()
+        self.queries_done = set()
+        self.units = 0                 # quota units spent by discovery
+        self.titles = {}               # video_id → title (for related queries)
+
+    # ---- persistence
+    @classmethod
+    def load(cls, domain, **kwargs):
+        fr = cls(domain, **kwargs)
+        if fr.path.exists():
+            with open(fr.path, encoding="utf-8") as f:
+                st = json.load(f)
+            fr.queue = [_entry(m) for m in st["queue"]]
+            heapq.heapify(fr.queue)
+            fr.seen, fr.done = set(st["seen"]), set(st["done"])
+            fr.channels_pending = st["channels_pending"]
+            fr.channels_done = set(st["channels_done"])
+            fr.queries_done = set(st["queries_done"])
+            fr.units = st.get("units", 0)
+            fr.titles = st.get("titles", {})
+        return fr
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # in-flight videos stay queued on disk until mark_done, so a run stopped mid-fetch
+        # (quota, error) serves them again next time
+        queue = sorted(self.queue + [_entry(m) for m in self.inflight.values()])
+        st = {"domain": self.domain, "queue": [e[-1] for e in queue],
+              "seen": sorted(self.seen), "done": sorted(self.done),
+              "channels_pending": self.channels_pending, "channels_done": sorted(self.channels_done),
+              "queries_done": sorted(self.queries_done), "units": self.units, "titles": self.titles}
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(st, f)
+        tmp.replace(self.path)
+
+    # ---- discovery
+    def seed(self, yt, queries, pages=SEED_PAGES, order="viewCount"):
+        """search.list for queries not searched before (100 units per page)."""
+        ids = []
+        for q in queries:
+            if q in self.queries_done:
+                continue
+            token = None
+            for _ in range(pages):
+                kw = dict(q=q, part="id", type="video", maxResults=50, order=order, pageToken=token)
+                if self.published_after:
+                    kw["publishedAfter"] = self.published_after
+                resp = yt.search().list(**kw).execute()
+                self.units += 100
+                ids += [it["id"]["videoId"] for it in resp.get("items", []) if "videoId" in it.get("id", {})]
+                token = resp.get("nextPageToken")
+                if not token:
+                    break
+            self.queries_done.add(q)
+        return self.add_videos(yt, ids)
+
+    def add_videos(self, yt, video_ids):
+        """Enrich unseen videos with statistics (1 unit / 50) and enqueue them. Returns # enqueued."""
+        new = [v for v in dict.fromkeys(video_ids) if v not in self.seen]
+        added = 0
+        for batch in _chunks(new, ID_BATCH):
+            resp = yt.videos().list(part="snippet,statistics", id=",".join(batch), maxResults=ID_BATCH).execute()
+            self.units += 1
+            for it in resp.get("items", []):
+                vid, sn, stats = it["id"], it.get("snippet", {}), it.get("statistics", {})
+                self.seen.add(vid)
+                ch = sn.get("channelId")
+                if ch and ch not in self.channels_done and ch not in self.channels_pending:
+                    self.channels_pending.append(ch)
+                if self.published_after and sn.get("publishedAt", "") < self.published_after:
+                    continue
+                n_comments = int(stats.get("commentCount", 0) or 0)   # absent when comments are disabled
+                if n_comments < MIN_COMMENTS:
+                    continue
+                meta = {"video_id": vid, "channel_id": ch, "title": sn.get("title", ""),
+                        "published_at": sn.get("publishedAt", ""), "comment_count": n_comments,
+                        "expected": min(n_comments, self.per_video_limit)}
+                heapq.heappush(self.queue, _entry(meta))
+                self.titles[vid] = meta["title"]
+                added += 1
+            self.seen.update(batch)
+        return added
+
+    def expand_channels(self, yt, max_channels=ID_BATCH):
+        """Uploads of up to max_channels pending channels → add_videos. Returns # enqueued.
+        The channels leave channels_pending only once their videos are enqueued, so a quota stop
+        mid-expansion leaves them pending for the next run."""
+        chans = self.channels_pending[:max_channels]
+        if not chans:
+            return 0
+        resp = yt.channels().list(part="contentDetails", id=",".join(chans), maxResults=ID_BATCH).execute()
+        self.units += 1
+        ids = []
+        for it in resp.get("items", []):
+            uploads = it.get("contentDetails", {}).get("relatedPlaylists", {}).get("uploads")
+            if uploads:
+                ids += self._uploads(yt, uploads)
+        added = self.add_videos(yt, ids)
+        self.channels_done.update(chans)
+        self.channels_pending = [c for c in self.channels_pending if c not in self.channels_done]
+        return added
+
+    def _uploads(self, yt, playlist_id):
+        ids, token = [], None
+        for _ in range(MAX_CHANNEL_PAGES):
+            resp = yt.playlistItems().list(part="contentDetails", playlistId=playlist_id,
+                                           maxResults=50, pageToken=token).execute()
+            self.units += 1
+            for it in resp.get("items", []):
+                cd = it.get("contentDetails", {})
+                if self.published_after and cd.get("videoPublishedAt", "") < self.published_after:
+                    return ids                  # uploads are newest first: the rest is older
+                ids.append(cd["videoId"])
+            token = resp.get("nextPageToken")
+            if not token:
+                break
+        return ids
+
+    def related_queries(self, k=3, top_videos=50):
+        """Frequent title bigrams of the highest-yield known videos that were not searched yet."""
+        titles = [e[-1]["title"] for e in heapq.nsmallest(top_videos, self.queue)]
+        titles = titles or list(self.titles.values())[-top_videos:]
+        grams = Counter()
+        for t in titles:
+            words = [w for w in re.findall(r"[a-z0-9']+", t.lower()) if len(w) > 2 and w not in STOP]
+            grams.update(" ".join(p) for p in zip(words, words[1:]))
+        return [f"{g} review" for g, _ in grams.most_common() if f"{g} review" not in self.queries_done][:k]
+
+    # ---- serving
+    def pop(self):
+        while self.queue:
+            meta = heapq.heappop(self.queue)[-1]
+            if meta["video_id"] not in self.done:
+                self.inflight[meta["video_id"]] = meta
+                return meta
+        return None
+
+    def mark_done(self, video_id):
+        self.done.add(video_id)
+        self.seen.add(video_id)
+        self.inflight.pop(video_id, None)
+
+    def iter_videos(self, yt, queries, low_water=ID_BATCH, save_every=20):
+        """Yield video ids best-first, refilling (channels → seed queries → related queries) when
+        fewer than low_water videos are queued. The caller marks fetched videos with mark_done();
+        stop consuming to stop spending quota."""
+        served = 0
+        while True:
+            if len(self.queue) < low_water:
+                self.refill(yt, queries)
+            meta = self.pop()
+            if meta is None:
+                return
+            yield meta["video_id"]
+            served += 1
+            if served % save_every == 0:
+                self.save()
+
+    def refill(self, yt, queries):
+        with stage("frontier_refill") as st:
+            added = 0
+            while self.channels_pending and added == 0:
+                added += self.expand_channels(yt)
+            if added == 0:
+                added += self.seed(yt, queries)
+            if added == 0:
+                added += self.seed(yt, self.related_queries())
+            st.rows_out = added
+        return added
+
+    def summary(self):
+        expected = sum(e[-1]["expected"] for e in self.queue)
+        return {"queued": len(self.queue), "in_flight": len(self.inflight), "expected_comments": expected, "fetched": len(self.done),
+                "seen": len(self.seen), "channels_pending": len(self.channels_pending),
+                "channels_done": len(self.channels_done), "quota_units": self.units}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect the crawl frontier of a domain")
+    parser.add_argument("--domain", type=str, required=True)
+    parser.add_argument("--show", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    fr = CrawlFrontier.load(args.domain)
+    print(fr.summary())
+    for *_, m in heapq.nsmallest(args.show, fr.queue):
+        print(f"{m['video_id']}  comments={m['comment_count']:>7}  {m['published_at'][:10]}  {m['title'][:70]}")
+
+
+if __name__ == "__main__":
+    main()
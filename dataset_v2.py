@@ -0,0 +1,191 @@
+# dataset_v2.py
+# Compact in-memory representation of the scored comment dataset (WITH_SENT_CSV).
+#   comments  one row per comment: categorical domain / sentiment / video_id, float32 probabilities,
+#             int32 like_count / comment_length, datetime published_at, clean_text
+#   videos    one row per (video_id, domain): video_title, video_published_at — stored once instead
+#             of being repeated on every comment
+# Dtypes are applied by the CSV parser itself, so no float64 / object intermediate copy is built.
+# With mmap_text=True, clean_text is kept out of the frame: the texts are written once to a UTF-8
+# blob + offsets in RESULTS_DIR/compact/ (keyed by file size + mtime) and read back through a
+# memory map (TextStore). The frame then carries the CSV row number in ROW_COL, so text_of(df)
+# returns the right texts of any row subset (filtered, reordered or reset_index) either way.
+# Usage:
+#     python dataset_v2.py                  # compare resident memory: plain read_csv vs compact
+#     python dataset_v2.py --mmap_text
+
+from settings import RESULTS_DIR, WITH_SENT_CSV
+import argparse, json, os
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+SENTIMENT_ORDER = ["negative", "neutral", "positive"]
+EXTREME_THRESHOLD = 0.9            # prob_positive or prob_negative above this = "extreme" comment
+PROB_COLS = ["prob_positive", "prob_neutral", "prob_negative"]
+VIDEO_COLS = ["video_title", "video_published_at"]
+COMMENT_COLS = ["domain", "sentiment", "video_id", "published_at", "like_count"] + PROB_COLS
+TEXT_CACHE_DIR = RESULTS_DIR / "compact"
+CHUNK_ROWS = 200_000
+TEXT_ATTR = "text_store"      # df.attrs key holding the TextStore directory (mmap_text=True)
+ROW_COL = "text_row"          # row number in the source CSV = TextStore position (mmap_text=True)
+
+
+class TextStore:
+    """Read-only texts: one UTF-8 blob + int64 offsets, both memory-mapped."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.blob = np.load(self.root / "text.npy", mmap_mode="r")
+        self.offsets = np.load(self.root / "offsets.npy", mmap_mode="r")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def take(self, rows):
+        return [self[i] for i in rows]
+
+    @staticmethod
+    def build(texts_chunks, root):
+        """Write an iterable of text chunks; also stores per-text character lengths."""
+        root = Path(root)
+        root.mkdir(parents=True, exist_ok=True)
+        parts, offsets, lengths, pos = [], [0], [], 0
+        for texts in texts_chunks:
+            enc = [t.encode("utf-8") for t in texts]
+            sizes = np.fromiter((len(b) for b in enc), dtype=np.int64, count=len(enc))
+            offsets.append(pos + np.cumsum(sizes))
+            pos += int(sizes.sum())
+            lengths.append(np.fromiter((len(t) for t in texts), dtype=np.int32, count=len(texts)))
+            parts.append(b"".join(enc))
+        np.save(root / "text.npy", np.frombuffer(b"".join(parts), dtype=np.uint8))
+        np.save(root / "offsets.npy", np.concatenate([np.zeros(1, np.int64)] + offsets[1:]).astype(np.int64))
+        np.save(root / "lengths.npy", np.concatenate(lengths) if lengths else np.zeros(0, np.int32))
+        return TextStore(root)
+
+
+@lru_cache(maxsize=4)
+def open_store(root):
+    return TextStore(root)
+
+
+def text_of(df, rows=None):
+    """clean_text of df (or of the given index labels) as a Series, from the frame or the text store."""
+    idx = df.index if rows is None else pd.Index(rows)
+    if "clean_text" in df.columns:
+        return df.loc[idx, "clean_text"]
+    if ROW_COL not in df.columns:
+        raise ValueError(f"frame has neither clean_text nor {ROW_COL}; load it with load_compact(mmap_text=True)")
+    store = open_store(df.attrs[TEXT_ATTR])
+    return pd.Series(store.take(df.loc[idx, ROW_COL].to_numpy()), index=idx, dtype=object)
+
+
+def _signature(path):
+    st = os.stat(path)
+    return f"{Path(path).stem}-{st.st_size}-{st.st_mtime_ns}"
+
+
+def _text_store(path, chunksize=CHUNK_ROWS):
+    root = TEXT_CACHE_DIR / _signature(path)
+    if not (root / "lengths.npy").exists():
+        chunks = (c["clean_text"].fillna("").astype(str).tolist()
+                  for c in pd.read_csv(path, usecols=["clean_text"], chunksize=chunksize))
+        TextStore.build(chunks, root)
+        with open(root / "source.json", "w", encoding="utf-8") as f:
+            json.dump({"source": str(path)}, f)
+    return root
+
+
+def _finish_dtypes(df):
+    if "sentiment" in df.columns:
+        df["sentiment"] = df["sentiment"].cat.set_categories(SENTIMENT_ORDER)
+    if "like_count" in df.columns:
+        df["like_count"] = pd.to_numeric(df["like_count"], errors="coerce").fillna(0).astype("int32")
+    if "published_at" in df.columns:
+        df["published_at"] = pd.to_datetime(df["published_at"], errors="coerce", utc=True)
+
+
+def compact_frame(df):
+    """Same dtypes as load_compact for a frame that is already in memory (e.g. a sample)."""
+    df = df.copy()
+    for c in ["domain", "sentiment", "video_id"]:
+        if c in df.columns:
+            df[c] = df[c].astype("category")
+    for c in PROB_COLS:
+        if c in df.columns:
+            df[c] = df[c].astype("float32")
+    _finish_dtypes(df)
+    if "clean_text" in df.columns:
+        df["clean_text"] = df["clean_text"].fillna("").astype(str)
+        if "comment_length" not in df.columns:
+            df["comment_length"] = df["clean_text"].str.len()
+    if "comment_length" in df.columns:
+        df["comment_length"] = df["comment_length"].fillna(0).astype("int32")
+    return df
+
+
+def load_compact(path=WITH_SENT_CSV, mmap_text=False, keep_ids=False):
+    """→ (comments, videos). comments keeps the CSV row order (RangeIndex = row number)."""
+    header = pd.read_csv(path, nrows=0).columns
+    want = COMMENT_COLS + VIDEO_COLS + ["comment_length"] + (["comment_id"] if keep_ids else [])
+    if not mmap_text:
+        want.append("clean_text")
+    usecols = [c for c in want if c in header]
+    dtype = {"domain": "category", "sentiment": "category", "video_id": "category",
+             "video_title": "category", "video_published_at": "category", "comment_id": "string",
+             **{c: "float32" for c in PROB_COLS}}
+    df = pd.read_csv(path, usecols=usecols, dtype={k: v for k, v in dtype.items() if k in usecols})
+    _finish_dtypes(df)
+
+    if mmap_text:
+        root = _text_store(path)
+        df.attrs[TEXT_ATTR] = str(root)
+        df[ROW_COL] = np.arange(len(df), dtype=np.int64)
+        if "comment_length" not in df.columns:
+            df["comment_length"] = np.load(root / "lengths.npy")
+    else:
+        df["clean_text"] = df["clean_text"].fillna("").astype(str)
+        if "comment_length" not in df.columns:
+            df["comment_length"] = df["clean_text"].str.len()
+    df["comment_length"] = df["comment_length"].fillna(0).astype("int32")
+
+    vcols = [c for c in VIDEO_COLS if c in df.columns]
+    videos = pd.DataFrame(columns=["video_id", "domain"] + vcols)
+    if "video_id" in df.columns and vcols:
+        videos = (df[["video_id", "domain"] + vcols].drop_duplicates(["video_id", "domain"])
+                  .dropna(subset=["video_id"]).reset_index(drop=True))
+        for c in vcols:
+            videos[c] = videos[c].astype(str)
+        df = df.drop(columns=vcols)
+    return df, videos
+
+
+def deep_mb(df):
+    return df.memory_usage(deep=True).sum() / 2**20
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare plain vs compact loading of the scored comments")
+    parser.add_argument("--input", type=str, default=str(WITH_SENT_CSV))
+    parser.add_argument("--mmap_text", action="store_true")
+    args = parser.parse_args(argv)
+
+    plain = pd.read_csv(args.input)
+    base = deep_mb(plain)
+    del plain
+    df, videos = load_compact(args.input, mmap_text=args.mmap_text)
+    mb = deep_mb(df) + deep_mb(videos)
+    print(f"plain read_csv : {base:8.1f} MB")
+    print(f"compact        : {mb:8.1f} MB  (comments {deep_mb(df):.1f} + videos {deep_mb(videos):.1f}, "
+          f"{len(videos)} videos)  → {base / mb:.1f}x smaller")
+    if args.mmap_text:
+        store = open_store(df.attrs[TEXT_ATTR])
+        print(f"text store     : {store.blob.nbytes / 2**20:8.1f} MB mapped from {store.root}")
+
+
+if __name__ == "__main__":
+    main()
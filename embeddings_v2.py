@@ -0,0 +1,314 @@
+# embeddings_v2.py
+# Sentence embeddings from the sentiment model's forward pass + a local ANN index over them.
+#   vectors  bert_sentiment_inference_v2 --embeddings mean-pools RoBERTa's last hidden layer
+#            (attention-masked) in the same pass that produces the logits, and stores it as float16.
+#            RESULTS_DIR/embeddings/<output stem>.npy is aligned with the rows of the output CSV
+#            (row i ↔ CSV row i) and opened memory-mapped. Incremental runs reuse the vectors of
+#            texts embedded before. <output stem>.rows.json holds a hash of the CSV's clean_text
+#            column in row order; vectors that do not match the current CSV count as missing, so
+#            inference re-embeds those rows and the index / similar search refuse them.
+#   index    IVF. Mini-batch k-means (Sculley 2010) on L2-normalised vectors gives ~sqrt(n) centroids,
+#            and every row is filed under its nearest centroid. A query scans only the rows of the
+#            nprobe closest lists and ranks them by exact cosine similarity.
+#            → RESULTS_DIR/embeddings/<stem>_ivf/ (rebuilt when the vectors change)
+# MiniBatchKMeans (online, dense or sparse rows) is shared with topic_clusters_v2.
+# Usage:
+#     python bert_sentiment_inference_v2.py --embeddings
+#     python embeddings_v2.py index
+#     python embeddings_v2.py similar --row 1234 --k 10                  # comments like row 1234
+#     python embeddings_v2.py similar --comment_id Ugx... --domain steam
+#     python embeddings_v2.py similar --text "runs great on steam deck" --domain steam   # loads the model
+
+from settings import RESULTS_DIR, WITH_SENT_CSV
+import argparse, hashlib, json, os, time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+EMB_DIR = RESULTS_DIR / "embeddings"
+DTYPE = np.float16
+CHUNK_ROWS = 65_536           # rows normalised / assigned per step
+KMEANS_BATCH = 2048
+KMEANS_ITERS = 100
+TRAIN_ROWS = 100_000          # k-means training sample
+NPROBE = 8
+
+
+def vectors_path(output_csv=WITH_SENT_CSV):
+    return EMB_DIR / f"{Path(output_csv).stem}.npy"
+
+
+def fingerprint_path(output_csv=WITH_SENT_CSV):
+    return EMB_DIR / f"{Path(output_csv).stem}.rows.json"
+
+
+def text_fingerprint(texts):
+    """Order-sensitive hash of a clean_text column: changes if any row's text or position does."""
+    h = pd.util.hash_pandas_object(pd.Series(texts, dtype=object), index=False).to_numpy()
+    return hashlib.sha1(h.tobytes()).hexdigest()
+
+
+def _csv_texts(output_csv):
+    return pd.read_csv(output_csv, usecols=["clean_text"])["clean_text"].fillna("").astype(str).tolist()
+
+
+def open_vectors(output_csv=WITH_SENT_CSV, texts=None):
+    """(n_rows, dim) float16 memmap aligned with output_csv, or None if there are no vectors or
+    they belong to other rows. texts: clean_text per row of the CSV the vectors should match
+    (default: read from output_csv, skipped while the file is the one the vectors were written with)."""
+    path, fp_path = vectors_path(output_csv), fingerprint_path(output_csv)
+    if not (path.exists() and fp_path.exists()):
+        return None
+    vecs = np.load(path, mmap_mode="r")
+    with open(fp_path, encoding="utf-8") as f:
+        fp = json.load(f)
+    if fp["rows"] != len(vecs):
+        return None
+    if texts is None:
+        if not Path(output_csv).exists():
+            return None
+        if fp["csv"] == _signature(output_csv):
+            return vecs
+        texts = _csv_texts(output_csv)
+    return vecs if len(texts) == len(vecs) and text_fingerprint(texts) == fp["texts"] else None
+
+
+def write_aligned(output_csv, row_texts, new_vectors, prev_texts=None):
+    """Write the row-aligned vector file for output_csv.
+    row_texts: clean_text per output row; new_vectors: {text: vector} embedded in this run;
+    prev_texts: clean_text per row of the previous output, aligned with the existing vector file."""
+    prev = open_vectors(output_csv, prev_texts) if prev_texts is not None else None
+    prev_pos = {t: i for i, t in enumerate(prev_texts)} if prev is not None else {}
+    missing = [t for t in set(row_texts) if t not in new_vectors and t not in prev_pos]
+    if missing:
+        raise ValueError(f"{len(missing)} texts have no embedding (e.g. {missing[0][:60]!r})")
+    dim = len(next(iter(new_vectors.values()))) if new_vectors else prev.shape[1]
+
+    # per output row: index into the new vectors, or into the previous file (offset by n_new)
+    new_keys = list(new_vectors)
+    new_mat = np.asarray([new_vectors[t] for t in new_keys], dtype=DTYPE).reshape(-1, dim)
+    pos = {t: i for i, t in enumerate(new_keys)}
+    src = np.fromiter((pos[t] if t in pos else len(new_keys) + prev_pos[t] for t in row_texts),
+                      dtype=np.int64, count=len(row_texts))
+
+    path = vectors_path(output_csv)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.stem + ".tmp.npy")
+    out = np.lib.format.open_memmap(tmp, mode="w+", dtype=DTYPE, shape=(len(row_texts), dim))
+    for i in range(0, len(src), CHUNK_ROWS):
+        s = src[i:i + CHUNK_ROWS]
+        block = np.empty((len(s), dim), dtype=DTYPE)
+        is_new = s < len(new_keys)
+        block[is_new] = new_mat[s[is_new]]
+        if (~is_new).any():
+            block[~is_new] = prev[s[~is_new] - len(new_keys)]
+        out[i:i + len(s)] = block
+    out.flush()
+    del out, prev
+    os.replace(tmp, path)
+    with open(fingerprint_path(output_csv), "w", encoding="utf-8") as f:
+        json.dump({"rows": len(row_texts), "texts": text_fingerprint(row_texts),
+                   "csv": _signature(output_csv)}, f)
+    return path
+
+
+def embedded_texts(output_csv, prev_texts):
+    """Texts of the previous output that already have a vector (empty if the vectors are stale)."""
+    if prev_texts is None or open_vectors(output_csv, prev_texts) is None:
+        return set()
+    return set(prev_texts)
+
+
+# ---- mini-batch k-means ----------------------------------------------------
+
+def _normalize(x):
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+
+class MiniBatchKMeans:
+    """Sculley's mini-batch k-means with per-center counts (learning rate 1/count), usable online:
+    partial_fit() one batch at a time, predict() any time. Rows may be dense arrays or scipy
+    sparse matrices. spherical=True assumes L2-normalised rows, keeps centers unit-length and
+    assigns by cosine similarity."""
+
+    def __init__(self, k, seed=0, spherical=True, centers=None, counts=None):
+        self.k, self.spherical = k, spherical
+        self.rng = np.random.default_rng(seed)
+        self.centers = None if centers is None else np.asarray(centers, dtype=np.float32)
+        self.counts = None if counts is None else np.asarray(counts, dtype=np.int64)
+
+    def init(self, x):
+        self.k = min(self.k, x.shape[0])
+        pick = self.rng.choice(x.shape[0], self.k, replace=False)
+        self.centers = _dense(x[pick])
+        self.counts = np.zeros(self.k, dtype=np.int64)
+        return self
+
+    def _scores(self, x):
+        """Similarity per (row, center): cosine, or -squared distance."""
+        dots = np.asarray(x @ self.centers.T)
+        if self.spherical:
+            return dots
+        sq = np.asarray(x.multiply(x).sum(axis=1)).ravel() if hasattr(x, "multiply") else (x * x).sum(axis=1)
+        return 2 * dots - sq[:, None] - (self.centers * self.centers).sum(axis=1)[None, :]
+
+    def partial_fit(self, x):
+        if self.centers is None:
+            self.init(x)
+        assign = self._scores(x).argmax(axis=1)
+        for c in np.unique(assign):
+            mask = assign == c
+            n = int(mask.sum())
+            self.counts[c] += n
+            lr = n / self.counts[c]
+            self.centers[c] = (1 - lr) * self.centers[c] + lr * _dense(x[mask]).mean(axis=0)
+        if self.spherical:
+            self.centers = _normalize(self.centers)
+        return self
+
+    def predict(self, x):
+        """→ (center per row, its similarity score)."""
+        s = self._scores(x)
+        best = s.argmax(axis=1)
+        return best, s[np.arange(len(best)), best]
+
+
+def _dense(x):
+    return np.asarray(x.toarray() if hasattr(x, "toarray") else x, dtype=np.float32)
+
+
+def minibatch_kmeans(x, k, batch=KMEANS_BATCH, iters=KMEANS_ITERS, seed=0, spherical=True):
+    """Fit MiniBatchKMeans on random batches of the rows of x → (k, dim) centroids."""
+    x = np.asarray(x, dtype=np.float32)
+    km = MiniBatchKMeans(k, seed, spherical).init(x)
+    for _ in range(iters):
+        km.partial_fit(x[km.rng.integers(0, len(x), min(batch, len(x)))])
+    return km.centers
+
+
+def nearest(x, centers):
+    """Index of the closest center per row (squared euclidean; = cosine for unit vectors)."""
+    d = (x * x).sum(axis=1)[:, None] - 2 * x @ centers.T + (centers * centers).sum(axis=1)[None, :]
+    return d.argmin(axis=1)
+
+
+# ---- IVF index ---------------------------------------------------------------
+
+class IVFIndex:
+    def __init__(self, root):
+        self.root = Path(root)
+        self.centroids = np.load(self.root / "centroids.npy")
+        self.order = np.load(self.root / "order.npy", mmap_mode="r")
+        self.offsets = np.load(self.root / "offsets.npy")
+        with open(self.root / "meta.json", encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+    @staticmethod
+    def build(vectors, root, nlist=None, seed=0, source=None):
+        root = Path(root)
+        root.mkdir(parents=True, exist_ok=True)
+        n = len(vectors)
+        nlist = nlist or max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(seed)
+        train = np.sort(rng.choice(n, min(n, TRAIN_ROWS), replace=False))
+        centroids = minibatch_kmeans(_normalize(vectors[train]), nlist, seed=seed)
+        lists = np.concatenate([nearest(_normalize(vectors[i:i + CHUNK_ROWS]), centroids)
+                                for i in range(0, n, CHUNK_ROWS)])
+        order = np.argsort(lists, kind="stable")
+        offsets = np.searchsorted(lists[order], np.arange(len(centroids) + 1))
+        np.save(root / "centroids.npy", centroids)
+        np.save(root / "order.npy", order.astype(np.int64))
+        np.save(root / "offsets.npy", offsets.astype(np.int64))
+        with open(root / "meta.json", "w", encoding="utf-8") as f:
+            json.dump({"n": n, "dim": int(vectors.shape[1]), "nlist": len(centroids), "source": source}, f)
+        return IVFIndex(root)
+
+    def search(self, vectors, query, k=10, nprobe=NPROBE, allowed=None):
+        """Top-k rows by cosine similarity among the nprobe closest lists → (rows, scores).
+        allowed: optional boolean mask over rows (e.g. one domain)."""
+        q = _normalize(np.asarray(query).reshape(1, -1))[0]
+        probe = np.argsort(-(self.centroids @ q))[:nprobe]
+        cand = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in probe])
+        if allowed is not None:
+            cand = cand[allowed[cand]]
+        if len(cand) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        cand = np.sort(cand)                   # sequential reads from the memmap
+        sims = _normalize(vectors[cand]) @ q
+        top = np.argsort(-sims)[:k]
+        return cand[top], sims[top]
+
+
+def index_dir(output_csv=WITH_SENT_CSV):
+    return EMB_DIR / f"{Path(output_csv).stem}_ivf"
+
+
+def _signature(path):
+    st = os.stat(path)
+    return f"{st.st_size}-{st.st_mtime_ns}"
+
+
+def load_index(output_csv=WITH_SENT_CSV, rebuild=False, nlist=None):
+    """IVF index of the output's vectors, (re)built when missing or older than the vectors."""
+    vecs, root = open_vectors(output_csv), index_dir(output_csv)
+    if vecs is None:
+        raise SystemExit(f"No embeddings matching the rows of {output_csv} at {vectors_path(output_csv)}; "
+                         f"run bert_sentiment_inference_v2.py --embeddings first")
+    sig = _signature(vectors_path(output_csv))
+    if not rebuild and (root / "meta.json").exists():
+        idx = IVFIndex(root)
+        if idx.meta.get("source") == sig:
+            return vecs, idx
+    return vecs, IVFIndex.build(vecs, root, nlist=nlist, source=sig)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Embedding ANN index and similar-comment search")
+    parser.add_argument("--input", type=str, default=str(WITH_SENT_CSV), help="scored CSV the vectors belong to")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("index", help="(re)build the IVF index")
+    b.add_argument("--nlist", type=int, default=None)
+    s = sub.add_parser("similar", help="comments similar to a row / comment / text")
+    src = s.add_mutually_exclusive_group(required=True)
+    src.add_argument("--row", type=int)
+    src.add_argument("--comment_id", type=str)
+    src.add_argument("--text", type=str)
+    s.add_argument("--domain", type=str, default=None)
+    s.add_argument("--k", type=int, default=10)
+    s.add_argument("--nprobe", type=int, default=NPROBE)
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    if args.cmd == "index":
+        vecs, idx = load_index(args.input, rebuild=True, nlist=args.nlist)
+        print(f"IVF index: {len(vecs)} vectors, {idx.meta['nlist']} lists → {idx.root} "
+              f"({time.perf_counter() - t0:.1f}s)")
+        return
+
+    vecs, idx = load_index(args.input)
+    rows = pd.read_csv(args.input, usecols=["comment_id", "domain", "sentiment", "clean_text"],
+                       dtype={"comment_id": str})
+    if args.text is not None:
+        from bert_sentiment_inference_v2 import get_model
+        emb = []
+        get_model().score_texts([args.text], use_cache=False, embeddings=emb)
+        query, self_row = emb[0][0], None
+    else:
+        self_row = args.row if args.row is not None else \
+            int(np.flatnonzero(rows["comment_id"].to_numpy() == args.comment_id)[0])
+        query = vecs[self_row]
+        print(f"Query row {self_row} [{rows.at[self_row, 'domain']}/{rows.at[self_row, 'sentiment']}]: "
+              f"{rows.at[self_row, 'clean_text'][:120]}")
+    allowed = (rows["domain"] == args.domain).to_numpy() if args.domain else None
+    hits, sims = idx.search(vecs, query, args.k + 1, args.nprobe, allowed)
+    keep = hits != self_row
+    res = rows.iloc[hits[keep][:args.k]].assign(similarity=sims[keep][:args.k].round(3))
+    with pd.option_context("display.max_colwidth", 90, "display.width", 200):
+        print(res[["similarity", "domain", "sentiment", "clean_text"]].to_string())
+    print(f"({time.perf_counter() - t0:.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
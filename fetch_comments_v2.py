@@ -4,25 +4,29 @@
 - 每个视频最多 500 条（不足则拿多少算多少）
 - 直到该领域累计达到 TARGET_TOTAL（默认 20000）
 依赖: google-api-python-client python-dotenv pandas tqdm
-.env: YOUTUBE_API_KEY=xxxx
+.env: YOUTUBE_API_KEY=xxxx  或多 key 池 YOUTUBE_API_KEYS=key1,key2,...
+      （按剩余配额分配请求，quotaExceeded 时自动切换 key，见 youtube_client_v2.py）
 用法示例:
     python fetch_comments_v2.py --domain sneaker --target 20000
     python fetch_comments_v2.py --domain pharma  --target 20000
     python fetch_comments_v2.py --domain food    --target 20000
     python fetch_comments_v2.py --domain steam   --target 20000
+    python fetch_comments_v2.py --domain steam   --target 20000 --discovery frontier
+--discovery frontier: 搜索只做种子，之后沿频道 uploads 列表扩展（1 配额/50 视频），
+按 commentCount 优先抓取，已抓视频跨运行去重（见 crawl_frontier_v2.py）
 """
 
-import os, time, argparse
+import time, argparse
 from pathlib import Path
 from datetime import datetime, timezone
 
 import pandas as pd
-from dotenv import load_dotenv
 from tqdm import tqdm
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
 from settings import RAW_DIR  # 确保 settings.py 已设置 BASE_DATA_DIR=data2
+from pipeline_metrics_v2 import count_api_calls, stage, start_run
+from youtube_client_v2 import QuotaExhausted, build_pooled_client
 
 # --------- 参数与查询词预设 ---------
 PRESET_QUERIES = {
@@ -57,27 +61,28 @@ def this_year_utc_window():
 # -----------------------------------
 
 def build_youtube_client():
-    load_dotenv()
-    api_key = os.getenv("YOUTUBE_API_KEY")
-    if not api_key:
-        raise RuntimeError("Missing YOUTUBE_API_KEY in .env")
-    return build("youtube", "v3", developerKey=api_key)
+    # 单 key 或 key 池：用法与 googleapiclient 的 youtube 对象相同
+    return build_pooled_client()
 
 def search_videos_this_year(yt, query, pages=10, order="viewCount"):
     vids = []
     page_token = None
     published_after, published_before = this_year_utc_window()
     for _ in range(pages):
-        resp = yt.search().list(
-            q=query,
-            part="id",
-            type="video",
-            maxResults=50,
-            order=order,
-            publishedAfter=published_after,
-            publishedBefore=published_before,
-            pageToken=page_token
-        ).execute()
+        try:
+            resp = yt.search().list(
+                q=query,
+                part="id",
+                type="video",
+                maxResults=50,
+                order=order,
+                publishedAfter=published_after,
+                publishedBefore=published_before,
+                pageToken=page_token
+            ).execute()
+        except QuotaExhausted as e:
+            e.partial = vids  # 已翻到的页随停止信号交给调用方
+            raise
         for item in resp.get("items", []):
             vids.append(item["id"]["videoId"])
         page_token = resp.get("nextPageToken")
@@ -85,60 +90,91 @@ def search_videos_this_year(yt, query, pages=10, order="viewCount"):
             break
     return vids
 
-def fetch_comments_for_video(yt, video_id, per_video_limit=500, order_comments_by="relevance"):
-    """抓取单视频顶层评论（不展开回复），最多 per_video_limit 条。"""
-    rows, grabbed = [], 0
-    page_token = None
-    try:
-        vi = yt.videos().list(part="snippet", id=video_id).execute()
-        if not vi["items"]:
-            return rows
-        snippet = vi["items"][0]["snippet"]
-        video_title = snippet.get("title", "")
-        video_published_at = snippet.get("publishedAt", "")
-
-        while True:
-            resp = yt.commentThreads().list(
-                part="snippet",
-                videoId=video_id,
-                maxResults=100,
-                textFormat="plainText",
-                order=order_comments_by,   # "relevance" or "time"
-                pageToken=page_token
-            ).execute()
+def iter_comment_pages(yt, video_id, per_video_limit=500, order_comments_by="relevance", known=None):
+    """逐页产出单视频顶层评论（list[dict]，每页 ≤100 条），累计最多 per_video_limit 条。
+    known: callable(comment_ids) -> 已入库的 id 集合（comment_store_v2）。命中后整页仍产出（刷新点赞数），
+    然后停止翻页：time 排序下遇到第一条已知评论即停，relevance 排序下整页都已知才停。"""
+    vi = yt.videos().list(part="snippet", id=video_id).execute()
+    if not vi["items"]:
+        return
+    snippet = vi["items"][0]["snippet"]
+    video_title = snippet.get("title", "")
+    video_published_at = snippet.get("publishedAt", "")
+
+    grabbed, page_token = 0, None
+    while True:
+        resp = yt.commentThreads().list(
+            part="snippet",
+            videoId=video_id,
+            maxResults=100,
+            textFormat="plainText",
+            order=order_comments_by,   # "relevance" or "time"
+            pageToken=page_token
+        ).execute()
+
+        items = resp.get("items", [])
+        if not items and not page_token:
+            return  # 无评论或被关闭
+
+        page = []
+        for it in items[:per_video_limit - grabbed]:
+            top = it["snippet"]["topLevelComment"]["snippet"]
+            page.append({
+                "video_id": video_id,
+                "video_title": video_title,
+                "video_published_at": video_published_at,
+                "comment_id": it["snippet"]["topLevelComment"]["id"],
+                "published_at": top.get("publishedAt", ""),
+                "like_count": top.get("likeCount", 0),
+                "text": top.get("textDisplay", ""),
+                "domain": None,  # 调用处填
+            })
+        grabbed += len(page)
+        if page:
+            yield page
+        if grabbed >= per_video_limit:
+            return
+        if known is not None and page:
+            n_known = len(known([r["comment_id"] for r in page]))
+            if n_known and (order_comments_by == "time" or n_known == len(page)):
+                return
 
-            items = resp.get("items", [])
-            if not items and not page_token:
-                break  # 无评论或被关闭
-
-            for it in items:
-                top = it["snippet"]["topLevelComment"]["snippet"]
-                rows.append({
-                    "video_id": video_id,
-                    "video_title": video_title,
-                    "video_published_at": video_published_at,
-                    "comment_id": it["snippet"]["topLevelComment"]["id"],
-                    "published_at": top.get("publishedAt", ""),
-                    "like_count": top.get("likeCount", 0),
-                    "text": top.get("textDisplay", ""),
-                    "domain": None,  # 调用处填
-                })
-                grabbed += 1
-                if grabbed >= per_video_limit:
-                    return rows
-
-            page_token = resp.get("nextPageToken")
-            if not page_token:
-                break
+        page_token = resp.get("nextPageToken")
+        if not page_token:
+            return
 
+def fetch_comments_for_video(yt, video_id, per_video_limit=500, order_comments_by="relevance", known=None):
+    """抓取单视频顶层评论（不展开回复），最多 per_video_limit 条。"""
+    rows = []
+    try:
+        for page in iter_comment_pages(yt, video_id, per_video_limit, order_comments_by, known):
+            rows.extend(page)
+    except QuotaExhausted as e:
+        e.partial = rows  # 所有 key 都没配额了：已抓到的页随停止信号交给调用方
+        raise
     except HttpError as e:
-        # 常见: commentsDisabled / quotaExceeded
+        # 常见: commentsDisabled（quotaExceeded 已由 key 池切换处理）
         print(f"[skip] video {video_id} - {e}")
     except Exception as e:
         print(f"[skip] video {video_id} - {e}")
 
     return rows
 
+def score_rows(rows, score_url=None, score_unix=None):
+    """把一个视频的评论送到本地打分服务，原地补上 sentiment / prob_* 字段。"""
+    from clean_comments_v2 import clean_text
+    from sentiment_service_v2 import score_remote
+
+    texts = [clean_text(r["text"]) for r in rows]
+    try:
+        kwargs = {"unix_socket": score_unix} if score_unix else {"url": score_url}
+        results = score_remote(texts, **kwargs)
+    except Exception as e:
+        print(f"[score] skipped {len(rows)} rows - {e}")
+        return
+    for r, res in zip(rows, results):
+        r.update(res)
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--domain", type=str, required=True,
@@ -150,6 +186,15 @@ def main():
     parser.add_argument("--order_comments_by", type=str, default="relevance",
                         choices=["relevance","time"], help="评论排序")
     parser.add_argument("--sleep", type=float, default=0.2, help="每个视频之间 sleep 秒数")
+    parser.add_argument("--discovery", type=str, default="search", choices=["search", "frontier"],
+                        help="视频发现方式：search=仅搜索；frontier=搜索做种子 + 频道扩展 + 按评论数优先")
+    parser.add_argument("--store", action="store_true",
+                        help="写入持久评论库（comment_store_v2）：按 comment_id 跨运行去重/更新点赞，"
+                             "翻页遇到已入库评论即停，输出 CSV 为该领域全部历史评论")
+    parser.add_argument("--score_url", type=str, default=None,
+                        help="边抓边打分：sentiment_service_v2 的地址，如 http://127.0.0.1:8765")
+    parser.add_argument("--score_unix", type=str, default=None,
+                        help="边抓边打分：sentiment_service_v2 的 Unix socket 路径")
     args = parser.parse_args()
 
     domain = args.domain
@@ -159,47 +204,110 @@ def main():
     sleep_between_videos = args.sleep
     queries = PRESET_QUERIES[domain]
 
-    yt = build_youtube_client()
+    start_run(f"fetch_{domain}")  # 每阶段耗时 / API 调用 / 配额 → data2/results/metrics/
+    yt = count_api_calls(build_youtube_client())
     out_file = RAW_DIR / f"{domain}_comments_raw.csv"
     out_file.parent.mkdir(parents=True, exist_ok=True)
 
+    store = None
+    if args.store:
+        from comment_store_v2 import CommentStore
+        store = CommentStore()
+
     # 1) 汇总“本年热门”视频列表
-    video_ids = []
-    for q in queries:
-        video_ids.extend(
-            search_videos_this_year(yt, q, pages=args.pages, order="viewCount")
-        )
-    # 去重并保持顺序
-    seen = set(); uniq_ids = []
-    for vid in video_ids:
-        if vid not in seen:
-            uniq_ids.append(vid); seen.add(vid)
-    print(f"[{domain}] Candidate videos (this year): {len(uniq_ids)}")
+    frontier = None
+    if args.discovery == "frontier":
+        from crawl_frontier_v2 import CrawlFrontier
+
+        frontier = CrawlFrontier.load(domain, per_video_limit=per_video_limit,
+                                      published_after=this_year_utc_window()[0])
+        # 惰性产出：边抓边扩展，发现阶段的配额记在 frontier_refill 阶段
+        uniq_ids = frontier.iter_videos(yt, queries)
+        print(f"[{domain}] Frontier: {frontier.summary()}")
+    else:
+        with stage("search") as st:
+            video_ids, quota_out = [], False
+            for q in queries:
+                try:
+                    found = search_videos_this_year(yt, q, pages=args.pages, order="viewCount")
+                except QuotaExhausted as e:
+                    # 搜索阶段配额用尽：保留已搜到的视频，不再抓评论（抓取同样需要配额）
+                    print(f"[{domain}] 搜索时配额用尽 - {e}")
+                    found, quota_out = e.partial, True
+                video_ids.extend(found)
+                if store is not None:
+                    store.add_sources(found, domain, q)  # 记录每个视频来自哪个领域/查询
+                if quota_out:
+                    break
+            # 去重并保持顺序
+            seen = set(); uniq_ids = []
+            for vid in video_ids:
+                if vid not in seen:
+                    uniq_ids.append(vid); seen.add(vid)
+            st.rows_out = len(uniq_ids)
+        print(f"[{domain}] Candidate videos (this year): {len(uniq_ids)}")
+        if quota_out:
+            uniq_ids = []
 
     # 2) 逐视频抓取评论
     all_rows = []
-    for vid in tqdm(uniq_ids, desc=f"Fetching {domain} comments"):
-        rows = fetch_comments_for_video(
-            yt, vid, per_video_limit=per_video_limit, order_comments_by=order_comments_by
-        )
+    n_stored = 0
+
+    def keep(vid, rows):
+        nonlocal n_stored
         # 填充 domain 字段
         for r in rows:
             r["domain"] = domain
+        # 先打分再入库：分数随评论存进 store 并由 export 带出
+        if rows and (args.score_url or args.score_unix):
+            score_rows(rows, args.score_url, args.score_unix)
+
+        if store is not None:
+            if frontier is not None:
+                store.add_sources([vid], domain, "frontier")
+            n_new, _ = store.upsert(rows)
+            n_stored += n_new
 
         if rows:
             all_rows.extend(rows)
 
-        # 断点保存（每 ~5000 条）
-        if len(all_rows) >= 5000 and len(all_rows) % 5000 < 1000:
-            pd.DataFrame(all_rows).drop_duplicates(
-                subset=["video_id","comment_id"]
-            ).to_csv(out_file, index=False)
+    with stage("fetch", rows_in=None if frontier else len(uniq_ids)) as st:
+        try:
+            for vid in tqdm(uniq_ids, desc=f"Fetching {domain} comments"):
+                rows = fetch_comments_for_video(
+                    yt, vid, per_video_limit=per_video_limit, order_comments_by=order_comments_by,
+                    known=store.known if store is not None else None
+                )
+                keep(vid, rows)
+                if frontier is not None:
+                    frontier.mark_done(vid)
 
-        if len(all_rows) >= target_total:
-            break
+                # 断点保存（每 ~5000 条）
+                if len(all_rows) >= 5000 and len(all_rows) % 5000 < 1000:
+                    pd.DataFrame(all_rows).drop_duplicates(
+                        subset=["video_id","comment_id"]
+                    ).to_csv(out_file, index=False)
+
+                if len(all_rows) >= target_total:
+                    break
 
-        time.sleep(sleep_between_videos)
+                time.sleep(sleep_between_videos)
+        except QuotaExhausted as e:
+            # 当前视频已抓到的页也保存（不 mark_done：下次运行重抓该视频）
+            if getattr(e, "partial", None):
+                keep(vid, e.partial)
+            print(f"[{domain}] 配额用尽，保存已抓取部分 - {e}")
+        st.rows_out = len(all_rows)
+    if frontier is not None:
+        frontier.save()
+        print(f"[{domain}] Frontier: {frontier.summary()}")
 
+    if store is not None:
+        # 输出该领域的全部入库评论（历次运行合并），而不是只有本次抓到的
+        df = store.export(domain, out_file)
+        store.close()
+        print(f"[{domain}] {n_stored} new comments this run; saved {len(df)} rows from the store → {out_file}")
+        return
     df = pd.DataFrame(all_rows).drop_duplicates(subset=["video_id","comment_id"])
     df.to_csv(out_file, index=False)
     print(f"[{domain}] Saved {len(df)} rows → {out_file}")
@@ -0,0 +1,110 @@
+# figure_jobs_v2.py
+# Figure rendering as a list of independent jobs.
+# A job is (output path, module-level render function, small precomputed payload). Jobs are
+# rendered across a process pool with the non-interactive Agg backend, and a job is skipped when
+# the hash of its function + payload matches the last render of the same file (manifest in the
+# output directory), so unchanged domains cost nothing on re-runs. The function part covers the
+# renderer's name and the source file of its module, so editing a renderer (or a helper next to
+# it) re-renders its figures.
+
+import hashlib, inspect, json, os, pickle
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+MANIFEST_NAME = ".render_manifest.json"
+
+
+@dataclass
+class FigureJob:
+    path: Path
+    func: object                 # module-level callable(path, **data) so it pickles by reference
+    data: dict = field(default_factory=dict)
+
+    def digest(self):
+        # qualname, not module name: the same renderer is "__main__" when its script runs standalone
+        h = hashlib.sha1(self.func.__qualname__.encode())
+        h.update(_source_digest(inspect.getfile(self.func)))
+        for k in sorted(self.data):
+            h.update(k.encode())
+            _update_hash(h, self.data[k])
+        return h.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def _source_digest(path):
+    return hashlib.sha1(Path(path).read_bytes()).digest()
+
+
+def _update_hash(h, v):
+    if isinstance(v, np.ndarray):
+        h.update(str(v.dtype).encode() + str(v.shape).encode())
+        h.update(np.ascontiguousarray(v).tobytes())
+    elif isinstance(v, dict):
+        for k in sorted(v, key=str):
+            h.update(str(k).encode())
+            _update_hash(h, v[k])
+    elif isinstance(v, (list, tuple)):
+        for x in v:
+            _update_hash(h, x)
+    elif hasattr(v, "to_numpy"):        # pandas objects: values + labels
+        _update_hash(h, v.to_numpy())
+        _update_hash(h, [str(x) for x in getattr(v, "index", [])])
+    else:
+        h.update(pickle.dumps(v))
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def _render(job):
+    import matplotlib.pyplot as plt
+
+    job.func(job.path, **job.data)
+    plt.close("all")
+    return str(job.path)
+
+
+def _load_manifest(path):
+    if path.exists():
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def render_jobs(jobs, workers=None, force=False):
+    """Render jobs whose inputs changed since the last run. Returns (rendered, skipped) counts."""
+    by_dir = {}
+    for job in jobs:
+        by_dir.setdefault(Path(job.path).parent, []).append(job)
+
+    todo, digests, manifests = [], {}, {}
+    for d, dir_jobs in by_dir.items():
+        manifests[d] = _load_manifest(d / MANIFEST_NAME)
+        for job in dir_jobs:
+            key = Path(job.path).name
+            digests[job.path] = job.digest()
+            if force or manifests[d].get(key) != digests[job.path] or not Path(job.path).exists():
+                todo.append(job)
+
+    if todo:
+        workers = workers or min(len(todo), os.cpu_count() or 1)
+        if workers <= 1:
+            _init_worker()
+            for j in todo:
+                _render(j)
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                list(pool.map(_render, todo, chunksize=1))
+        for job in todo:
+            d = Path(job.path).parent
+            manifests[d][Path(job.path).name] = digests[job.path]
+        for d, m in manifests.items():
+            with open(d / MANIFEST_NAME, "w", encoding="utf-8") as f:
+                json.dump(m, f, indent=1, sort_keys=True)
+    return len(todo), len(jobs) - len(todo)
@@ -0,0 +1,145 @@
+# keyword_stats_v2.py
+# Keyword statistics for domain × sentiment groups.
+# The corpus is tokenized once (vectorized str.findall, optionally chunked over a process pool)
+# into a sparse group × term count matrix plus per-term document frequencies. Rankings:
+#   frequency  raw counts (what top_words used to return)
+#   tfidf      counts × comment-level idf
+#   log_odds   log-odds ratio vs. all other groups with an informative Dirichlet prior
+#              (Monroe et al. 2008), z-scored — words distinctive for the group
+# The same counts feed the wordclouds in analyze_domain_profiles_v2.
+# Usage:
+#     python keyword_stats_v2.py --method log_odds --k 20
+
+from settings import RESULTS_DIR, WITH_SENT_CSV
+import argparse, os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from dataset_v2 import text_of
+
+WORD_PAT = r"[A-Za-z']+"
+STOP = set("""the and is it to a of for in on with this that was are be you your from have not but can just when how why what who which its they them as at if so do we're i'm i've it's don't can't""".split())
+MIN_LEN = 3
+CHUNK_ROWS = 200_000
+PRIOR_PSEUDOCOUNTS = 1000.0      # total Dirichlet prior mass for log_odds, spread by background frequency
+METHODS = ("frequency", "tfidf", "log_odds")
+
+
+def _tokenize_chunk(args):
+    start, texts = args
+    toks = pd.Series(texts, dtype="object").fillna("").astype(str).str.lower().str.findall(WORD_PAT).explode().dropna()
+    toks = toks[(toks.str.len() >= MIN_LEN) & ~toks.isin(STOP)]
+    return toks.index.to_numpy() + start, toks.to_numpy(dtype=object)
+
+
+def tokenize_corpus(texts, workers=1):
+    """→ (row index per token, token array). workers > 1 tokenizes chunks in a process pool."""
+    texts = list(texts)
+    chunks = [(s, texts[s:s + CHUNK_ROWS]) for s in range(0, len(texts), CHUNK_ROWS)]
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_tokenize_chunk, chunks))
+    else:
+        parts = [_tokenize_chunk(c) for c in chunks]
+    if not parts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=object)
+    return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+
+class KeywordStats:
+    """counts: CSR (n_groups × n_terms); doc_freq: comments containing each term."""
+
+    def __init__(self, counts, doc_freq, n_docs, vocab, groups):
+        self.counts = counts
+        self.doc_freq = doc_freq
+        self.n_docs = n_docs
+        self.vocab = vocab
+        self.groups = groups
+
+    @classmethod
+    def build(cls, df, by=("domain", "sentiment"), workers=1):
+        by = list(by)
+        rows, toks = tokenize_corpus(text_of(df), workers)
+        term, vocab = pd.factorize(toks)
+        keys = df[by].astype(str)
+        grp_codes, groups = pd.MultiIndex.from_frame(keys).factorize()
+        n_groups, n_terms = len(groups), len(vocab)
+        counts = sp.csr_matrix((np.ones(len(term), dtype=np.int64), (grp_codes[rows], term)),
+                               shape=(n_groups, n_terms))
+        pair = np.unique(rows.astype(np.int64) * max(n_terms, 1) + term)
+        doc_freq = np.bincount(pair % max(n_terms, 1), minlength=n_terms)
+        return cls(counts, doc_freq, len(df), np.asarray(vocab, dtype=object), groups)
+
+    def _row(self, key):
+        key = tuple(str(k) for k in (key if isinstance(key, tuple) else (key,)))
+        try:
+            return self.groups.get_loc(key)
+        except KeyError:
+            return None
+
+    def scores(self, key, method="frequency"):
+        """Per-term score vector for one group (None if the group has no tokens)."""
+        i = self._row(key)
+        if i is None:
+            return None
+        y = np.asarray(self.counts[i].todense()).ravel().astype(float)
+        if method == "frequency":
+            return y
+        if method == "tfidf":
+            idf = np.log((1.0 + self.n_docs) / (1.0 + self.doc_freq)) + 1.0
+            return y * idf
+        if method == "log_odds":
+            total = np.asarray(self.counts.sum(axis=0)).ravel().astype(float)
+            alpha = PRIOR_PSEUDOCOUNTS * total / max(total.sum(), 1.0)
+            a0 = alpha.sum()
+            rest = total - y
+            n_i, n_j = y.sum(), rest.sum()
+            delta = (np.log((y + alpha) / (n_i + a0 - y - alpha))
+                     - np.log((rest + alpha) / (n_j + a0 - rest - alpha)))
+            return delta / np.sqrt(1.0 / (y + alpha) + 1.0 / (rest + alpha))
+        raise ValueError(f"Unknown method {method!r}; choose from {METHODS}")
+
+    def top(self, key, k=15, method="frequency"):
+        """[(word, score)] — counts are ints for 'frequency', like Counter.most_common."""
+        s = self.scores(key, method)
+        if s is None:
+            return []
+        y = np.asarray(self.counts[self._row(key)].todense()).ravel()
+        cand = np.flatnonzero(y > 0)
+        order = cand[np.lexsort((self.vocab[cand].astype(str), -s[cand]))][:k]
+        if method == "frequency":
+            return [(self.vocab[j], int(y[j])) for j in order]
+        return [(self.vocab[j], round(float(s[j]), 3)) for j in order]
+
+    def wordcloud_freqs(self, key, k=15, method="frequency"):
+        """Positive weights for WordCloud.generate_from_frequencies."""
+        return {w: max(float(v), 1e-6) for w, v in self.top(key, k, method)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Distinctive keywords per domain × sentiment")
+    parser.add_argument("--input", type=str, default=str(WITH_SENT_CSV))
+    parser.add_argument("--method", type=str, default="log_odds", choices=METHODS)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--out", type=str, default=None)
+    args = parser.parse_args(argv)
+
+    df = pd.read_csv(args.input, usecols=["domain", "sentiment", "clean_text"]).dropna(subset=["domain", "sentiment"])
+    stats = KeywordStats.build(df, workers=args.workers)
+    rows = []
+    for dom, sent in stats.groups:
+        kws = stats.top((dom, sent), args.k, args.method)
+        print(f"[{dom} / {sent}]", ", ".join(w for w, _ in kws))
+        rows += [{"domain": dom, "sentiment": sent, "rank": r + 1, "word": w, "score": v}
+                 for r, (w, v) in enumerate(kws)]
+    out = args.out or RESULTS_DIR / f"keywords_{args.method}.csv"
+    pd.DataFrame(rows).to_csv(out, index=False)
+    print(f"Saved → {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,8 @@
 from settings import PROCESSED_DIR, MERGED_CSV
 import pandas as pd
 
+from pipeline_metrics_v2 import stage, start_run
+
 FILES = [
     "sneaker_comments_clean.csv",
     "pharma_comments_clean.csv",
@@ -11,17 +13,21 @@ FILES = [
     "steam_review_comments_clean.csv",
 ]
 
-dfs = []
-for name in FILES:
-    path = PROCESSED_DIR / name
-    df = pd.read_csv(path)
-    # ensure domain exists
-    if "domain" not in df.columns:
-        raise ValueError(f"Missing domain column in {path}")
-    dfs.append(df)
+start_run("merge")
+with stage("merge") as st:
+    dfs = []
+    for name in FILES:
+        path = PROCESSED_DIR / name
+        df = pd.read_csv(path)
+        # ensure domain exists
+        if "domain" not in df.columns:
+            raise ValueError(f"Missing domain column in {path}")
+        dfs.append(df)
 
-merged = pd.concat(dfs, ignore_index=True)
-if "published_at" in merged.columns:
-    merged["published_at"] = pd.to_datetime(merged["published_at"], errors="coerce")
-merged.to_csv(MERGED_CSV, index=False)
-print(f"Merged {len(merged)} rows → {MERGED_CSV}")
+    st.rows_in = sum(len(d) for d in dfs)
+    merged = pd.concat(dfs, ignore_index=True)
+    if "published_at" in merged.columns:
+        merged["published_at"] = pd.to_datetime(merged["published_at"], errors="coerce")
+    merged.to_csv(MERGED_CSV, index=False)
+    st.rows_out = len(merged)
+    print(f"Merged {len(merged)} rows → {MERGED_CSV}")
@@ -0,0 +1,257 @@
+# pipeline_metrics_v2.py
+# Stage-level instrumentation shared by the fetch / clean / merge / inference / analysis scripts.
+# Each `with stage("name") as st:` block records wall time, CPU time (process, all threads),
+# rows in / out (set st.rows_in / st.rows_out), RSS at the end, the process peak RSS, and the
+# YouTube API calls + quota units issued inside it (count_api_calls wraps the API client).
+# start_run() makes a run the current one and writes its report at exit:
+#   RESULTS_DIR/metrics/<run>_<timestamp>.json  + a human summary on stdout
+# Profiling per stage: PIPELINE_PROFILE=cprofile (→ .prof files, top functions in the summary)
+# or PIPELINE_PROFILE=pyinstrument (→ .html, if pyinstrument is installed).
+# Without start_run(), stages are recorded into a silent default run (no report, ~µs overhead).
+# Usage:
+#     PIPELINE_PROFILE=cprofile python bert_sentiment_inference_v2.py
+#     python pipeline_metrics_v2.py                  # summarize the latest report of every run
+
+from settings import RESULTS_DIR
+import atexit, cProfile, io, json, os, pstats, sys, time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import resource          # Unix only
+except ImportError:
+    resource = None
+
+METRICS_DIR = RESULTS_DIR / "metrics"
+PROFILE_ENV = "PIPELINE_PROFILE"
+# YouTube Data API v3 quota cost per call; every method not listed costs 1 unit
+QUOTA_COST = {"search.list": 100}
+PROFILE_TOP = 8
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024.0     # bytes on macOS, KiB on Linux
+
+
+class Stage:
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.api_calls = {}
+        self.quota_units = 0
+        self.wall_s = self.cpu_s = 0.0
+        self.rss_mb = self.peak_rss_mb = None
+        self.profile = None
+        self.profile_top = []
+
+    def api(self, method, n=1):
+        self.api_calls[method] = self.api_calls.get(method, 0) + n
+        self.quota_units += QUOTA_COST.get(method, 1) * n
+
+    def as_dict(self):
+        d = {k: v for k, v in vars(self).items() if k != "profile_top"}
+        d["rows_per_s"] = round(self.rows_out / self.wall_s, 1) if self.rows_out and self.wall_s else None
+        return d
+
+
+class RunMetrics:
+    def __init__(self, name, profile=None):
+        self.name = name
+        self.profile = profile if profile is not None else os.getenv(PROFILE_ENV) or None
+        self.started = datetime.now()
+        self.stages = []
+        self.extra = {}              # run-level details from other modules (e.g. per-key API usage)
+        self._active = []
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        st = Stage(name, rows_in)
+        prof = self._start_profile() if not self._active else None   # profilers do not nest
+        self._active.append(st)
+        w0, c0 = time.perf_counter(), time.process_time()
+        try:
+            yield st
+        finally:
+            st.wall_s = round(time.perf_counter() - w0, 4)
+            st.cpu_s = round(time.process_time() - c0, 4)
+            st.rss_mb, st.peak_rss_mb = _rss_mb(), _peak_rss_mb()
+            self._active.pop()
+            if prof is not None:
+                self._stop_profile(prof, st)
+            for outer in self._active:                  # nested API calls count for the parents too
+                for m, n in st.api_calls.items():
+                    outer.api_calls[m] = outer.api_calls.get(m, 0) + n
+                outer.quota_units += st.quota_units
+            self.stages.append(st)
+
+    def api(self, method, n=1):
+        """Record n API calls on the innermost active stage (or an implicit 'api' stage)."""
+        if self._active:
+            self._active[-1].api(method, n)
+        else:
+            st = Stage("api")
+            st.api(method, n)
+            self.stages.append(st)
+
+    # ---- profiling
+    def _start_profile(self):
+        if self.profile == "cprofile":
+            p = cProfile.Profile()
+            p.enable()
+            return p
+        if self.profile == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                print("[metrics] pyinstrument not installed; profiling disabled")
+                self.profile = None
+                return None
+            p = Profiler()
+            p.start()
+            return p
+        return None
+
+    def _stop_profile(self, prof, st):
+        METRICS_DIR.mkdir(parents=True, exist_ok=True)
+        base = METRICS_DIR / f"{self.name}_{self.started:%Y%m%d-%H%M%S}_{st.name}"
+        if isinstance(prof, cProfile.Profile):
+            prof.disable()
+            prof.dump_stats(base.with_suffix(".prof"))
+            st.profile = str(base.with_suffix(".prof"))
+            buf = io.StringIO()
+            pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(PROFILE_TOP)
+            st.profile_top = [l.strip() for l in buf.getvalue().splitlines() if l.strip()[:1].isdigit()]
+        else:
+            prof.stop()
+            base.with_suffix(".html").write_text(prof.output_html(), encoding="utf-8")
+            st.profile = str(base.with_suffix(".html"))
+
+    # ---- report
+    def report(self, out_dir=METRICS_DIR, quiet=False):
+        if not self.stages:
+            return None
+        out_dir.mkdir(parents=True, exist_ok=True)
+        path = out_dir / f"{self.name}_{self.started:%Y%m%d-%H%M%S}.json"
+        data = {"run": self.name, "started": self.started.isoformat(timespec="seconds"),
+                "argv": sys.argv, "profile": self.profile,
+                "stages": [s.as_dict() for s in self.stages], **self.extra}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1)
+        if not quiet:
+            print(summarize(data))
+            for s in self.stages:
+                if s.profile_top:
+                    print(f"\n[profile {s.name}] top {PROFILE_TOP} by cumulative time → {s.profile}")
+                    print("\n".join("  " + l for l in s.profile_top))
+            print(f"Metrics → {path}")
+        return path
+
+
+def summarize(data):
+    """Human-readable table for a report dict."""
+    head = f"{'stage':<22}{'wall s':>9}{'cpu s':>9}{'cpu%':>6}{'rows in':>10}{'rows out':>10}{'rows/s':>10}{'rss MB':>8}{'api':>6}{'quota':>7}"
+    lines = [f"\n=== {data['run']} ({data['started']}) ===", head, "-" * len(head)]
+    for s in data["stages"]:
+        cpu_pct = 100 * s["cpu_s"] / s["wall_s"] if s["wall_s"] else 0
+        fmt = lambda v, spec: "-" if v is None else format(v, spec)
+        lines.append(f"{s['name'][:21]:<22}{s['wall_s']:>9.2f}{s['cpu_s']:>9.2f}{cpu_pct:>6.0f}"
+                     f"{fmt(s['rows_in'], 'd'):>10}{fmt(s['rows_out'], 'd'):>10}{fmt(s['rows_per_s'], '.0f'):>10}"
+                     f"{fmt(s['rss_mb'], '.0f'):>8}{sum(s['api_calls'].values()):>6}{s['quota_units']:>7}")
+    return "\n".join(lines)
+
+
+# ---- module-level current run --------------------------------------------
+
+_RUN = RunMetrics("default", profile="")
+
+
+def start_run(name, profile=None, report_at_exit=True):
+    """Make a new run current; its report is written when the process exits."""
+    global _RUN
+    _RUN = RunMetrics(name, profile)
+    if report_at_exit:
+        atexit.register(_RUN.report)
+    return _RUN
+
+
+def current():
+    return _RUN
+
+
+def stage(name, rows_in=None):
+    return _RUN.stage(name, rows_in)
+
+
+def record_api(method, n=1):
+    _RUN.api(method, n)
+
+
+class _CountingRequest:
+    def __init__(self, request, method, run):
+        self._request, self._method, self._run = request, method, run
+
+    def execute(self, *args, **kwargs):
+        self._run.api(self._method)
+        return self._request.execute(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._request, name)
+
+
+class _CountingResource:
+    def __init__(self, resource, name, run):
+        self._resource, self._name, self._run = resource, name, run
+
+    def __getattr__(self, attr):
+        fn = getattr(self._resource, attr)
+        method = f"{self._name}.{attr}"
+        return lambda *a, **kw: _CountingRequest(fn(*a, **kw), method, self._run)
+
+
+class count_api_calls:
+    """Wrap a googleapiclient client: yt.search().list(...).execute() is counted as
+    'search.list' (with its quota cost) on the run's active stage."""
+
+    def __init__(self, client, run=None):
+        self._client, self._run = client, run
+
+    def __getattr__(self, name):
+        fn = getattr(self._client, name)
+        return lambda *a, **kw: _CountingResource(fn(*a, **kw), name, self._run or _RUN)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarize pipeline metric reports")
+    parser.add_argument("--dir", type=str, default=str(METRICS_DIR))
+    parser.add_argument("--all", action="store_true", help="every report, not just the latest per run")
+    args = parser.parse_args(argv)
+
+    latest = {}
+    for p in sorted(Path(args.dir).glob("*.json")):
+        with open(p, encoding="utf-8") as f:
+            data = json.load(f)
+        if args.all:
+            print(summarize(data))
+        else:
+            latest[data["run"]] = data
+    for data in latest.values():
+        print(summarize(data))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# plot_summaries_v2.py
+# Plot from small summaries instead of raw rows.
+# Means, box statistics and histogram counts are computed with vectorized group-bys (or read from
+# aggregate_cube_v2 histograms), and the figures are drawn from those few numbers, so drawing
+# cost no longer grows with the number of comments.
+
+import numpy as np
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+MAX_FLIERS = 200   # outliers drawn per box (most extreme first); the rest are not plotted
+
+
+# ---- Summaries ------------------------------------------------------------
+
+def box_stats(df, value, by):
+    """Matplotlib bxp() stats per group: median, quartiles, 1.5·IQR whiskers, capped fliers.
+    Returns {group: stats_dict}."""
+    g = df.groupby(by, observed=True)[value]
+    q = g.quantile([0.25, 0.5, 0.75]).unstack()
+    iqr = q[0.75] - q[0.25]
+    lo_lim = (q[0.25] - 1.5 * iqr).rename("lo_lim")
+    hi_lim = (q[0.75] + 1.5 * iqr).rename("hi_lim")
+    lims = df[[by, value]].join(lo_lim, on=by).join(hi_lim, on=by)
+    inside = lims[(lims[value] >= lims["lo_lim"]) & (lims[value] <= lims["hi_lim"])]
+    whislo = inside.groupby(by, observed=True)[value].min()
+    whishi = inside.groupby(by, observed=True)[value].max()
+    outside = lims[(lims[value] < lims["lo_lim"]) | (lims[value] > lims["hi_lim"])]
+
+    stats = {}
+    for key in q.index:
+        out = outside.loc[outside[by] == key, value]
+        if len(out) > MAX_FLIERS:
+            far = (out - q.loc[key, 0.5]).abs().nlargest(MAX_FLIERS).index
+            out = out.loc[far]
+        stats[key] = {"med": q.loc[key, 0.5], "q1": q.loc[key, 0.25], "q3": q.loc[key, 0.75],
+                      "whislo": whislo.get(key, q.loc[key, 0.25]), "whishi": whishi.get(key, q.loc[key, 0.75]),
+                      "fliers": out.to_numpy(), "label": str(key)}
+    return stats
+
+
+def hist_counts(values, bins=30, value_range=(0.0, 1.0)):
+    counts, edges = np.histogram(np.asarray(values, dtype=float), bins=bins, range=value_range)
+    return counts, edges
+
+
+# ---- Drawing --------------------------------------------------------------
+
+def bar_from_means(means, x, hue, y, order, hue_order, ax=None):
+    """Grouped bar chart (like sns.barplot(..., errorbar=None)) from a means table indexed by
+    (x, hue); only len(order) × len(hue_order) values reach seaborn."""
+    long = means[y].rename(y).reset_index()
+    ax = ax or plt.gca()
+    sns.barplot(data=long, x=x, y=y, hue=hue, order=order, hue_order=hue_order, errorbar=None, ax=ax)
+    return ax
+
+
+def boxplot_from_stats(stats, order, ylabel=None, ax=None):
+    ax = ax or plt.gca()
+    present = [s for s in order if s in stats]
+    colors = sns.color_palette(n_colors=len(order))
+    arts = ax.bxp([stats[s] for s in present], positions=[order.index(s) for s in present],
+                  patch_artist=True, showfliers=True, widths=0.8)
+    for patch, s in zip(arts["boxes"], present):
+        patch.set_facecolor(colors[order.index(s)])
+    ax.set_xticks(range(len(order)))
+    ax.set_xticklabels(order)
+    ax.set_xlim(-0.5, len(order) - 0.5)
+    if ylabel:
+        ax.set_ylabel(ylabel)
+    return ax
+
+
+def hist_from_counts(counts, edges, label=None, alpha=0.6, ax=None):
+    ax = ax or plt.gca()
+    ax.stairs(counts, edges, fill=True, alpha=alpha, label=label)
+    ax.set_ylabel("Count")
+    return ax
@@ -0,0 +1,183 @@
+# sampling_v2.py
+# Quick-look mode: a reproducible stratified sample drawn in one streaming pass, plus stratified
+# confidence intervals for the domain × sentiment proportions and the extreme rate.
+#   strata     (domain, video_id, month of published_at)
+#   sampling   bottom-k per stratum. Each row gets a priority from a keyed hash of its comment_id,
+#              and the k lowest priorities of every stratum are kept while the CSV is read in chunks.
+#              The same seed gives the same sample whatever the chunk size or row order, and memory
+#              stays at sample + one chunk. Small strata are kept whole; large videos are capped at k.
+#   weights    sample_weight = N_h / m_h (stratum size / sampled rows). Estimates are weighted, and
+#              var = Σ (N_h/N_d)² (1 - m_h/N_h) s_h²/m_h (finite-population correction, so fully
+#              kept strata add no error).
+# The sample carries its stratum columns and weights, so the CIs can be recomputed from a saved
+# sample file alone.
+# Used by:
+#     python bert_sentiment_inference_v2.py --sample 10     # score only the sample → *_sample.csv
+#     python analysis_engine_v2.py --sample 10               # reports on the sample, weighted tables
+#     python sampling_v2.py --per_stratum 10 --compare       # CIs vs the full-data values
+
+from settings import WITH_SENT_CSV
+import argparse, time
+from functools import cached_property
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from analysis_engine_v2 import Aggregates
+from dataset_v2 import EXTREME_THRESHOLD, SENTIMENT_ORDER, compact_frame
+
+STRATA = ["domain", "video_id", "month"]
+PER_STRATUM = 10
+SEED = 42
+CHUNK_ROWS = 200_000
+Z = 1.96                      # 95% normal interval
+WEIGHT_COL = "sample_weight"
+
+
+def _priority(chunk, seed):
+    key = chunk["comment_id"] if "comment_id" in chunk.columns else \
+        chunk["video_id"].astype(str) + chunk["clean_text"].astype(str)
+    h = pd.util.hash_pandas_object(key.astype(str), index=False, hash_key=f"{seed:016d}"[-16:])
+    return h.to_numpy() >> np.uint64(11)          # 53 bits: exact in float64, order preserved
+
+
+def _strata(chunk):
+    month = chunk["published_at"].astype(str).str[:7] if "published_at" in chunk.columns else "NA"
+    return chunk.assign(month=month).fillna({"video_id": "NA", "month": "NA"})
+
+
+def stratified_sample(path, per_stratum=PER_STRATUM, seed=SEED, chunksize=CHUNK_ROWS):
+    """One chunked pass over path → sample frame with STRATA columns, stratum_n and sample_weight."""
+    if per_stratum < 2:
+        raise ValueError("per_stratum must be >= 2 (stratum variances need two rows)")
+    keep, sizes = None, None
+    for chunk in pd.read_csv(path, chunksize=chunksize, dtype={"video_id": str, "comment_id": str}):
+        chunk = _strata(chunk.dropna(subset=["domain"]))
+        chunk["_prio"] = _priority(chunk, seed)
+        n = chunk.groupby(STRATA, sort=False).size()
+        sizes = n if sizes is None else sizes.add(n, fill_value=0)
+        pool = chunk if keep is None else pd.concat([keep, chunk], ignore_index=True)
+        keep = pool.sort_values("_prio", kind="stable").groupby(STRATA, sort=False).head(per_stratum)
+    if keep is None:
+        raise SystemExit(f"No rows in {path}")
+    sample = keep.drop(columns="_prio").sort_index().reset_index(drop=True)
+    m = sample.groupby(STRATA, sort=False)["domain"].transform("size")
+    sample["stratum_n"] = sizes.astype("int64").reindex(pd.MultiIndex.from_frame(sample[STRATA])).to_numpy()
+    sample[WEIGHT_COL] = sample["stratum_n"] / m
+    return sample
+
+
+def estimate(sample, indicator, by="domain"):
+    """Weighted proportion of a 0/1 indicator per `by` group with a stratified 95% CI."""
+    d = sample[STRATA + ["stratum_n"]].assign(y=np.asarray(indicator, dtype=float))
+    g = d.groupby(STRATA, sort=False, observed=True).agg(N=("stratum_n", "first"), m=("y", "size"), p=("y", "mean"))
+    g = g.reset_index()
+    s2 = np.where(g["m"] > 1, g["p"] * (1 - g["p"]) * g["m"] / (g["m"] - 1).clip(lower=1), 0.0)
+    g["wp"] = g["N"] * g["p"]
+    g["var_part"] = g["N"] ** 2 * (1 - g["m"] / g["N"]) * s2 / g["m"]
+    agg = g.groupby(by, observed=True).agg(N=("N", "sum"), n_sample=("m", "sum"),
+                                           wp=("wp", "sum"), var=("var_part", "sum"))
+    out = pd.DataFrame({"estimate": agg["wp"] / agg["N"], "n_sample": agg["n_sample"], "N": agg["N"]})
+    out["se"] = np.sqrt(agg["var"]) / agg["N"]
+    out["lo"] = (out["estimate"] - Z * out["se"]).clip(lower=0)
+    out["hi"] = (out["estimate"] + Z * out["se"]).clip(upper=1)
+    return out
+
+
+def crosstab_ci(sample):
+    """Proportions of crosstab(domain, sentiment) with CIs, long format."""
+    parts = [estimate(sample, sample["sentiment"] == s).assign(sentiment=s) for s in SENTIMENT_ORDER]
+    return pd.concat(parts).reset_index().set_index(["domain", "sentiment"]).sort_index()
+
+
+def extreme_rate_ci(sample, threshold=EXTREME_THRESHOLD):
+    ext = (sample["prob_positive"] > threshold) | (sample["prob_negative"] > threshold)
+    return estimate(sample, ext)
+
+
+def print_ci(sample):
+    fmt = lambda t: t[["estimate", "lo", "hi", "se", "n_sample", "N"]].round(4).to_string()
+    print(f"Sample: {len(sample)} rows from {int(sample.groupby(STRATA, observed=True)['stratum_n'].first().sum())} "
+          f"({sample.groupby(STRATA, observed=True).ngroups} strata)")
+    if "sentiment" in sample.columns:
+        print("\nSentiment proportions (95% CI)\n" + fmt(crosstab_ci(sample)))
+    if {"prob_positive", "prob_negative"}.issubset(sample.columns):
+        print(f"\nExtreme rate (p > {EXTREME_THRESHOLD}, 95% CI)\n" + fmt(extreme_rate_ci(sample)))
+
+
+class SampleAggregates(Aggregates):
+    """Aggregates of a weighted sample: the tables estimate the full data (weighted counts are
+    population estimates), so the reports' proportions and extreme rates are unbiased. Row-level
+    plots (histograms, word clouds) stay unweighted, and a chi-square test on these counts treats
+    estimates as observations (optimistic p-value); use the CIs from print_ci instead."""
+
+    @property
+    def _w(self):
+        return self.df[WEIGHT_COL]
+
+    def _wsum(self, keys):
+        return self._w.groupby([self.df[k] for k in keys], observed=True).sum()
+
+    @cached_property
+    def counts(self):
+        tab = self._wsum(["domain", "sentiment"]).unstack(fill_value=0).round().astype(int)
+        return tab.reindex(columns=SENTIMENT_ORDER, fill_value=0)
+
+    @cached_property
+    def proportions(self):
+        return self.counts.div(self.counts.sum(axis=1), axis=0)
+
+    @cached_property
+    def extreme_rate(self):
+        return (self.extreme * self._w).groupby(self.df["domain"], observed=True).sum() / self._wsum(["domain"])
+
+    @cached_property
+    def means(self):
+        cols = [c for c in ["like_count", "comment_length"] if c in self.df.columns]
+        wx = self.df[cols].mul(self._w, axis=0)
+        keys = [self.df["domain"], self.df["sentiment"]]
+        return wx.groupby(keys, observed=True).sum().div(self._wsum(["domain", "sentiment"]), axis=0)
+
+    @cached_property
+    def monthly(self):
+        df = self.df.dropna(subset=["published_at"])
+        month = df["published_at"].dt.tz_localize(None).dt.to_period("M").astype(str).rename("month")
+        w = df[WEIGHT_COL].groupby([month, df["domain"], df["sentiment"]], observed=True).sum()
+        return w.round().astype(int).rename("count").reset_index()
+
+
+def load_sample(path=WITH_SENT_CSV, per_stratum=PER_STRATUM, seed=SEED):
+    """Sample in the analysis dtypes (dataset_v2) → (df, SampleAggregates)."""
+    df = compact_frame(stratified_sample(path, per_stratum, seed))
+    return df, SampleAggregates(df)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stratified quick-look sample with confidence intervals")
+    parser.add_argument("--input", type=str, default=str(WITH_SENT_CSV))
+    parser.add_argument("--per_stratum", type=int, default=PER_STRATUM)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--out", type=str, default=None, help="also write the sample CSV")
+    parser.add_argument("--compare", action="store_true", help="full-data values next to the CIs")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    sample = stratified_sample(Path(args.input), args.per_stratum, args.seed)
+    print(f"Sampled in {time.perf_counter() - t0:.2f}s")
+    print_ci(sample)
+    if args.out:
+        sample.to_csv(args.out, index=False)
+        print(f"Sample → {args.out}")
+    if args.compare:
+        full = pd.read_csv(args.input, usecols=["domain", "sentiment", "prob_positive", "prob_negative"])
+        ci = crosstab_ci(sample)
+        truth = pd.crosstab(full["domain"], full["sentiment"], normalize="index").stack()
+        ci["full"] = truth.reindex(ci.index)
+        ci["covered"] = ci["full"].between(ci["lo"], ci["hi"])
+        print("\nFull-data proportions vs CI\n" + ci[["estimate", "lo", "hi", "full", "covered"]].round(4).to_string())
+        print(f"coverage: {ci['covered'].mean():.0%} of {len(ci)} cells")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+# sentiment_service_v2.py
+# Local sentiment scoring service: loads the RoBERTa model once and answers scoring requests
+# over HTTP (TCP or a Unix socket). Concurrent requests are coalesced into micro-batches:
+# a batch is flushed when it reaches --max_batch texts or when the oldest request has waited
+# --max_wait_ms, whichever comes first. No model call gets more than --max_batch texts: a larger
+# request (or the request that overshoots the batch) is scored in max_batch chunks.
+#
+#   POST /score   {"texts": ["love it", "trash"]}
+#              → {"results": [{"sentiment": ..., "prob_positive": ..., "prob_neutral": ..., "prob_negative": ...}, ...]}
+#   GET  /health  → {"status": "ok", "batches": ..., "texts": ...}
+#
+# Usage:
+#     python sentiment_service_v2.py serve --port 8765
+#     python sentiment_service_v2.py serve --unix /tmp/sentiment.sock --max_batch 64 --max_wait_ms 20
+#     python sentiment_service_v2.py bench --waits 0 5 10 20 50 --clients 16      # offline, synthetic model
+#     python sentiment_service_v2.py bench --real --waits 5 20                      # offline, real model
+# Client:
+#     from sentiment_service_v2 import score_remote
+#     score_remote(["love it"], url="http://127.0.0.1:8765")
+
+from settings import MERGED_CSV, RESULTS_DIR
+import argparse, http.client, json, os, queue, socket, socketserver, threading, time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+
+from bert_sentiment_inference_v2 import BATCH_SIZE, SENT_COLS
+
+MAX_WAIT_MS = 10
+DEFAULT_PORT = 8765
+
+
+class MicroBatcher:
+    """Collects submitted text lists and scores them together, at most max_batch texts per model
+    call. score_fn(list[str]) must return a DataFrame with SENT_COLS, one row per text."""
+
+    def __init__(self, score_fn, max_batch=BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.score_fn = score_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.q = queue.Queue()
+        self.n_batches = 0
+        self.n_texts = 0
+        self.batch_sizes = []
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, texts):
+        fut = Future()
+        self.q.put((list(texts), fut))
+        return fut
+
+    def score(self, texts, timeout=None):
+        return self.submit(texts).result(timeout)
+
+    def _collect(self):
+        items = [self.q.get()]
+        n = len(items[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while n < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.q.get(timeout=remaining)
+            except queue.Empty:
+                break
+            items.append(item)
+            n += len(item[0])
+        return items
+
+    def _loop(self):
+        while True:
+            items = self._collect()
+            texts = [t for ts, _ in items for t in ts]
+            chunks = [texts[i:i + self.max_batch] for i in range(0, len(texts), self.max_batch)]
+            try:
+                records = [r for c in chunks for r in self.score_fn(c)[SENT_COLS].to_dict("records")]
+            except Exception as e:
+                for _, fut in items:
+                    fut.set_exception(e)
+                continue
+            self.n_batches += len(chunks)
+            self.n_texts += len(texts)
+            self.batch_sizes.extend(len(c) for c in chunks)
+            pos = 0
+            for ts, fut in items:
+                fut.set_result(records[pos:pos + len(ts)])
+                pos += len(ts)
+
+
+def model_score_fn(model_name=None, max_len=None, max_batch=BATCH_SIZE):
+    from bert_sentiment_inference_v2 import MODEL_NAME, MAX_LEN, get_model
+
+    model = get_model(model_name or MODEL_NAME, max_len or MAX_LEN)
+    return lambda texts: model.score_texts(texts, batch_size=max_batch, use_cache=False)
+
+
+class ScoreHandler(BaseHTTPRequestHandler):
+    batcher = None  # set by make_server
+
+    def _send(self, code, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self._send(404, {"error": "not found"})
+        b = self.batcher
+        self._send(200, {"status": "ok", "batches": b.n_batches, "texts": b.n_texts})
+
+    def do_POST(self):
+        if self.path != "/score":
+            return self._send(404, {"error": "not found"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            texts = json.loads(self.rfile.read(length) or b"{}").get("texts")
+            if not isinstance(texts, list):
+                raise ValueError("body must be {\"texts\": [...]}")
+        except ValueError as e:
+            return self._send(400, {"error": str(e)})
+        try:
+            results = self.batcher.score([str(t) for t in texts])
+        except Exception as e:
+            return self._send(500, {"error": str(e)})
+        self._send(200, {"results": results})
+
+    def address_string(self):
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(batcher, host="127.0.0.1", port=DEFAULT_PORT, unix_socket=None):
+    handler = type("BoundScoreHandler", (ScoreHandler,), {"batcher": batcher})
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.unlink(unix_socket)
+        return ThreadingUnixHTTPServer(unix_socket, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+# ---- client -------------------------------------------------------------
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=60):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+def score_remote(texts, url=f"http://127.0.0.1:{DEFAULT_PORT}", unix_socket=None, timeout=60):
+    """Score texts against a running service → list of dicts with SENT_COLS."""
+    if unix_socket:
+        conn = _UnixHTTPConnection(unix_socket, timeout=timeout)
+    else:
+        u = urlparse(url)
+        conn = http.client.HTTPConnection(u.hostname, u.port or 80, timeout=timeout)
+    try:
+        conn.request("POST", "/score", body=json.dumps({"texts": list(texts)}),
+                     headers={"Content-Type": "application/json"})
+        resp = conn.getresponse()
+        payload = json.loads(resp.read())
+    finally:
+        conn.close()
+    if resp.status != 200:
+        raise RuntimeError(f"scoring service error {resp.status}: {payload.get('error')}")
+    return payload["results"]
+
+
+# ---- offline micro-batching benchmark ------------------------------------
+
+def synthetic_score_fn(fixed_ms=15.0, per_text_ms=1.0):
+    """Stand-in for the model: fixed per-call overhead plus a per-text cost."""
+    def score(texts):
+        time.sleep((fixed_ms + per_text_ms * len(texts)) / 1000.0)
+        return pd.DataFrame({"sentiment": ["neutral"] * len(texts), "prob_positive": 1 / 3,
+                             "prob_neutral": 1 / 3, "prob_negative": 1 / 3})
+    return score
+
+
+def bench_window(score_fn, texts, max_batch, max_wait_ms, clients, requests_per_client):
+    """Fire single-text requests from `clients` threads; return latency/throughput stats."""
+    batcher = MicroBatcher(score_fn, max_batch=max_batch, max_wait_ms=max_wait_ms)
+    latencies = []
+    lock = threading.Lock()
+
+    def client(cid):
+        rng = np.random.default_rng(cid)
+        for _ in range(requests_per_client):
+            t = texts[int(rng.integers(len(texts)))]
+            t0 = time.perf_counter()
+            batcher.score([t])
+            with lock:
+                latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    wall = time.perf_counter() - t0
+    lat = np.asarray(latencies) * 1000.0
+    return {"max_batch": max_batch, "max_wait_ms": max_wait_ms, "clients": clients,
+            "requests": len(lat), "throughput_per_s": round(len(lat) / wall, 1),
+            "latency_p50_ms": round(float(np.percentile(lat, 50)), 2),
+            "latency_p99_ms": round(float(np.percentile(lat, 99)), 2),
+            "mean_batch": round(float(np.mean(batcher.batch_sizes)), 2)}
+
+
+def run_bench(args):
+    if args.real:
+        from bert_sentiment_inference_v2 import load_texts
+        texts = load_texts(MERGED_CSV)["clean_text"].head(2000).tolist()
+        score_fn = model_score_fn(max_batch=args.max_batch)
+    else:
+        texts = ["placeholder comment"]
+        score_fn = synthetic_score_fn(args.fixed_ms, args.per_text_ms)
+    rows = [bench_window(score_fn, texts, args.max_batch, w, args.clients, args.requests)
+            for w in args.waits]
+    table = pd.DataFrame(rows)
+    print(table.to_string(index=False))
+    if args.out:
+        table.to_csv(args.out, index=False)
+        print(f"Saved → {args.out}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local sentiment scoring service with micro-batching")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("serve")
+    p.add_argument("--host", type=str, default="127.0.0.1")
+    p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p.add_argument("--unix", type=str, default=None, help="listen on a Unix socket instead of TCP")
+    p.add_argument("--max_batch", type=int, default=BATCH_SIZE)
+    p.add_argument("--max_wait_ms", type=float, default=MAX_WAIT_MS)
+
+    b = sub.add_parser("bench")
+    b.add_argument("--waits", type=float, nargs="+", default=[0, 2, 5, 10, 20, 50])
+    b.add_argument("--max_batch", type=int, default=BATCH_SIZE)
+    b.add_argument("--clients", type=int, default=16)
+    b.add_argument("--requests", type=int, default=50, help="requests per client")
+    b.add_argument("--real", action="store_true", help="use the real model instead of the synthetic cost model")
+    b.add_argument("--fixed_ms", type=float, default=15.0)
+    b.add_argument("--per_text_ms", type=float, default=1.0)
+    b.add_argument("--out", type=str, default=str(RESULTS_DIR / "microbatch_bench.csv"))
+    args = parser.parse_args(argv)
+
+    if args.cmd == "bench":
+        return run_bench(args)
+
+    batcher = MicroBatcher(model_score_fn(max_batch=args.max_batch), max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    server = make_server(batcher, args.host, args.port, args.unix)
+    where = args.unix or f"http://{args.host}:{args.port}"
+    print(f"Sentiment service listening on {where} (max_batch={args.max_batch}, max_wait_ms={args.max_wait_ms})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.unix and os.path.exists(args.unix):
+            os.unlink(args.unix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# sentiment_timeseries_v2.py
+# Time-series sentiment rollups for drift monitoring.
+# Daily / weekly / monthly rollups (per domain or per video) are small group-bys over the
+# aggregate cube (aggregate_cube_v2). The cube is fed the newly scored rows by
+# bert_sentiment_inference_v2 --cube (or stream_pipeline_v2 --cube) while they are in memory, so
+# 'update' only re-rolls the cube cells and does not read the comment CSV. 'update --ingest'
+# instead runs aggregate_cube_v2.update_from_csv, one full pass over the scored CSV, for a cube
+# that is not kept up by inference.
+# Per period: comment counts and shares per sentiment, mean prob_positive/neutral/negative and
+# net sentiment (share positive − share negative). On top of a rollup:
+#   rolling      trailing-window shares / mean probabilities (window sums, then ratios)
+#   change points two-sided CUSUM on standardized net sentiment per group
+# Files: RESULTS_DIR/timeseries/<freq>_<by>.csv, figures_v2/timeseries/*.png
+# Usage:
+#     python sentiment_timeseries_v2.py update                        # re-roll the cube → rollup files
+#     python sentiment_timeseries_v2.py update --ingest               # full CSV pass into the cube first
+#     python sentiment_timeseries_v2.py show --freq week --window 4
+#     python sentiment_timeseries_v2.py changes --freq day --by domain
+#     python sentiment_timeseries_v2.py plot --freq month
+
+from settings import RESULTS_DIR, FIG_DIR, WITH_SENT_CSV
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import aggregate_cube_v2
+from dataset_v2 import SENTIMENT_ORDER
+
+TS_DIR = RESULTS_DIR / "timeseries"
+OUTPUT_DIR = FIG_DIR / "timeseries"
+FREQS = {"day": "D", "week": "W-SUN", "month": "M"}
+LEVELS = ("domain", "video_id")
+CUSUM_DRIFT = 0.5       # slack k, in standard deviations
+CUSUM_THRESHOLD = 5.0   # alarm level h, in standard deviations
+
+
+def rollup(cube, freq="day", by="domain"):
+    """Counts, shares and mean probabilities per (by, period). period = period start date."""
+    dated = cube[cube["day"] != ""]
+    period = pd.to_datetime(dated["day"]).dt.to_period(FREQS[freq]).dt.start_time.rename("period")
+    g = dated.groupby([dated[by], period])
+    out = g[["n", "pos_sum", "neu_sum", "neg_sum"]].sum()
+    per_sent = (dated.groupby([dated[by], period, "sentiment"])["n"].sum()
+                     .unstack("sentiment", fill_value=0).reindex(columns=SENTIMENT_ORDER, fill_value=0))
+    for s in SENTIMENT_ORDER:
+        out[f"n_{s}"] = per_sent[s]
+    return _ratios(out)
+
+
+def _ratios(t):
+    """Shares / means / net sentiment from the additive columns (works on window sums too)."""
+    n = t["n"].where(t["n"] > 0)
+    for s in SENTIMENT_ORDER:
+        t[f"share_{s}"] = t[f"n_{s}"] / n
+    for short, col in [("pos", "prob_positive"), ("neu", "prob_neutral"), ("neg", "prob_negative")]:
+        t[f"mean_{col}"] = t[f"{short}_sum"] / n
+    t["net_sentiment"] = t["share_positive"] - t["share_negative"]
+    return t
+
+
+ADDITIVE = ["n", "pos_sum", "neu_sum", "neg_sum"] + [f"n_{s}" for s in SENTIMENT_ORDER]
+
+
+def _fill_periods(roll, freq):
+    """Reindex each group onto a gap-free period range (empty periods have n = 0)."""
+    parts = []
+    for key, g in roll[ADDITIVE].groupby(level=0):
+        g = g.droplevel(0)
+        full = pd.period_range(g.index.min(), g.index.max(), freq=FREQS[freq]).start_time
+        g = g.reindex(full, fill_value=0)
+        g.index.name = "period"
+        parts.append(pd.concat({key: g}, names=[roll.index.names[0]]))
+    return pd.concat(parts) if parts else roll[ADDITIVE].iloc[:0]
+
+
+def rolling(roll, window=7, freq="day"):
+    """Trailing `window`-period shares and mean probabilities per group."""
+    filled = _fill_periods(roll, freq)
+    sums = (filled.groupby(level=0, group_keys=False)
+                  .apply(lambda g: g.rolling(window, min_periods=1).sum()))
+    return _ratios(sums)
+
+
+def change_points(roll, freq="day", drift=CUSUM_DRIFT, threshold=CUSUM_THRESHOLD, min_n=20):
+    """Two-sided CUSUM over net sentiment per group. Periods with fewer than min_n comments are
+    skipped. Returns one row per alarm: group, period, direction, net_sentiment, baseline."""
+    rows = []
+    for key, g in roll.groupby(level=0):
+        g = g.droplevel(0)
+        g = g[g["n"] >= min_n]
+        x = g["net_sentiment"].to_numpy(dtype=float)
+        if len(x) < 3:
+            continue
+        mu = np.average(x, weights=g["n"])
+        sd = x.std(ddof=1) or 1.0
+        z = (x - mu) / sd
+        hi = lo = 0.0
+        for period, zi, xi in zip(g.index, z, x):
+            hi, lo = max(0.0, hi + zi - drift), min(0.0, lo + zi + drift)
+            if hi > threshold or lo < -threshold:
+                rows.append({roll.index.names[0]: key, "period": period,
+                             "direction": "up" if hi > threshold else "down",
+                             "net_sentiment": round(xi, 4), "baseline": round(mu, 4)})
+                hi = lo = 0.0
+    return pd.DataFrame(rows)
+
+
+def write_rollups(cube, out_dir=TS_DIR):
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for freq in FREQS:
+        for by in LEVELS:
+            rollup(cube, freq, by).to_csv(out_dir / f"{freq}_{by}.csv")
+
+
+def update(path=None):
+    """Refresh the rollup files from the cube. With path, first ingest new or changed rows of
+    that scored CSV (a full pass over it); otherwise the cube is used as inference left it."""
+    n = 0
+    if path is not None:
+        cube, n = aggregate_cube_v2.update_from_csv(path)
+    else:
+        cube = _load_cube()
+    if cube is not None:
+        write_rollups(cube)
+    return cube, n
+
+
+def _load_cube():
+    cube = aggregate_cube_v2.load_cube()
+    if cube is None:
+        raise SystemExit(f"No cube at {aggregate_cube_v2.CUBE_CSV}; run 'update --ingest' (or inference with --cube) first")
+    return cube
+
+
+def plot(roll, freq, by="domain", out_dir=OUTPUT_DIR):
+    """Count of every sentiment over time, one panel per group (domain level)."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    long = (roll[[f"n_{s}" for s in SENTIMENT_ORDER]]
+            .rename(columns=lambda c: c[2:]).stack().rename("count").reset_index()
+            .rename(columns={"level_2": "sentiment"}))
+    sns.set(style="whitegrid", font_scale=1.0)
+    g = sns.relplot(data=long, x="period", y="count", hue="sentiment", hue_order=SENTIMENT_ORDER,
+                    col=by, col_wrap=2, kind="line", marker="o", height=3.2, aspect=1.6,
+                    facet_kws={"sharey": False})
+    for ax in g.axes.flat:
+        ax.tick_params(axis="x", labelrotation=45)
+    g.fig.suptitle(f"{freq.capitalize()}ly sentiment counts by {by}", y=1.02)
+    path = out_dir / f"{freq}_{by}_sentiment_counts.png"
+    g.savefig(path, dpi=200, bbox_inches="tight")
+    plt.close("all")
+
+    plt.figure(figsize=(10, 5))
+    sns.lineplot(data=roll["net_sentiment"].reset_index(), x="period", y="net_sentiment", hue=by, marker="o")
+    plt.axhline(0, color="grey", lw=0.8)
+    plt.xticks(rotation=45)
+    plt.title(f"{freq.capitalize()}ly net sentiment (share positive − share negative)")
+    plt.tight_layout()
+    plt.savefig(out_dir / f"{freq}_{by}_net_sentiment.png", dpi=200)
+    plt.close()
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Daily / weekly / monthly sentiment rollups from the aggregate cube")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    u = sub.add_parser("update")
+    u.add_argument("--ingest", action="store_true", help="first ingest --input into the cube (full CSV pass)")
+    u.add_argument("--input", type=str, default=str(WITH_SENT_CSV))
+    for name in ("show", "changes", "plot"):
+        p = sub.add_parser(name)
+        p.add_argument("--freq", type=str, default="month" if name == "plot" else "day", choices=list(FREQS))
+        p.add_argument("--by", type=str, default="domain", choices=LEVELS)
+        p.add_argument("--window", type=int, default=7)
+        p.add_argument("--threshold", type=float, default=CUSUM_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "update":
+        cube, n = update(Path(args.input) if args.ingest else None)
+        print(f"{f'Ingested {n} new or changed rows; ' if args.ingest else ''}rollups → {TS_DIR}")
+        return
+
+    roll = rollup(_load_cube(), args.freq, args.by)
+    if args.cmd == "show":
+        cols = ["n", "share_positive", "share_negative", "net_sentiment", "mean_prob_positive"]
+        print(f"Latest {args.freq}s:\n", roll.groupby(level=0).tail(3)[cols].round(3))
+        last = rolling(roll, args.window, args.freq).groupby(level=0).tail(1)
+        print(f"\nTrailing {args.window}-{args.freq} window:\n", last[cols].round(3))
+    elif args.cmd == "changes":
+        cps = change_points(roll, args.freq, threshold=args.threshold)
+        print(cps.to_string(index=False) if len(cps) else "No change points.")
+    else:
+        print(f"Saved → {plot(roll, args.freq, args.by)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,28 @@
-import pandas as pd
 from settings import WITH_SENT_CSV, FIG_DIR
+from pathlib import Path
 
-df = pd.read_csv(WITH_SENT_CSV)
-prop = pd.crosstab(df["domain"], df["sentiment"], normalize="index").round(3)
-prop.to_csv(FIG_DIR / "cross_domain" / "sentiment_proportions_table.csv")
+NEEDS_ROWS = False  # only uses agg tables, so it can run from the aggregate cube or --streaming
 
-ext = ((df["prob_positive"]>0.9)|(df["prob_negative"]>0.9)).groupby(df["domain"]).mean().round(3)
-ext.to_csv(FIG_DIR / "cross_domain" / "extreme_rate_table.csv")
+
+def run(df, agg, fig_dir=FIG_DIR / "cross_domain"):
+    fig_dir = Path(fig_dir)
+    fig_dir.mkdir(parents=True, exist_ok=True)
+    prop = agg.proportions.round(3)
+    prop.to_csv(fig_dir / "sentiment_proportions_table.csv")
+
+    ext = agg.extreme_rate.round(3)
+    ext.to_csv(fig_dir / "extreme_rate_table.csv")
+
+
+if __name__ == "__main__":
+    import sys
+    from analysis_engine_v2 import Aggregates, load_dataset
+    if "--from_cube" in sys.argv:
+        from aggregate_cube_v2 import require_cube
+        run(None, Aggregates(cube=require_cube()))
+    elif "--streaming" in sys.argv:
+        from streaming_stats_v2 import StreamingAggregates
+        run(None, StreamingAggregates.from_path(WITH_SENT_CSV))
+    else:
+        df = load_dataset(WITH_SENT_CSV)
+        run(df, Aggregates(df))
@@ -0,0 +1,322 @@
+# stream_pipeline_v2.py
+# Streaming fetch → clean → score → write, instead of four sequential batch scripts.
+# Stages are threads connected by bounded queues (back-pressure: a slow scorer throttles the
+# fetchers instead of buffering the whole crawl in memory):
+#   fetchers (N)  comment pages per video (fetch_comments_v2.iter_comment_pages)
+#   cleaner       clean_text, drop empty, dedupe (video_id, comment_id), including rows already in
+#                 the output CSV from earlier runs, so a rerun appends only new comments
+#   scorer        micro-batches of up to --batch_size rows (or whatever arrived within --max_wait_ms)
+#                 → local model (bert_sentiment_inference_v2, optional cascade) or sentiment_service_v2
+#   writer        appends scored rows to the output CSV after every batch (+ aggregate cube with --cube)
+# Network waits in the fetchers overlap with scoring, and a comment is on disk with its sentiment
+# seconds after its page was fetched. With --target the fetchers stop requesting pages once the
+# rows fetched (minus those the cleaner dropped) cover the target plus FETCH_LOOKAHEAD, so quota
+# is not spent on pages that would only be discarded.
+# Output: data2/processed/<domain>_stream_scored.csv (same columns as WITH_SENT_CSV)
+# Usage:
+#     python stream_pipeline_v2.py --domain steam --target 5000
+#     python stream_pipeline_v2.py --domain food --videos jokAXdH2IQ0 Of1pYnNRz68 --order_comments_by time
+#     python stream_pipeline_v2.py --domain steam --score_url http://127.0.0.1:8765 --cube
+
+from settings import PROCESSED_DIR
+import argparse, queue, threading, time
+from pathlib import Path
+
+import pandas as pd
+
+from pipeline_metrics_v2 import count_api_calls, stage, start_run
+from youtube_client_v2 import QuotaExhausted
+
+QUEUE_PAGES = 64          # fetched pages waiting to be cleaned
+QUEUE_ROWS = 4096         # cleaned rows waiting to be scored
+QUEUE_BATCHES = 16        # scored batches waiting to be written
+BATCH_SIZE = 64
+MAX_WAIT_MS = 500
+FETCH_WORKERS = 4
+FETCH_LOOKAHEAD = 200     # rows fetched beyond --target while earlier pages are still being cleaned
+OUT_COLS = ["video_id", "video_title", "video_published_at", "comment_id", "published_at", "like_count",
+            "clean_text", "comment_length", "domain",
+            "sentiment", "prob_positive", "prob_neutral", "prob_negative", "sentiment_stage"]
+_DONE = object()
+
+
+class StreamPipeline:
+    """Wire fetch → clean → score → write with bounded queues; run() blocks until the video list
+    is exhausted, `target` rows were written or the API quota ran out (stats["quota_exhausted"])."""
+
+    def __init__(self, yt, domain, score_fn, out_csv, per_video_limit=500, order_comments_by="relevance",
+                 target=None, batch_size=BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, fetch_workers=FETCH_WORKERS,
+                 cube=False, page_source=None):
+        """page_source(yt, video_id, per_video_limit, order) yields comment pages
+        (default: fetch_comments_v2.iter_comment_pages)."""
+        self.yt, self.domain, self.score_fn = yt, domain, score_fn
+        self.page_source = page_source
+        self.out_csv = Path(out_csv)
+        self.per_video_limit, self.order = per_video_limit, order_comments_by
+        self.target, self.batch_size, self.max_wait = target, batch_size, max_wait_ms / 1000.0
+        self.fetch_workers, self.cube = fetch_workers, cube
+        self.pages = queue.Queue(QUEUE_PAGES)
+        self.rows = queue.Queue(QUEUE_ROWS)
+        self.batches = queue.Queue(QUEUE_BATCHES)
+        self.stop = threading.Event()
+        self.quota = threading.Event()  # every API key is out of quota: fetchers stop, the rest drains
+        self._lock = threading.Lock()
+        self.seen = set()          # (video_id, comment_id) already written or queued
+        self.errors = []
+        self.stats = {"videos": 0, "fetched": 0, "dropped": 0, "cleaned": 0, "scored": 0, "written": 0,
+                      "quota_exhausted": False}
+        self.latency = []          # seconds from page fetched to row written, per batch
+
+    # ---- stages
+    def _enough(self):
+        """With a target: True once the cleaner has accepted `target` rows. While the rows fetched
+        and not dropped already cover target + FETCH_LOOKAHEAD, wait for the cleaner to catch up
+        instead of requesting another page."""
+        if self.target is None:
+            return False
+        while not (self.stop.is_set() or self.quota.is_set()):
+            with self._lock:
+                if self.stats["cleaned"] >= self.target:
+                    return True
+                if self.stats["fetched"] - self.stats["dropped"] < self.target + FETCH_LOOKAHEAD:
+                    return False
+            time.sleep(0.02)
+        return True
+
+    def _fetch(self, videos):
+        pages_of = self.page_source
+        if pages_of is None:
+            from fetch_comments_v2 import iter_comment_pages as pages_of
+
+        while not (self.stop.is_set() or self.quota.is_set() or self._enough()):
+            try:
+                vid = videos.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                for page in pages_of(self.yt, vid, self.per_video_limit, self.order):
+                    if self.stop.is_set() or self.quota.is_set():
+                        return
+                    self._put(self.pages, (time.perf_counter(), page))
+                    with self._lock:
+                        self.stats["fetched"] += len(page)
+                    if self._enough():
+                        return
+            except QuotaExhausted as e:       # not an error: pages already fetched are still written
+                if not self.quota.is_set():
+                    print(f"[quota] stopping fetchers - {e}")
+                self.quota.set()
+                return
+            except Exception as e:            # commentsDisabled / network
+                print(f"[skip] video {vid} - {e}")
+            with self._lock:
+                self.stats["videos"] += 1
+
+    def _clean(self):
+        from clean_comments_v2 import clean_text
+
+        while True:
+            item = self.pages.get()
+            if item is _DONE:
+                self._put(self.rows, _DONE, force=True)
+                return
+            t_fetched, page = item
+            for r in page:
+                key = (r["video_id"], r["comment_id"])
+                text = clean_text(r.pop("text", ""))
+                if not text or key in self.seen:
+                    with self._lock:
+                        self.stats["dropped"] += 1
+                    continue
+                self.seen.add(key)
+                r.update(domain=self.domain, clean_text=text, comment_length=len(text),
+                         like_count=int(pd.to_numeric(r.get("like_count"), errors="coerce") or 0))
+                self._put(self.rows, (t_fetched, r))
+                with self._lock:
+                    self.stats["cleaned"] += 1
+
+    def _score(self):
+        done = False
+        while not done:
+            batch = []
+            item = self.rows.get()
+            if item is _DONE:
+                break
+            batch.append(item)
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.rows.get(timeout=max(deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    done = True
+                    break
+                batch.append(item)
+            if self.stop.is_set():              # target reached: drain without scoring
+                continue
+            t_first = min(t for t, _ in batch)
+            rows = [r for _, r in batch]
+            if self.target is not None:         # never score past the target
+                rows = rows[:max(self.target - self.stats["scored"], 0)]
+                if not rows:
+                    continue
+            scores = self.score_fn([r["clean_text"] for r in rows])
+            for r, s in zip(rows, scores.to_dict("records")):
+                r.update(s)
+            self.stats["scored"] += len(rows)
+            self._put(self.batches, (t_first, rows), force=True)
+        self._put(self.batches, _DONE, force=True)
+
+    def _write(self):
+        header = not self.out_csv.exists()
+        while True:
+            item = self.batches.get()
+            if item is _DONE:
+                return
+            t_first, rows = item
+            if self.target is not None:
+                rows = rows[:max(self.target - self.stats["written"], 0)]
+            if not rows:
+                continue
+            df = pd.DataFrame(rows).reindex(columns=OUT_COLS)
+            df.to_csv(self.out_csv, mode="a", header=header, index=False)
+            header = False
+            if self.cube:
+                from aggregate_cube_v2 import update_cube
+                update_cube(df)
+            self.stats["written"] += len(df)
+            self.latency.append(time.perf_counter() - t_first)
+            if self.target is not None and self.stats["written"] >= self.target:
+                self.stop.set()
+
+    # ---- plumbing
+    def _put(self, q, item, force=False):
+        """Blocking put that gives up when the pipeline is stopping (force: always deliver)."""
+        while True:
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                if self.stop.is_set() and not force:
+                    return
+                if self.stop.is_set():          # drain so the sentinel gets through
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def _guard(self, fn, *args, downstream=None):
+        try:
+            fn(*args)
+        except Exception as e:
+            self.errors.append(e)
+            self.stop.set()
+            if downstream is not None:          # let the next stage finish instead of waiting forever
+                self._put(downstream, _DONE, force=True)
+
+    def _load_seen(self):
+        if not self.out_csv.exists():
+            return
+        for chunk in pd.read_csv(self.out_csv, usecols=["video_id", "comment_id"], dtype=str, chunksize=200_000):
+            self.seen.update(zip(chunk["video_id"], chunk["comment_id"]))
+
+    def run(self, video_ids):
+        self.out_csv.parent.mkdir(parents=True, exist_ok=True)
+        self._load_seen()
+        videos = queue.Queue()
+        for v in video_ids:
+            videos.put(v)
+        workers = [threading.Thread(target=self._guard, args=(self._fetch, videos), daemon=True)
+                   for _ in range(max(1, self.fetch_workers))]
+        stages = [threading.Thread(target=self._guard, args=(fn,), kwargs={"downstream": q}, daemon=True)
+                  for fn, q in [(self._clean, self.rows), (self._score, self.batches), (self._write, None)]]
+        for t in workers + stages:
+            t.start()
+        for t in workers:
+            t.join()
+        self._put(self.pages, _DONE, force=True)
+        for t in stages:
+            t.join()
+        if self.errors:
+            raise self.errors[0]
+        self.stats["quota_exhausted"] = self.quota.is_set()
+        return self.stats
+
+
+def make_score_fn(args):
+    """→ callable(list[str]) -> DataFrame with sentiment / prob_* / sentiment_stage."""
+    if args.score_url or args.score_unix:
+        from sentiment_service_v2 import score_remote
+
+        kwargs = {"unix_socket": args.score_unix} if args.score_unix else {"url": args.score_url}
+
+        def remote(texts):
+            df = pd.DataFrame(score_remote(texts, **kwargs))
+            df["sentiment_stage"] = "service"
+            return df
+        return remote
+
+    import bert_sentiment_inference_v2 as bert
+
+    if args.cascade is not None:
+        return lambda texts: bert.score_with_cascade(texts, args.cascade, args.stage1, backend=args.backend)
+    model = bert.get_model(backend=args.backend)
+
+    def local(texts):
+        df = model.score_texts(texts, len(texts), use_cache=False)
+        df["sentiment_stage"] = "roberta"
+        return df
+    return local
+
+
+def main(argv=None):
+    from fetch_comments_v2 import PRESET_QUERIES
+
+    parser = argparse.ArgumentParser(description="Streaming fetch → clean → score → write pipeline")
+    parser.add_argument("--domain", type=str, required=True, choices=list(PRESET_QUERIES.keys()))
+    parser.add_argument("--videos", type=str, nargs="*", default=None, help="video ids (default: search this year)")
+    parser.add_argument("--pages", type=int, default=10, help="search pages per query (50 videos each)")
+    parser.add_argument("--target", type=int, default=None, help="stop after this many scored rows")
+    parser.add_argument("--per_video_limit", type=int, default=500)
+    parser.add_argument("--order_comments_by", type=str, default="relevance", choices=["relevance", "time"])
+    parser.add_argument("--fetch_workers", type=int, default=FETCH_WORKERS)
+    parser.add_argument("--batch_size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--max_wait_ms", type=float, default=MAX_WAIT_MS)
+    parser.add_argument("--backend", type=str, default="torch")
+    parser.add_argument("--cascade", type=float, default=None, metavar="THRESHOLD")
+    parser.add_argument("--stage1", type=str, default="auto", choices=["auto", "linear", "lexicon"])
+    parser.add_argument("--score_url", type=str, default=None)
+    parser.add_argument("--score_unix", type=str, default=None)
+    parser.add_argument("--cube", action="store_true", help="fold every written batch into the aggregate cube")
+    parser.add_argument("--out", type=str, default=None)
+    args = parser.parse_args(argv)
+
+    from fetch_comments_v2 import build_youtube_client, search_videos_this_year
+
+    start_run(f"stream_{args.domain}")
+    yt = count_api_calls(build_youtube_client())
+    with stage("search") as st:
+        video_ids = args.videos or list(dict.fromkeys(
+            v for q in PRESET_QUERIES[args.domain] for v in search_videos_this_year(yt, q, pages=args.pages)))
+        st.rows_out = len(video_ids)
+    print(f"[{args.domain}] {len(video_ids)} videos")
+
+    out = Path(args.out) if args.out else PROCESSED_DIR / f"{args.domain}_stream_scored.csv"
+    pipe = StreamPipeline(yt, args.domain, make_score_fn(args), out,
+                          per_video_limit=args.per_video_limit, order_comments_by=args.order_comments_by,
+                          target=args.target, batch_size=args.batch_size, max_wait_ms=args.max_wait_ms,
+                          fetch_workers=args.fetch_workers, cube=args.cube)
+    with stage("stream", rows_in=len(video_ids)) as st:
+        stats = pipe.run(video_ids)
+        st.rows_out = stats["written"]
+    lat = pd.Series(pipe.latency, dtype=float)
+    print(f"[{args.domain}] {stats} → {out}")
+    if stats["quota_exhausted"]:
+        print(f"[{args.domain}] API quota exhausted; rerun later to continue (written comments are skipped)")
+    if len(lat):
+        print(f"fetch→written latency per batch: p50={lat.median():.2f}s p95={lat.quantile(0.95):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# streaming_stats_v2.py
+# Streaming statistics: one chunked pass over WITH_SENT_CSV (or a Parquet equivalent) that keeps
+# only small accumulators — domain × sentiment contingency counts, extreme-rate counts, monthly
+# counts, and per-group mean / variance of likes, length and probabilities (Chan et al. merge of
+# per-chunk moments). StreamingAggregates exposes the same tables as analysis_engine_v2.Aggregates,
+# so the chi-square and extreme-rate reports run on datasets larger than RAM.
+# Usage:
+#     python streaming_stats_v2.py                      # chi-square + extreme rate + moments
+#     python streaming_stats_v2.py --input big.parquet
+#     python analysis_engine_v2.py --streaming          # reports that need no rows
+
+from settings import WITH_SENT_CSV
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import scipy.stats as stats
+
+from dataset_v2 import EXTREME_THRESHOLD, SENTIMENT_ORDER
+
+CHUNK_ROWS = 250_000
+KEYS = ["domain", "sentiment"]
+MEASURES = ["like_count", "comment_length", "prob_positive", "prob_neutral", "prob_negative"]
+COLUMNS = KEYS + MEASURES + ["clean_text", "published_at"]
+
+
+def iter_chunks(path, chunksize=CHUNK_ROWS):
+    """Yield DataFrame chunks with only the columns the accumulators need."""
+    path = Path(path)
+    if path.suffix == ".parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("Reading Parquet needs pyarrow (pip install pyarrow)") from e
+        pf = pq.ParquetFile(path)
+        cols = [c for c in COLUMNS if c in pf.schema_arrow.names]
+        for batch in pf.iter_batches(batch_size=chunksize, columns=cols):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize, usecols=lambda c: c in COLUMNS)
+
+
+class StreamingAggregates:
+    """Constant-memory accumulators; update() once per chunk, then read the tables."""
+
+    def __init__(self):
+        self._moments = None            # index: (domain, sentiment); cols: n, <m>_mean, <m>_m2
+        self._extreme = None            # index: domain; cols: n_extreme, n
+        self._monthly = None            # Series indexed by (month, domain, sentiment)
+        self.measures = []
+        self.rows = 0
+
+    # ---- accumulation
+    def update(self, chunk):
+        chunk = chunk.dropna(subset=KEYS)
+        if chunk.empty:
+            return self
+        chunk = chunk.copy()
+        if "comment_length" not in chunk.columns and "clean_text" in chunk.columns:
+            chunk["comment_length"] = chunk["clean_text"].fillna("").astype(str).str.len()
+        if "like_count" in chunk.columns:
+            chunk["like_count"] = pd.to_numeric(chunk["like_count"], errors="coerce").fillna(0)
+        measures = [m for m in MEASURES if m in chunk.columns]
+        if not self.measures:
+            self.measures = measures
+        self.rows += len(chunk)
+
+        g = chunk.groupby(KEYS)
+        part = pd.DataFrame({"n": g.size()})
+        means, m2 = g[self.measures].mean(), g[self.measures].var(ddof=0) * part["n"].to_numpy()[:, None]
+        for m in self.measures:
+            part[f"{m}_mean"] = means[m]
+            part[f"{m}_m2"] = m2[m].fillna(0)
+        self._moments = part if self._moments is None else self._merge_moments(self._moments, part)
+
+        if {"prob_positive", "prob_negative"}.issubset(chunk.columns):
+            ext = ((chunk["prob_positive"] > EXTREME_THRESHOLD) | (chunk["prob_negative"] > EXTREME_THRESHOLD))
+            e = pd.DataFrame({"n_extreme": ext.astype(int), "n": 1, "domain": chunk["domain"]}).groupby("domain").sum()
+            self._extreme = e if self._extreme is None else self._extreme.add(e, fill_value=0)
+
+        if "published_at" in chunk.columns:
+            ts = pd.to_datetime(chunk["published_at"], errors="coerce", utc=True)
+            ok = ts.notna()
+            month = ts[ok].dt.strftime("%Y-%m").rename("month")
+            mc = chunk[ok].groupby([month, chunk.loc[ok, "domain"], chunk.loc[ok, "sentiment"]]).size()
+            self._monthly = mc if self._monthly is None else self._monthly.add(mc, fill_value=0)
+        return self
+
+    def _merge_moments(self, a, b):
+        idx = a.index.union(b.index)
+        a, b = a.reindex(idx), b.reindex(idx)
+        na, nb = a["n"].fillna(0), b["n"].fillna(0)
+        n = na + nb
+        out = pd.DataFrame({"n": n})
+        for m in self.measures:
+            ma, mb = a[f"{m}_mean"].fillna(0), b[f"{m}_mean"].fillna(0)
+            delta = mb - ma
+            out[f"{m}_mean"] = ma + delta * nb / n
+            out[f"{m}_m2"] = a[f"{m}_m2"].fillna(0) + b[f"{m}_m2"].fillna(0) + delta ** 2 * na * nb / n
+        return out
+
+    @classmethod
+    def from_path(cls, path=WITH_SENT_CSV, chunksize=CHUNK_ROWS):
+        acc = cls()
+        for chunk in iter_chunks(path, chunksize):
+            acc.update(chunk)
+        return acc
+
+    # ---- tables (same names as analysis_engine_v2.Aggregates)
+    df = None
+
+    @property
+    def counts(self):
+        return (self._moments["n"].unstack("sentiment", fill_value=0)
+                .reindex(columns=SENTIMENT_ORDER, fill_value=0).astype(int))
+
+    @property
+    def proportions(self):
+        c = self.counts
+        return c.div(c.sum(axis=1), axis=0)
+
+    @property
+    def domains(self):
+        return sorted(self.counts.index)
+
+    @property
+    def has_probs(self):
+        return self._extreme is not None
+
+    @property
+    def extreme_rate(self):
+        return self._extreme["n_extreme"] / self._extreme["n"]
+
+    @property
+    def means(self):
+        cols = [m for m in ["like_count", "comment_length"] if m in self.measures]
+        return pd.DataFrame({m: self._moments[f"{m}_mean"] for m in cols})
+
+    @property
+    def variances(self):
+        """Sample variances (ddof=1) per domain × sentiment."""
+        n = self._moments["n"]
+        return pd.DataFrame({m: self._moments[f"{m}_m2"] / (n - 1).clip(lower=1) for m in self.measures})
+
+    @property
+    def monthly(self):
+        if self._monthly is None:
+            return pd.DataFrame(columns=["month", "domain", "sentiment", "count"])
+        return self._monthly.astype(int).rename("count").reset_index()
+
+
+def chi_square(counts):
+    """chi2_contingency on a domain × sentiment count table (empty columns dropped)."""
+    tab = counts.loc[:, counts.sum(axis=0) > 0]
+    chi2, p, dof, _ = stats.chi2_contingency(tab)
+    return chi2, p, dof
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="One-pass streaming statistics over the scored comments")
+    parser.add_argument("--input", type=str, default=str(WITH_SENT_CSV))
+    parser.add_argument("--chunksize", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    acc = StreamingAggregates.from_path(args.input, args.chunksize)
+    print(f"Streamed {acc.rows} rows from {args.input}")
+    print("\nContingency (domain × sentiment):\n", acc.counts)
+    chi2, p, dof = chi_square(acc.counts)
+    print(f"\nChi²={chi2:.2f}, dof={dof}, p-value={p:.3e}")
+    if acc.has_probs:
+        print("\nExtreme sentiment rate by domain:\n", acc.extreme_rate.round(3))
+    print("\nMeans:\n", acc.means.round(2))
+    print("\nStd:\n", np.sqrt(acc.variances[acc.means.columns]).round(2))
+
+
+if __name__ == "__main__":
+    main()
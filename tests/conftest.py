@@ -0,0 +1,49 @@
+# Shared fixtures. The scripts live at the repository root and resolve settings' data2/ paths
+# against the working directory, so every test runs inside its own empty tmp directory.
+import os, sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for d in ["data2/raw", "data2/processed", "data2/results", "figures_v2"]:
+        (tmp_path / d).mkdir(parents=True)
+    return tmp_path
+
+
+def make_scored(n=400, seed=0):
+    """Synthetic frame with the WITH_SENT_CSV columns: 2 domains × 4 videos × 3 months."""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    probs = rng.dirichlet([1, 1, 1], n)
+    domain = np.where(np.arange(n) % 2, "steam", "food")
+    video = [f"{d}-v{i % 4}" for d, i in zip(domain, rng.integers(0, 4, n))]
+    words = np.array(["great", "trash", "love", "boring", "price", "fps", "taste", "ok"])
+    return pd.DataFrame({
+        "video_id": video, "video_title": [f"title {v}" for v in video],
+        "video_published_at": "2025-01-01T00:00:00Z",
+        "comment_id": [f"c{i}" for i in range(n)],
+        "published_at": [f"2025-0{1 + i % 3}-1{i % 10}T12:00:00Z" for i in range(n)],
+        "like_count": rng.integers(0, 50, n),
+        "clean_text": [" ".join(rng.choice(words, 4)) + f" {i}" for i in range(n)],
+        "domain": domain,
+        "prob_negative": probs[:, 0], "prob_neutral": probs[:, 1], "prob_positive": probs[:, 2],
+        "sentiment": np.array(["negative", "neutral", "positive"])[probs.argmax(axis=1)],
+    })
+
+
+@pytest.fixture
+def scored_csv(workdir):
+    from settings import WITH_SENT_CSV
+
+    make_scored().to_csv(WITH_SENT_CSV, index=False)
+    return WITH_SENT_CSV
@@ -0,0 +1,41 @@
+import pandas as pd
+
+import aggregate_cube_v2 as cube_mod
+from conftest import make_scored
+from settings import WITH_SENT_CSV
+
+
+def edited(df):
+    """Refreshed likes, a flipped label, a moved video and two new comments."""
+    df = df.copy()
+    df.loc[:9, "like_count"] += 7
+    df.loc[10:14, ["sentiment", "prob_positive", "prob_negative"]] = ["positive", 0.97, 0.01]
+    df.loc[15, "video_id"] = "food-v9"
+    new = df.tail(2).assign(comment_id=["n1", "n2"], published_at="2025-04-01T00:00:00Z")
+    return pd.concat([df, new], ignore_index=True)
+
+
+def canonical(cube):
+    return cube.sort_values(cube_mod.KEYS).reset_index(drop=True)
+
+
+def test_incremental_update_matches_rebuild(scored_csv):
+    _, n = cube_mod.update_from_csv()
+    assert n == 400
+    assert cube_mod.update_from_csv()[1] == 0
+
+    edited(pd.read_csv(WITH_SENT_CSV)).to_csv(WITH_SENT_CSV, index=False)
+    incremental, n = cube_mod.update_from_csv()
+    assert n == 10 + 5 + 1 + 2
+    rebuilt, _ = cube_mod.update_from_csv(rebuild=True)
+    pd.testing.assert_frame_equal(canonical(incremental), canonical(rebuilt), check_dtype=False)
+
+
+def test_update_cube_with_scored_rows_matches_rebuild(workdir):
+    df = make_scored()
+    cube_mod.update_cube(df)
+    incremental, n = cube_mod.update_cube(edited(df))
+    assert n == 18
+    edited(df).to_csv(WITH_SENT_CSV, index=False)
+    rebuilt, _ = cube_mod.update_from_csv(rebuild=True)
+    pd.testing.assert_frame_equal(canonical(incremental), canonical(rebuilt), check_dtype=False)
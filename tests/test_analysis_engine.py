@@ -0,0 +1,13 @@
+import analysis_engine_v2 as engine
+from settings import FIG_DIR
+
+
+def test_sample_run_does_not_touch_full_outputs(scored_csv):
+    engine.run_reports(["cross_domain", "small_table"], scored_csv)
+    full = {p: p.read_bytes() for p in (FIG_DIR / "cross_domain").iterdir()}
+    assert any(p.suffix == ".csv" for p in full)
+
+    engine.run_reports(["cross_domain", "small_table"], scored_csv, sample=2)
+    assert {p: p.read_bytes() for p in (FIG_DIR / "cross_domain").iterdir()} == full
+    assert sorted(p.name for p in (engine.SAMPLE_FIG_DIR / "cross_domain").iterdir()) == \
+        sorted(p.name for p in full)
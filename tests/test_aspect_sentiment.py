@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+import aspect_sentiment_v2 as asp
+import bert_sentiment_inference_v2 as bert
+
+
+class FakeModel:
+    def __init__(self):
+        self.texts = []
+
+    def score_texts(self, texts, batch_size, use_cache=True):
+        self.texts += list(texts)
+        return bert.probs_to_frame([[0.1, 0.2, 0.7]] * len(texts))
+
+
+@pytest.fixture
+def model(monkeypatch):
+    fake = FakeModel()
+    monkeypatch.setattr(asp, "get_model", lambda *a, **kw: fake)
+    return fake
+
+
+def test_whole_comment_windows_reuse_input_scores(scored_csv, model):
+    asp.run(scored_csv)
+    mentions = asp.pd.read_csv(asp.MENTIONS_CSV)
+    assert len(mentions) and (mentions["source"] == "comment").all()
+    assert model.texts == []
+
+
+def test_input_scored_with_another_config_is_rescored(scored_csv, model):
+    asp.run(scored_csv, max_len=64)
+    mentions = asp.pd.read_csv(asp.MENTIONS_CSV)
+    assert (mentions["source"] == "window").all()
+    assert len(model.texts) == mentions["window"].nunique()
+
+
+def test_meta_config_matching_the_run_allows_reuse(scored_csv, model):
+    with open(bert.meta_path(scored_csv), "w", encoding="utf-8") as f:
+        json.dump({"config": bert.scoring_config(max_len=64)}, f)
+    asp.run(scored_csv, max_len=64)
+    assert model.texts == []
+    asp.run(scored_csv)
+    assert len(model.texts) > 0
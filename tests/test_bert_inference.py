@@ -0,0 +1,54 @@
+import pandas as pd
+import pytest
+
+import bert_sentiment_inference_v2 as bert
+from conftest import make_scored
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = []
+
+    def score_texts(self, texts, batch_size=bert.BATCH_SIZE, use_cache=True, embeddings=None):
+        self.calls.append(list(texts))
+        return bert.probs_to_frame([[0.1, 0.2, 0.7]] * len(texts))
+
+
+@pytest.fixture
+def model(monkeypatch):
+    fake = FakeModel()
+    monkeypatch.setattr(bert, "get_model", lambda *a, **kw: fake)
+    return fake
+
+
+@pytest.fixture
+def merged(workdir):
+    from settings import MERGED_CSV
+
+    make_scored().drop(columns=bert.SENT_COLS).to_csv(MERGED_CSV, index=False)
+    return MERGED_CSV
+
+
+def test_rerun_on_unchanged_input_skips_the_model(merged, model):
+    assert bert.run(merged) == 400
+    assert bert.run(merged) == 0
+    assert len(model.calls) == 1
+
+
+def test_only_new_texts_are_scored(merged, model):
+    bert.run(merged)
+    df = pd.read_csv(merged)
+    extra = df.head(5).assign(comment_id=lambda d: d["comment_id"] + "x",
+                              clean_text=lambda d: d["clean_text"] + " again")
+    pd.concat([df, extra]).to_csv(merged, index=False)
+    assert bert.run(merged) == 5
+    assert model.calls[-1] == sorted(extra["clean_text"])
+    out = pd.read_csv(bert.WITH_SENT_CSV)
+    assert len(out) == 405 and out["sentiment"].notna().all()
+
+
+def test_changed_scoring_config_rescores_everything(merged, model):
+    bert.run(merged)
+    assert bert.run(merged, max_len=64) == 400
+    assert bert.load_meta(bert.WITH_SENT_CSV)["config"]["max_len"] == 64
+    assert bert.run(merged, max_len=64) == 0
@@ -0,0 +1,18 @@
+import numpy as np
+
+import cascade_sentiment_v2 as cs
+
+CLEAR = {"love it": "positive", "this is amazing": "positive", "best video ever 🔥": "positive",
+         "trash": "negative", "worst update, so buggy": "negative", "what a waste of money": "negative"}
+UNSURE = ["first", "who is watching in 2025", "love the music but the game is trash",
+          "not good", "this isn't bad"]
+
+
+def test_lexicon_accepts_clear_comments_at_stage1():
+    probs = cs.LexiconModel().predict_proba(list(CLEAR))
+    assert cs.gate(probs).all()
+    assert list(np.asarray(cs.LABELS)[probs.argmax(axis=1)]) == list(CLEAR.values())
+
+
+def test_lexicon_defers_unclear_comments_to_stage2():
+    assert not cs.gate(cs.LexiconModel().predict_proba(UNSURE)).any()
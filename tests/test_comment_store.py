@@ -0,0 +1,52 @@
+import sqlite3
+
+import pandas as pd
+
+from bert_sentiment_inference_v2 import SENT_COLS
+from comment_store_v2 import CommentStore, RAW_COLS
+
+
+def row(cid, text, likes=0, score=None):
+    r = {"video_id": "v1", "video_title": "t", "video_published_at": "2025-01-01", "comment_id": cid,
+         "published_at": "2025-02-01", "like_count": likes, "text": text, "domain": "food"}
+    if score is not None:
+        r.update(sentiment="positive", prob_positive=score, prob_neutral=0.1, prob_negative=0.9 - score)
+    return r
+
+
+def test_fetch_time_scores_are_kept_and_exported(tmp_path):
+    store = CommentStore(tmp_path / "s.sqlite")
+    store.add_sources(["v1"], "food", "q")
+    store.upsert([row("a", "love it", score=0.8), row("b", "meh", score=0.6), row("c", "unscored")])
+    # re-fetch without scoring: likes refresh, scores survive for unchanged text only
+    store.upsert([row("a", "love it", likes=5), row("b", "meh (edited)")])
+    out = tmp_path / "food_raw.csv"
+    store.export("food", out)
+    df = pd.read_csv(out)
+    assert list(df.columns) == RAW_COLS + SENT_COLS
+    df = df.set_index("comment_id")
+    assert df.at["a", "like_count"] == 5 and df.at["a", "prob_positive"] == 0.8
+    assert df.loc[["b", "c"], "sentiment"].isna().all()
+
+
+def test_unscored_export_keeps_raw_layout(tmp_path):
+    store = CommentStore(tmp_path / "s.sqlite")
+    store.add_sources(["v1"], "food", "q")
+    store.upsert([row("a", "hi")])
+    out = tmp_path / "food_raw.csv"
+    store.export("food", out)
+    assert list(pd.read_csv(out).columns) == RAW_COLS
+
+
+def test_store_without_score_columns_is_migrated(tmp_path):
+    path = tmp_path / "old.sqlite"
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE comments (comment_id TEXT PRIMARY KEY, video_id TEXT NOT NULL, "
+                "published_at TEXT, like_count INTEGER, text TEXT, first_seen TEXT, last_seen TEXT)")
+    con.execute("INSERT INTO comments VALUES ('a', 'v1', '', 1, 'old', '', '')")
+    con.commit()
+    con.close()
+    store = CommentStore(path)
+    store.add_sources(["v1"], "food", "q")
+    store.upsert([row("a", "old", score=0.7)])
+    assert store.export("food").at[0, "prob_positive"] == 0.7
@@ -0,0 +1,63 @@
+import pytest
+
+from crawl_frontier_v2 import CrawlFrontier
+from youtube_client_v2 import QuotaExhausted
+
+
+class Req:
+    def __init__(self, fn):
+        self.fn = fn
+
+    def execute(self):
+        return self.fn()
+
+
+class FakeYouTube:
+    """Channel c<i> uploads u<i>-0 .. u<i>-2; every upload is on channel c<i> with 100 comments."""
+
+    def __init__(self, quota=None):
+        self.quota = quota          # calls left before QuotaExhausted (None: unlimited)
+
+    def _call(self, fn):
+        def run():
+            if self.quota is not None:
+                if self.quota == 0:
+                    raise QuotaExhausted("no API key left")
+                self.quota -= 1
+            return fn()
+        return Req(run)
+
+    def channels(self):
+        return self
+
+    def playlistItems(self):
+        return self
+
+    def videos(self):
+        return self
+
+    def list(self, part, id=None, playlistId=None, **kw):
+        if playlistId is not None:
+            ch = playlistId[2:]
+            return self._call(lambda: {"items": [{"contentDetails": {"videoId": f"u{ch}-{j}"}}
+                                                 for j in range(3)]})
+        ids = id.split(",")
+        if part == "contentDetails":
+            return self._call(lambda: {"items": [{"contentDetails": {"relatedPlaylists": {"uploads": f"UU{c[1:]}"}}}
+                                                 for c in ids]})
+        return self._call(lambda: {"items": [{"id": v, "snippet": {"channelId": "c" + v[1:].split("-")[0]},
+                                              "statistics": {"commentCount": "100"}} for v in ids]})
+
+
+def test_quota_stop_mid_expansion_keeps_channels_pending(workdir):
+    fr = CrawlFrontier("steam", path=workdir / "frontier.json")
+    fr.channels_pending = ["c1", "c2"]
+    with pytest.raises(QuotaExhausted):
+        fr.expand_channels(FakeYouTube(quota=2))          # channels + first uploads page only
+    assert fr.channels_pending == ["c1", "c2"] and not fr.channels_done
+    fr.save()
+
+    fr = CrawlFrontier.load("steam", path=workdir / "frontier.json")
+    assert fr.expand_channels(FakeYouTube()) == 6
+    assert fr.channels_pending == [] and fr.channels_done == {"c1", "c2"}
+    assert len(fr.queue) == 6
@@ -0,0 +1,40 @@
+import importlib, sys
+
+import numpy as np
+
+import figure_jobs_v2 as fj
+
+RENDERER = '''
+import matplotlib.pyplot as plt
+
+def plot(path, values):
+    plt.plot(values, color="{color}")
+    plt.savefig(path)
+'''
+
+
+def load_renderer(workdir, color):
+    (workdir / "renderers.py").write_text(RENDERER.format(color=color), encoding="utf-8")
+    sys.path.insert(0, str(workdir))
+    try:
+        sys.modules.pop("renderers", None)
+        return importlib.import_module("renderers").plot
+    finally:
+        sys.path.remove(str(workdir))
+        fj._source_digest.cache_clear()
+
+
+def test_unchanged_jobs_are_skipped_and_changed_data_rerendered(workdir):
+    plot = load_renderer(workdir, "red")
+    jobs = [fj.FigureJob(workdir / f"{i}.png", plot, {"values": np.arange(3) * i}) for i in range(3)]
+    assert fj.render_jobs(jobs, workers=1) == (3, 0)
+    assert fj.render_jobs(jobs, workers=1) == (0, 3)
+    jobs[1].data["values"] = np.arange(4)
+    assert fj.render_jobs(jobs, workers=1) == (1, 2)
+
+
+def test_editing_the_renderer_rerenders(workdir):
+    job = fj.FigureJob(workdir / "a.png", load_renderer(workdir, "red"), {"values": np.arange(3)})
+    assert fj.render_jobs([job], workers=1) == (1, 0)
+    job.func = load_renderer(workdir, "blue")
+    assert fj.render_jobs([job], workers=1) == (1, 0)
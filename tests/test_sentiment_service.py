@@ -0,0 +1,53 @@
+import threading
+
+import pandas as pd
+
+import sentiment_service_v2 as svc
+
+
+def recording_score_fn(calls):
+    def score(texts):
+        calls.append(len(texts))
+        return pd.DataFrame({"sentiment": ["neutral"] * len(texts), "prob_positive": 0.2,
+                             "prob_neutral": 0.5, "prob_negative": 0.3, "text": texts})
+    return score
+
+
+def test_large_request_is_split_into_max_batch_chunks():
+    calls = []
+    batcher = svc.MicroBatcher(recording_score_fn(calls), max_batch=32, max_wait_ms=1)
+    out = batcher.score([f"t{i}" for i in range(500)], timeout=10)
+    assert len(out) == 500
+    assert max(calls) == 32 and sum(calls) == 500
+    assert batcher.n_batches == len(calls)
+
+
+def test_concurrent_requests_get_their_own_results():
+    calls = []
+    batcher = svc.MicroBatcher(recording_score_fn(calls), max_batch=8, max_wait_ms=20)
+    results = {}
+
+    def client(i):
+        results[i] = batcher.score([f"c{i}-{j}" for j in range(i + 1)], timeout=10)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(12)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert {i: len(r) for i, r in results.items()} == {i: i + 1 for i in range(12)}
+    assert max(calls) <= 8 and sum(calls) == sum(range(1, 13))
+
+
+def test_model_score_fn_uses_max_batch(monkeypatch):
+    import bert_sentiment_inference_v2 as bert
+    seen = {}
+
+    class Model:
+        def score_texts(self, texts, batch_size, use_cache=True):
+            seen["batch_size"] = batch_size
+            return bert.probs_to_frame([[0.1, 0.2, 0.7]] * len(texts))
+
+    monkeypatch.setattr(bert, "get_model", lambda *a, **k: Model())
+    svc.model_score_fn(max_batch=16)(["a"] * 40)
+    assert seen["batch_size"] == 16
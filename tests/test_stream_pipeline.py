@@ -0,0 +1,60 @@
+import threading
+
+import pandas as pd
+
+import bert_sentiment_inference_v2 as bert
+import stream_pipeline_v2 as sp
+
+
+class Pages:
+    """Fake comment source: n_pages pages of 100 comments per video (the first one empty)."""
+
+    def __init__(self, n_pages=5, fail_after=None, error=None):
+        self.n_pages, self.fail_after, self.error = n_pages, fail_after, error
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, yt, video_id, per_video_limit, order):
+        for p in range(self.n_pages):
+            with self._lock:
+                self.calls += 1
+                if self.fail_after is not None and self.calls > self.fail_after:
+                    raise self.error
+            yield [{"video_id": video_id, "video_title": "t", "video_published_at": "2025-01-01",
+                    "comment_id": f"{video_id}-{p}-{i}", "published_at": "2025-02-01", "like_count": i,
+                    "text": "" if i == 0 else f"great video {i} https://x.y"} for i in range(100)]
+
+
+def score(texts):
+    return bert.probs_to_frame([[0.2, 0.3, 0.5]] * len(texts)).assign(sentiment_stage="fake")
+
+
+def pipeline(out, pages, **kw):
+    return sp.StreamPipeline(None, "steam", score, out, batch_size=16, max_wait_ms=5,
+                             page_source=pages, **kw)
+
+
+def test_rerun_appends_only_new_comments(workdir):
+    out = workdir / "scored.csv"
+    first = pipeline(out, Pages(n_pages=2)).run(["v1", "v2"])
+    assert first["written"] == 2 * 2 * 99
+    again = pipeline(out, Pages(n_pages=3)).run(["v1", "v2", "v3"])
+    df = pd.read_csv(out)
+    assert again["written"] == 3 * 3 * 99 - first["written"]
+    assert not df.duplicated(["video_id", "comment_id"]).any()
+
+
+def test_target_bounds_fetching_and_scoring(workdir):
+    pages = Pages()
+    stats = pipeline(workdir / "scored.csv", pages, target=250, fetch_workers=2).run(["v1", "v2", "v3"])
+    assert stats["written"] == stats["scored"] == 250
+    assert stats["fetched"] <= 250 + sp.FETCH_LOOKAHEAD + 2 * 100
+    assert pages.calls < 15
+
+
+def test_quota_exhausted_stops_fetchers_cleanly(workdir):
+    out = workdir / "scored.csv"
+    pages = Pages(fail_after=3, error=sp.QuotaExhausted("no API key left"))
+    stats = pipeline(out, pages).run(["v1", "v2"])
+    assert stats["quota_exhausted"]
+    assert stats["written"] == 3 * 99 == len(pd.read_csv(out))
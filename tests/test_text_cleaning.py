@@ -0,0 +1,54 @@
+import random
+
+import pandas as pd
+import pytest
+
+import text_cleaning as tc
+from conftest import ROOT
+
+OVERLAPS = {
+    "v1": [("@john.doe@gmail.com hi", "@<EMAIL> hi"),
+           ("@www.x.com", "@<URL>"),
+           ("bob@www.gmail.com", "bob@<URL>"),
+           ("x@y.com@z", "<EMAIL><USER>")],
+    "v2": [("great vid #https://youtu.be/abc thanks", "great vid # thanks"),
+           ("@https://t.co/x lol", "@ lol"),
+           ("see http://x.com/`a b` ok", "see ok")],
+}
+
+
+@pytest.mark.parametrize("profile", tc.PROFILES)
+def test_overlap_cases(profile):
+    for text, want in OVERLAPS[profile]:
+        assert tc.REFERENCES[profile](text) == want
+        assert tc.clean(text, profile) == want
+
+
+@pytest.mark.parametrize("profile", tc.PROFILES)
+def test_edge_cases_match_reference(profile):
+    for text in tc.EDGE_CASES:
+        assert tc.clean(text, profile) == tc.REFERENCES[profile](text), text
+
+
+@pytest.mark.parametrize("profile", tc.PROFILES)
+def test_random_strings_match_reference(profile):
+    rng = random.Random(0)
+    alphabet = list("ab.@#_-%+wht:/ é1<>`") + ["www.", "http://", "https://", "@b.co", "```", "  "]
+    for _ in range(20_000):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 16)))
+        assert tc.clean(text, profile) == tc.REFERENCES[profile](text.strip()), repr(text)
+
+
+@pytest.mark.parametrize("profile", tc.PROFILES)
+def test_raw_samples_match_reference(profile):
+    texts = tc._raw_texts(ROOT / tc.RAW_SAMPLES)
+    assert [tc.clean(t, profile) for t in texts] == [tc.REFERENCES[profile](t) for t in texts]
+
+
+def test_v1_golden_outputs():
+    paths = sorted((ROOT / tc.GOLDEN_DIR).glob("*_clean.csv"))
+    assert paths
+    for p in paths:
+        g = pd.read_csv(p, usecols=["text", "clean_text"]).dropna()
+        got = [tc.clean_v1(str(t).strip()) for t in g["text"]]
+        assert got == g["clean_text"].astype(str).tolist(), p.name
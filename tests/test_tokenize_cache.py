@@ -0,0 +1,67 @@
+import numpy as np
+
+import tokenize_cache_v2 as tc
+
+
+class CountingTokenizer:
+    """Stand-in for a fast tokenizer: one id per character, counts texts tokenized."""
+    pad_token_id = 1
+
+    def __init__(self):
+        self.n = 0
+
+    def __call__(self, texts, truncation, max_length, padding, return_attention_mask):
+        self.n += len(texts)
+        return {"input_ids": [[0] + [ord(c) for c in t][:max_length - 2] + [2] for t in texts]}
+
+
+def batches(tok, texts, batch_size=4):
+    return list(tc.stream_batches(tok, texts, "m/x", 8, batch_size))
+
+
+def ids_of(texts, max_len=8):
+    return [[0] + [ord(c) for c in t][:max_len - 2] + [2] for t in texts]
+
+
+def test_prepass_serves_any_subset_of_texts():
+    merged = ["b", "a", "b", "long comment", "c", "a"]
+    tok = CountingTokenizer()
+    tc.build_cache(tok, merged, "m/x", 8)
+    assert tok.n == 4                          # each distinct text once
+
+    todo = sorted(set(merged) - {"c"})         # what an incremental inference run asks for
+    out = batches(tok, todo)
+    assert tok.n == 4                          # all hits
+    rows = [r[m.astype(bool)].tolist() for ids, mask in out for r, m in zip(ids, mask)]
+    assert rows == ids_of(todo)
+
+
+def test_misses_are_appended_and_rows_stay_in_order():
+    tok = CountingTokenizer()
+    tc.build_cache(tok, ["a", "b"], "m/x", 8)
+    texts = ["z", "a", "y", "z", "b"]
+    ids, mask = batches(tok, texts, batch_size=8)[0]
+    assert [r[m.astype(bool)].tolist() for r, m in zip(ids, mask)] == ids_of(texts)
+    assert tok.n == 4                          # "z" and "y" tokenized once each
+    assert len(tc.TokenCache(tc.cache_dir_for("m/x", 8))) == 4
+    batches(tok, texts)
+    assert tok.n == 4
+
+
+def test_stale_whole_list_caches_are_removed(workdir):
+    stale = tc.cache_dir_for("m/x", 8).with_name("m-x_L8_0123456789abcdef")
+    stale.mkdir(parents=True)
+    batches(CountingTokenizer(), ["a"])
+    assert not stale.exists()
+    assert [p.name for p in tc.TOKEN_CACHE_DIR.iterdir()] == ["m-x_L8"]
+
+
+def test_interrupted_append_leaves_cache_readable():
+    tok = CountingTokenizer()
+    tc.build_cache(tok, ["a", "b"], "m/x", 8)
+    path = tc.cache_dir_for("m/x", 8)
+    with open(path / "ids.int32", "ab") as f:  # ids written, index never published
+        f.write(np.arange(5, dtype=np.int32).tobytes())
+    tc.build_cache(tok, ["c"], "m/x", 8)
+    cache = tc.TokenCache(path)
+    assert [cache.row(i).tolist() for i in range(len(cache))] == ids_of(["a", "b", "c"])
@@ -0,0 +1,31 @@
+import pandas as pd
+
+import video_index_v2 as vi
+from settings import WITH_SENT_CSV
+
+
+def table(db, name, key):
+    con = vi.connect(db)
+    try:
+        return pd.read_sql_query(f"SELECT * FROM {name} ORDER BY {key}", con)
+    finally:
+        con.close()
+
+
+def test_rerun_writes_nothing_and_changes_match_rebuild(scored_csv, workdir):
+    db = workdir / "index.sqlite"
+    assert vi.build(db=db) == 400
+    assert vi.build(db=db) == 0
+
+    df = pd.read_csv(WITH_SENT_CSV)
+    df.loc[0, "like_count"] += 100
+    df.loc[1, ["sentiment", "prob_negative", "prob_positive"]] = ["negative", 0.99, 0.0]
+    df.loc[2, "video_id"] = "steam-v9"
+    df = pd.concat([df, df.tail(1).assign(comment_id="new")], ignore_index=True)
+    df.to_csv(WITH_SENT_CSV, index=False)
+    assert vi.build(db=db) == 4
+
+    fresh = workdir / "fresh.sqlite"
+    vi.build(db=fresh)
+    for name, key in [("comments", "comment_id, domain"), ("videos", "video_id, domain")]:
+        pd.testing.assert_frame_equal(table(db, name, key), table(fresh, name, key))
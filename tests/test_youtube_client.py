@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+import youtube_client_v2 as ytc
+
+
+class ApiError(Exception):
+    """Shape of googleapiclient's HttpError as far as error_reason() is concerned."""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.content = json.dumps({"error": {"errors": [{"reason": reason}]}}).encode("utf-8")
+
+
+class FakeYouTube:
+    """One key's client: records calls and fails with `reason` once `fail_after` calls were made."""
+
+    def __init__(self, key, log, fail_after=None, reason="quotaExceeded"):
+        self.key, self.log, self.fail_after, self.reason = key, log, fail_after, reason
+        self.calls = 0
+
+    def commentThreads(self):
+        return self
+
+    def list(self, **kw):
+        self.kw = kw
+        return self
+
+    def execute(self):
+        self.calls += 1
+        self.log.append((self.key, self.kw.get("pageToken")))
+        if self.fail_after is not None and self.calls > self.fail_after:
+            raise ApiError(self.reason)
+        return {"items": [], "key": self.key}
+
+
+def pooled(fail_after, reason="quotaExceeded"):
+    log = []
+    fakes = {k: FakeYouTube(k, log, fail_after.get(k), reason) for k in ("k1", "k2")}
+    pool = ytc.KeyPool(list(fakes), daily_quota=100, factory=fakes.__getitem__, persist=False)
+    return ytc.PooledClient(pool), log
+
+
+def call(yt, token):
+    return yt.commentThreads().list(videoId="v", pageToken=token).execute()
+
+
+def test_quota_exceeded_fails_over_with_the_same_request():
+    yt, log = pooled({"k1": 1})
+    assert [call(yt, t)["key"] for t in "ab"] == ["k1", "k2"]     # most budget left first
+    log.clear()
+    assert call(yt, "c")["key"] == "k2"
+    assert log == [("k1", "c"), ("k2", "c")]                      # same pageToken on the next key
+    stats = yt.pool.summary()
+    assert stats[ytc._label("k1")]["state"] == "exhausted"
+    assert stats[ytc._label("k1")]["left"] == 0
+
+
+def test_quota_exhausted_once_every_key_is_out():
+    yt, log = pooled({"k1": 0, "k2": 0})
+    with pytest.raises(ytc.QuotaExhausted):
+        call(yt, "a")
+    assert [tok for _, tok in log] == ["a", "a"]
+    assert {st["state"] for st in yt.pool.summary().values()} == {"exhausted"}
+
+
+def test_other_api_errors_are_reraised_without_failover():
+    yt, log = pooled({"k1": 0, "k2": 0}, reason="commentsDisabled")
+    with pytest.raises(ApiError):
+        call(yt, "a")
+    assert len(log) == 1
+    assert all(st["state"] == "ok" and st["failovers"] == 0 for st in yt.pool.summary().values())
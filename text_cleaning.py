@@ -0,0 +1,172 @@
+# text_cleaning.py
+# Shared comment-cleaning kernel for the v1 (clean_comments.py) and v2 (clean_comments_v2.py)
+# cleaners. Patterns are compiled once, v1's are combined into one pass, and the regex work is
+# skipped when substring checks show no token; whitespace is collapsed with one split/join
+# instead of another re.sub.
+# Profiles keep each pipeline's established output:
+#   v1  collapse whitespace; URL → <URL>, e-mail → <EMAIL>, @mention → <USER>   (hashtags kept)
+#   v2  drop code spans, URLs, @mentions and #hashtags; collapse whitespace
+# Usage:
+#     python text_cleaning.py --check        # golden parity: v1 vs data/processed/*_clean.csv,
+#                                            # both profiles vs the original sequential cleaners
+#     python text_cleaning.py --bench        # comments/s, kernel vs original, on data/raw samples
+#     python -m pytest tests/test_text_cleaning.py   # the same parity checks + overlap cases
+
+import argparse, re, time
+from pathlib import Path
+
+import pandas as pd
+
+# v1 token classes. The original ran three sequential subs (URL, then e-mail, then mention), so a
+# later class never sees characters an earlier one replaced. In one pass that becomes: e-mail
+# characters stop where a URL could start, and a mention stops where an e-mail (or URL) could
+# start ("@john.doe@gmail.com" → "@<EMAIL>", "@www.x.com" → "@<URL>").
+_NO_URL = r"(?!(?i:https?://|www\.)\S)"
+_EMAIL = (rf"(?:{_NO_URL}[A-Za-z0-9._%+-])+@(?:{_NO_URL}[A-Za-z0-9.-])+"
+          rf"\.(?:{_NO_URL}[A-Za-z]){{2,}}")
+_V1_TOKENS = re.compile(
+    r"(?P<url>(?i:https?://\S+|www\.\S+))"
+    rf"|(?P<email>{_EMAIL})"
+    rf"|(?P<user>@(?:(?!{_EMAIL}){_NO_URL}\w)+)")
+_V1_PLACEHOLDER = {"url": "<URL>", "email": "<EMAIL>", "user": "<USER>"}
+_WWW = re.compile(r"(?i:www\.)")
+
+# v2: code spans, URLs, then @/# tokens, kept as three passes in that order. One alternation
+# is not equivalent: "#https://x" or "http://x/`a b`" would lose a different span.
+_V2_CODE = re.compile(r"`{1,3}.*?`{1,3}")
+_V2_URL = re.compile(r"https?://\S+")
+_V2_TAG = re.compile(r"[@#]\w+")
+
+PROFILES = ("v1", "v2")
+RAW_SAMPLES = Path("data/raw")
+GOLDEN_DIR = Path("data/processed")
+
+
+def _placeholder(m):
+    return _V1_PLACEHOLDER[m.lastgroup]
+
+
+def clean_v1(text):
+    """clean_comments.normalize: placeholders for URL / e-mail / mention, single spaces."""
+    # most comments contain no token at all: plain substring tests skip the regex scan
+    if "@" in text or "://" in text or ("." in text and _WWW.search(text)):
+        text = _V1_TOKENS.sub(_placeholder, text)
+    return " ".join(text.split())
+
+
+def clean_v2(text):
+    """clean_comments_v2.clean_text: code spans / URLs / mentions / hashtags removed."""
+    text = str(text or "")
+    if "`" in text:
+        text = _V2_CODE.sub(" ", text)
+    if "://" in text:
+        text = _V2_URL.sub(" ", text)
+    if "@" in text or "#" in text:
+        text = _V2_TAG.sub(" ", text)
+    return " ".join(text.split())
+
+
+CLEANERS = {"v1": clean_v1, "v2": clean_v2}
+
+
+def clean(text, profile="v2"):
+    return CLEANERS[profile](text)
+
+
+def clean_series(texts, profile="v2"):
+    fn = CLEANERS[profile]
+    return pd.Series([fn(t) for t in texts], index=getattr(texts, "index", None), dtype=object)
+
+
+# ---- original implementations (reference for --check / --bench) ----------
+
+_REF_URL = re.compile(r"(https?://\S+|www\.\S+)", re.IGNORECASE)
+_REF_EMAIL = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
+_REF_MENT = re.compile(r"@\w+")
+
+
+def _reference_v1(text):
+    t = text.strip()
+    t = re.sub(r"\s+", " ", t)
+    t = _REF_URL.sub("<URL>", t)
+    t = _REF_EMAIL.sub("<EMAIL>", t)
+    return _REF_MENT.sub("<USER>", t)
+
+
+def _reference_v2(s):
+    s = str(s or "")
+    s = re.sub(r"`{1,3}.*?`{1,3}", " ", s)
+    s = re.sub(r"https?://\S+", " ", s)
+    s = re.sub(r"[@#]\w+", " ", s)
+    return re.sub(r"\s+", " ", s).strip()
+
+
+REFERENCES = {"v1": _reference_v1, "v2": _reference_v2}
+
+# overlapping tokens the sequential subs resolve by pass order; rare in the samples, so checked explicitly
+EDGE_CASES = ["@john.doe@gmail.com hi", "@jöhn@gmail.com", "@josé.x@gmail.com", "x@y.com@z",
+              "@www.example.com", "bob@www.gmail.com", "a@b.cowww.x", "a@b.http://x",
+              "@comhttp:// http://x", "see @www. later", "@a@b.cc", "mail a.b@c.de or @c #tag",
+              "great vid #https://youtu.be/abc thanks", "@https://t.co/x lol", "see http://x.com/`a b` ok"]
+
+
+def _raw_texts(raw_dir=RAW_SAMPLES):
+    frames = [pd.read_csv(p, usecols=["text"]) for p in sorted(raw_dir.glob("*.csv"))]
+    if not frames:
+        raise SystemExit(f"No raw samples in {raw_dir}")
+    return pd.concat(frames, ignore_index=True)["text"].fillna("").astype(str).str.strip().tolist()
+
+
+def check(raw_dir=RAW_SAMPLES, golden_dir=GOLDEN_DIR, show=5):
+    """Golden-output parity; returns the number of mismatches."""
+    bad = 0
+    texts = _raw_texts(raw_dir) + EDGE_CASES
+    for profile in PROFILES:
+        diffs = [(t, REFERENCES[profile](t), clean(t, profile)) for t in texts
+                 if REFERENCES[profile](t) != clean(t, profile)]
+        print(f"[{profile}] kernel vs original cleaner: {len(texts) - len(diffs)}/{len(texts)} identical")
+        for t, want, got in diffs[:show]:
+            print(f"   input : {t[:100]!r}\n   want  : {want[:100]!r}\n   got   : {got[:100]!r}")
+        bad += len(diffs)
+
+    for p in sorted(golden_dir.glob("*_clean.csv")):
+        g = pd.read_csv(p, usecols=["text", "clean_text"]).dropna()
+        got = [clean_v1(str(t).strip()) for t in g["text"]]
+        n_bad = int((pd.Series(got, index=g.index) != g["clean_text"].astype(str)).sum())
+        print(f"[v1] golden {p.name}: {len(g) - n_bad}/{len(g)} identical")
+        bad += n_bad
+    return bad
+
+
+def bench(raw_dir=RAW_SAMPLES, repeat=5):
+    texts = _raw_texts(raw_dir)
+    rows = []
+    for profile in PROFILES:
+        for impl, fn in [("original", REFERENCES[profile]), ("kernel", CLEANERS[profile])]:
+            best = float("inf")
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                for t in texts:
+                    fn(t)
+                best = min(best, time.perf_counter() - t0)
+            rows.append({"profile": profile, "impl": impl, "comments_per_s": round(len(texts) / best),
+                         "us_per_comment": round(best / len(texts) * 1e6, 2)})
+    print(pd.DataFrame(rows).to_string(index=False))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shared cleaning kernel: parity check / micro-benchmark")
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--raw_dir", type=str, default=str(RAW_SAMPLES))
+    args = parser.parse_args(argv)
+    if args.check:
+        raise SystemExit(1 if check(Path(args.raw_dir)) else 0)
+    if args.bench:
+        bench(Path(args.raw_dir))
+    if not (args.check or args.bench):
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+# tokenize_cache_v2.py
+# Tokenization pre-pass: tokenize every distinct clean_text once with the fast tokenizer (batch
+# mode, chunks in parallel) and store the truncated input ids in a compact on-disk cache, one per
+# (model, max_len) in RESULTS_DIR/token_cache/<model>_L<max_len>/:
+#   ids.int32      flat int32 token ids (memory-mapped when read), appended to
+#   offsets.npy    int64 row offsets into ids (len = n_rows + 1)
+#   keys.npy       uint64 hash of each row's text
+#   meta.json      model / max_len / pad id / row and token counts
+# Entries are keyed per text, so any subset in any order is served from the cache: the sorted,
+# de-duplicated new texts of an incremental inference run hit the rows the pre-pass (or an earlier
+# run) tokenized, and only unseen texts are tokenized, in a background thread while the model
+# scores the first batches, then appended.
+# Usage:
+#     python tokenize_cache_v2.py                 # pre-tokenize MERGED_CSV
+#     python tokenize_cache_v2.py --max_len 256
+
+from settings import MERGED_CSV, RESULTS_DIR
+import argparse, json, os, queue, re, shutil, threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+TOKEN_CACHE_DIR = RESULTS_DIR / "token_cache"
+CHUNK_SIZE = 4096          # rows per tokenizer call
+TOKENIZE_WORKERS = 4       # chunks tokenized concurrently (the Rust tokenizer releases the GIL)
+PREFETCH_BATCHES = 4       # padded batches buffered ahead of the model
+
+
+def text_keys(texts):
+    """64-bit hash per text: the cache key of its token ids."""
+    return pd.util.hash_array(np.asarray(texts, dtype=object))
+
+
+def cache_dir_for(model_name, max_len):
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", model_name).strip("-")
+    return TOKEN_CACHE_DIR / f"{slug}_L{max_len}"
+
+
+def _drop_stale(path):
+    """Caches keyed on a whole text list (<slug>_L<max_len>_<hash>, before per-text keys) are
+    never hit again."""
+    for old in path.parent.glob(f"{path.name}_*"):
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def _save_npy(path, arr):
+    tmp = path.with_name(path.stem + ".tmp.npy")
+    np.save(tmp, arr)
+    os.replace(tmp, path)
+
+
+class TokenCache:
+    """Token ids per text: the text with hash keys[i] is ids[offsets[i]:offsets[i+1]].
+    Texts are only ever appended, so any subset or order of known texts is served from it."""
+
+    def __init__(self, path):
+        self.path = path
+        self.meta = {}
+        self.keys = np.zeros(0, dtype=np.uint64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.ids = np.zeros(0, dtype=np.int32)
+        if (path / "meta.json").exists():
+            with open(path / "meta.json", encoding="utf-8") as f:
+                self.meta = json.load(f)
+            self.keys = np.load(path / "keys.npy")
+            self.offsets = np.load(path / "offsets.npy")
+            n_tokens = int(self.offsets[-1])
+            if n_tokens:
+                self.ids = np.memmap(path / "ids.int32", dtype=np.int32, mode="r", shape=(n_tokens,))
+        self._index = pd.Index(self.keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, keys):
+        """Row of each key, -1 where the text is not cached."""
+        return self._index.get_indexer(keys)
+
+    def row(self, i):
+        return self.ids[self.offsets[i]:self.offsets[i + 1]]
+
+    def append(self, keys, rows, meta):
+        """Write rows after the existing ids; keys / offsets / meta are replaced atomically, so an
+        interrupted append leaves the previous cache readable."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        end = int(self.offsets[-1])
+        ids_path = self.path / "ids.int32"
+        with open(ids_path, "r+b" if ids_path.exists() else "wb") as f:
+            f.seek(end * 4)
+            for r in rows:
+                f.write(r.tobytes())
+            f.truncate()
+        lens = np.fromiter((len(r) for r in rows), dtype=np.int64, count=len(rows))
+        _save_npy(self.path / "offsets.npy", np.concatenate([self.offsets, end + np.cumsum(lens)]))
+        _save_npy(self.path / "keys.npy", np.concatenate([self.keys, np.asarray(keys, dtype=np.uint64)]))
+        tmp = self.path / "meta.tmp.json"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({**meta, "n_rows": len(self.keys) + len(rows), "n_tokens": end + int(lens.sum())}, f, indent=2)
+        os.replace(tmp, self.path / "meta.json")
+        self.__init__(self.path)
+
+
+def _tokenize_chunk(tok, texts, max_len):
+    enc = tok(texts, truncation=True, max_length=max_len, padding=False,
+              return_attention_mask=False)
+    return [np.asarray(x, dtype=np.int32) for x in enc["input_ids"]]
+
+
+def _iter_tokenized_chunks(tok, texts, max_len):
+    """Yield tokenized chunks in order; up to TOKENIZE_WORKERS chunks run at once."""
+    starts = range(0, len(texts), CHUNK_SIZE)
+    with ThreadPoolExecutor(max_workers=TOKENIZE_WORKERS) as pool:
+        yield from pool.map(lambda s: _tokenize_chunk(tok, texts[s:s + CHUNK_SIZE], max_len), starts)
+
+
+def _cached_chunks(tok, cache, texts, model_name, max_len):
+    """Yield the token ids of texts in order, CHUNK_SIZE rows at a time. Cached texts are read
+    from the memory map; the others are tokenized (in parallel chunks, as far ahead as needed)
+    and appended to the cache once every row has been yielded."""
+    keys = text_keys(texts)
+    pos = cache.lookup(keys)
+    miss = np.flatnonzero(pos < 0)
+    _, first = np.unique(keys[miss], return_index=True)
+    todo = miss[np.sort(first)]                 # first occurrence of every uncached text
+    new_keys, new_rows, got = keys[todo], [], {}
+    tokenized = _iter_tokenized_chunks(tok, [texts[i] for i in todo], max_len)
+    for s in range(0, len(texts), CHUNK_SIZE):
+        e = min(s + CHUNK_SIZE, len(texts))
+        while len(new_rows) < np.searchsorted(todo, e):
+            rows = next(tokenized)
+            got.update(zip(new_keys[len(new_rows):len(new_rows) + len(rows)].tolist(), rows))
+            new_rows.extend(rows)
+        yield [cache.row(pos[i]) if pos[i] >= 0 else got[int(keys[i])] for i in range(s, e)]
+    for _ in tokenized:                         # closes the tokenizer pool
+        pass
+    if new_rows:
+        cache.append(new_keys, new_rows, {"model": model_name, "max_len": max_len,
+                                          "pad_token_id": tok.pad_token_id})
+
+
+def build_cache(tok, texts, model_name, max_len):
+    """Tokenize the texts not cached yet (each distinct text once). Returns the cache dir."""
+    path = cache_dir_for(model_name, max_len)
+    _drop_stale(path)
+    for _ in _cached_chunks(tok, TokenCache(path), list(dict.fromkeys(texts)), model_name, max_len):
+        pass
+    return path
+
+
+def pad_batch(rows, pad_id):
+    """Pad a list of id arrays to the longest row (same as tok(..., padding=True))."""
+    lens = np.fromiter((len(r) for r in rows), dtype=np.int64, count=len(rows))
+    width = int(lens.max()) if len(rows) else 0
+    input_ids = np.full((len(rows), width), pad_id, dtype=np.int64)
+    for j, r in enumerate(rows):
+        input_ids[j, :len(r)] = r
+    attention_mask = (np.arange(width)[None, :] < lens[:, None]).astype(np.int64)
+    return input_ids, attention_mask
+
+
+def _rebatch(chunks, batch_size, pad_id):
+    buf = []
+    for rows in chunks:
+        buf.extend(rows)
+        n_full = len(buf) // batch_size * batch_size
+        for s in range(0, n_full, batch_size):
+            yield pad_batch(buf[s:s + batch_size], pad_id)
+        buf = buf[n_full:]
+    if buf:
+        yield pad_batch(buf, pad_id)
+
+
+def _prefetch(gen, depth):
+    """Run a generator in a background thread so producing batches overlaps model compute."""
+    q = queue.Queue(maxsize=depth)
+    done = object()
+
+    def work():
+        try:
+            for item in gen:
+                q.put(item)
+            q.put(done)
+        except BaseException as e:  # surface producer errors in the consumer
+            q.put(e)
+
+    threading.Thread(target=work, daemon=True).start()
+    while True:
+        item = q.get()
+        if item is done:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+def stream_batches(tok, texts, model_name, max_len, batch_size):
+    """Yield (input_ids, attention_mask) numpy batches in row order.
+    Cached texts are read from the cache; the rest are tokenized in the background while the
+    caller is already consuming batches, and added to the cache afterwards."""
+    path = cache_dir_for(model_name, max_len)
+    _drop_stale(path)
+    chunks = _cached_chunks(tok, TokenCache(path), texts, model_name, max_len)
+    return _prefetch(_rebatch(chunks, batch_size, tok.pad_token_id), PREFETCH_BATCHES)
+
+
+def main():
+    from bert_sentiment_inference_v2 import MODEL_NAME, MAX_LEN
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", type=str, default=str(MERGED_CSV))
+    parser.add_argument("--model", type=str, default=MODEL_NAME)
+    parser.add_argument("--max_len", type=int, default=MAX_LEN)
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer
+
+    tok = AutoTokenizer.from_pretrained(args.model, use_fast=True)
+    texts = pd.read_csv(args.input, usecols=["clean_text"])["clean_text"].fillna("").astype(str).tolist()
+    path = build_cache(tok, texts, args.model, args.max_len)
+    cache = TokenCache(path)
+    print(f"Token cache → {path} ({len(cache)} rows, {int(cache.offsets[-1])} tokens)")
+
+
+if __name__ == "__main__":
+    main()
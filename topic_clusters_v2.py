@@ -0,0 +1,337 @@
+# topic_clusters_v2.py
+# Topics per domain × sentiment: online mini-batch k-means (embeddings_v2.MiniBatchKMeans) fitted
+# while streaming over the scored CSV in chunks, so the corpus never has to fit in memory.
+# Features (--features):
+#   hash        hashed TF-IDF. Words (keyword_stats_v2 tokenizer) are hashed into HASH_DIM buckets
+#               with sublinear tf × idf and L2 normalisation. idf comes from one extra pass, and
+#               the hashing needs no vocabulary.
+#   embeddings  the row-aligned sentence vectors of embeddings_v2 (bert_sentiment_inference_v2 --embeddings)
+# Passes: [idf] → fit (--epochs passes of partial_fit per group) → assign. The assign pass writes
+#   RESULTS_DIR/topics/assignments.csv   comment_id, domain, sentiment, topic, similarity
+#   RESULTS_DIR/topics/topics.csv        per topic: size, share of group, like sum / mean, mean
+#                                        prob_positive / prob_negative, label (top distinctive words),
+#                                        most central comment
+# Incremental: 'assign' reuses the saved centers and assigns every comment, new ones included,
+# without retraining. With --update the comments not assigned before are first folded into the
+# centers by partial_fit (per-center counts keep the step small for mature topics).
+# Usage:
+#     python topic_clusters_v2.py fit --k 12 --features hash
+#     python topic_clusters_v2.py assign --update            # after new comments were scored
+#     python topic_clusters_v2.py show --domain steam --sentiment negative
+
+from settings import RESULTS_DIR, WITH_SENT_CSV
+import argparse, json, time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from embeddings_v2 import KMEANS_BATCH, MiniBatchKMeans, open_vectors
+from keyword_stats_v2 import _tokenize_chunk
+
+TOPIC_DIR = RESULTS_DIR / "topics"
+MODEL_FILE = TOPIC_DIR / "model.npz"
+META_FILE = TOPIC_DIR / "model.json"
+ASSIGN_CSV = TOPIC_DIR / "assignments.csv"
+TOPICS_CSV = TOPIC_DIR / "topics.csv"
+HASH_DIM = 2 ** 16
+K = 12
+EPOCHS = 2
+CHUNK_ROWS = 100_000
+INIT_ROWS = 20                 # rows per topic buffered before a group's centers are seeded
+LABEL_TERMS = 6
+COLUMNS = ["comment_id", "domain", "sentiment", "clean_text", "like_count", "prob_positive", "prob_negative"]
+GROUP = ["domain", "sentiment"]
+
+
+def _chunks(path, chunksize=CHUNK_ROWS):
+    """Chunks with a global row number (row i ↔ embedding row i)."""
+    start = 0
+    for chunk in pd.read_csv(path, chunksize=chunksize, usecols=lambda c: c in COLUMNS,
+                             dtype={"comment_id": str}):
+        chunk.index = pd.RangeIndex(start, start + len(chunk))
+        start += len(chunk)
+        chunk["clean_text"] = chunk["clean_text"].fillna("").astype(str)
+        yield chunk.dropna(subset=GROUP)
+
+
+def _tokens(texts):
+    rows, toks = _tokenize_chunk((0, list(texts)))
+    return rows, toks
+
+
+def _hashed_counts(texts):
+    """CSR (len(texts) × HASH_DIM) term counts, plus the tokens for labelling."""
+    rows, toks = _tokens(texts)
+    cols = (pd.util.hash_array(toks.astype(str)) % HASH_DIM).astype(np.int64) if len(toks) else np.zeros(0, np.int64)
+    x = sp.csr_matrix((np.ones(len(rows), np.float32), (rows, cols)), shape=(len(texts), HASH_DIM))
+    x.sum_duplicates()
+    return x, rows, toks
+
+
+class Featurizer:
+    def __init__(self, kind, path, idf=None):
+        self.kind, self.path, self.idf = kind, Path(path), idf
+        self.vectors = open_vectors(path) if kind == "embeddings" else None
+        if kind == "embeddings" and self.vectors is None:
+            raise SystemExit(f"No embeddings matching the rows of {path}; run bert_sentiment_inference_v2.py --embeddings")
+
+    def fit_idf(self, chunksize=CHUNK_ROWS):
+        if self.kind != "hash":
+            return self
+        df, n = np.zeros(HASH_DIM, np.int64), 0
+        for chunk in _chunks(self.path, chunksize):
+            x, _, _ = _hashed_counts(chunk["clean_text"])
+            df += np.bincount(x.indices, minlength=HASH_DIM)
+            n += x.shape[0]
+        self.idf = (np.log((1 + n) / (1 + df)) + 1).astype(np.float32)
+        return self
+
+    def transform(self, chunk):
+        """→ (features, non-empty row mask, tokens (rows, toks) or None)."""
+        if self.kind == "embeddings":
+            x = np.asarray(self.vectors[chunk.index.to_numpy()], dtype=np.float32)
+            norms = np.linalg.norm(x, axis=1)
+            x = x / np.maximum(norms, 1e-12)[:, None]
+            return x, norms > 0, None
+        x, rows, toks = _hashed_counts(chunk["clean_text"])
+        x.data = (1 + np.log(x.data)) * self.idf[x.indices]
+        norms = np.sqrt(np.asarray(x.multiply(x).sum(axis=1)).ravel())
+        x = sp.diags(1 / np.maximum(norms, 1e-12)).dot(x).tocsr()
+        return x, norms > 0, (rows, toks)
+
+
+def _groups(chunk):
+    for key, part in chunk.groupby(GROUP, sort=False, observed=True):
+        yield tuple(key), part
+
+
+def _positions(chunk, part):
+    return chunk.index.get_indexer(part.index)
+
+
+class TopicModel:
+    """One MiniBatchKMeans per (domain, sentiment), trained online."""
+
+    def __init__(self, k=K, features="hash", seed=0):
+        self.k, self.features, self.seed = k, features, seed
+        self.models = {}
+        self._pending = {}              # group → features buffered until INIT_ROWS * k rows
+
+    def _fit_rows(self, key, x):
+        km = self.models.get(key)
+        if km is None:
+            buf = self._pending.setdefault(key, [])
+            buf.append(x)
+            if sum(b.shape[0] for b in buf) < INIT_ROWS * self.k:
+                return
+            x = sp.vstack(buf).tocsr() if sp.issparse(buf[0]) else np.vstack(buf)
+            del self._pending[key]
+            km = self.models[key] = MiniBatchKMeans(self.k, self.seed).init(x)
+        for i in range(0, x.shape[0], KMEANS_BATCH):
+            km.partial_fit(x[i:i + KMEANS_BATCH])
+
+    def flush(self):
+        """Seed groups that never reached INIT_ROWS * k rows with what they have."""
+        for key, buf in list(self._pending.items()):
+            x = sp.vstack(buf).tocsr() if sp.issparse(buf[0]) else np.vstack(buf)
+            self.models[key] = MiniBatchKMeans(self.k, self.seed).init(x).partial_fit(x)
+        self._pending.clear()
+
+    def partial_fit(self, chunk, feats, skip=None):
+        x, ok, _ = feats
+        if skip is not None:
+            ok = ok & ~skip
+        for key, part in _groups(chunk):
+            pos = _positions(chunk, part)
+            pos = pos[ok[pos]]
+            if len(pos):
+                self._fit_rows(key, x[pos])
+
+    def predict(self, chunk, feats):
+        x, ok, _ = feats
+        topic = np.full(len(chunk), -1, dtype=np.int64)
+        sim = np.zeros(len(chunk), dtype=np.float32)
+        for key, part in _groups(chunk):
+            km = self.models.get(key)
+            pos = _positions(chunk, part)
+            pos = pos[ok[pos]]
+            if km is None or not len(pos):
+                continue
+            topic[pos], sim[pos] = km.predict(x[pos])
+        return topic, sim
+
+    # ---- persistence
+    def save(self, idf=None):
+        TOPIC_DIR.mkdir(parents=True, exist_ok=True)
+        arrays, groups = {}, []
+        for i, (key, km) in enumerate(sorted(self.models.items())):
+            arrays[f"centers_{i}"], arrays[f"counts_{i}"] = km.centers, km.counts
+            groups.append(list(key))
+        if idf is not None:
+            arrays["idf"] = idf
+        np.savez(MODEL_FILE, **arrays)
+        with open(META_FILE, "w", encoding="utf-8") as f:
+            json.dump({"k": self.k, "features": self.features, "seed": self.seed, "hash_dim": HASH_DIM,
+                       "groups": groups}, f, indent=1)
+
+    @classmethod
+    def load(cls):
+        if not META_FILE.exists():
+            raise SystemExit(f"No topic model at {META_FILE}; run 'fit' first")
+        with open(META_FILE, encoding="utf-8") as f:
+            meta = json.load(f)
+        tm = cls(meta["k"], meta["features"], meta["seed"])
+        z = np.load(MODEL_FILE)
+        for i, key in enumerate(meta["groups"]):
+            tm.models[tuple(key)] = MiniBatchKMeans(meta["k"], meta["seed"], centers=z[f"centers_{i}"],
+                                                    counts=z[f"counts_{i}"])
+        return tm, (z["idf"] if "idf" in z.files else None)
+
+
+class TopicStats:
+    """Streaming per-topic aggregates + token counts for labels."""
+
+    def __init__(self):
+        self.sums = None
+        self.terms = {}                 # (domain, sentiment, topic) → Counter
+        self.best = {}                  # (domain, sentiment, topic) → (similarity, text)
+
+    def update(self, chunk, topic, sim, tokens):
+        d = chunk[GROUP].assign(topic=topic, n=1, sim=sim,
+                                like_count=pd.to_numeric(chunk.get("like_count"), errors="coerce").fillna(0),
+                                prob_positive=chunk.get("prob_positive"), prob_negative=chunk.get("prob_negative"))
+        d = d[d["topic"] >= 0]
+        part = d.groupby(GROUP + ["topic"], observed=True)[["n", "like_count", "prob_positive", "prob_negative"]].sum()
+        self.sums = part if self.sums is None else self.sums.add(part, fill_value=0)
+        if len(d):
+            top = d.loc[d.groupby(GROUP + ["topic"], observed=True)["sim"].idxmax()]
+            for idx, r in top.iterrows():
+                key = (r["domain"], r["sentiment"], int(r["topic"]))
+                if r["sim"] > self.best.get(key, (-np.inf, ""))[0]:
+                    self.best[key] = (float(r["sim"]), chunk.at[idx, "clean_text"])
+        if tokens is None:
+            rows, toks = _tokens(chunk["clean_text"])
+        else:
+            rows, toks = tokens
+        if len(rows):
+            t = pd.DataFrame({"row": rows, "tok": toks})
+            t["topic"] = topic[rows]
+            t = t[t["topic"] >= 0]
+            t["domain"] = chunk["domain"].to_numpy()[t["row"]]
+            t["sentiment"] = chunk["sentiment"].to_numpy()[t["row"]]
+            for (dom, sent, tp), cnt in t.groupby(["domain", "sentiment", "topic"])["tok"].value_counts().groupby(level=[0, 1, 2]):
+                self.terms.setdefault((dom, sent, int(tp)), Counter()).update(dict(zip(cnt.index.get_level_values(-1), cnt.to_numpy())))
+
+    def _label(self, dom, sent, tp, k):
+        """Top words by frequency × log-lift against the whole domain × sentiment group."""
+        own = self.terms.get((dom, sent, tp), Counter())
+        group = Counter()
+        for (d, s, _), c in self.terms.items():
+            if d == dom and s == sent:
+                group.update(c)
+        n_own, n_group = sum(own.values()) or 1, sum(group.values()) or 1
+        score = {w: c * np.log((c / n_own) / ((group[w] + 1) / n_group)) for w, c in own.items() if c >= 2}
+        return " ".join(w for w, _ in sorted(score.items(), key=lambda x: -x[1])[:k])
+
+    def table(self, k=LABEL_TERMS):
+        if self.sums is None:
+            return pd.DataFrame()
+        t = self.sums.reset_index()
+        t["n"] = t["n"].astype(int)
+        t["share"] = t["n"] / t.groupby(GROUP)["n"].transform("sum")
+        t["mean_likes"] = t["like_count"] / t["n"]
+        for c in ["prob_positive", "prob_negative"]:
+            t[f"mean_{c}"] = t[c] / t["n"]
+        t = t.rename(columns={"like_count": "like_sum"}).drop(columns=["prob_positive", "prob_negative"])
+        t["topic"] = t["topic"].astype(int)
+        t["label"] = [self._label(d, s, tp, k) for d, s, tp in zip(t["domain"], t["sentiment"], t["topic"])]
+        t["example"] = [self.best.get((d, s, tp), (0, ""))[1][:200]
+                        for d, s, tp in zip(t["domain"], t["sentiment"], t["topic"])]
+        return t.sort_values(GROUP + ["n"], ascending=[True, True, False]).reset_index(drop=True)
+
+
+def assign(path, tm, feat, update=False, chunksize=CHUNK_ROWS):
+    """Assign every comment to its group's nearest topic; write assignments + topic table."""
+    seen = set()
+    if update and ASSIGN_CSV.exists():
+        seen = set(pd.read_csv(ASSIGN_CSV, usecols=["comment_id"], dtype={"comment_id": str})["comment_id"])
+        n_new = 0
+        for chunk in _chunks(path, chunksize):
+            new = ~chunk["comment_id"].isin(seen).to_numpy()
+            if new.any():
+                tm.partial_fit(chunk, feat.transform(chunk), skip=~new)
+                n_new += int(new.sum())
+        tm.flush()
+        tm.save(feat.idf)
+        print(f"Updated centers with {n_new} new comments")
+
+    stats, header = TopicStats(), True
+    TOPIC_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = ASSIGN_CSV.with_suffix(".tmp")
+    for chunk in _chunks(path, chunksize):
+        feats = feat.transform(chunk)
+        topic, sim = tm.predict(chunk, feats)
+        out = chunk[["comment_id"] + GROUP].assign(topic=topic, similarity=sim.round(4))
+        out.to_csv(tmp, mode="w" if header else "a", header=header, index=False)
+        header = False
+        stats.update(chunk, topic, sim, feats[2])
+    tmp.replace(ASSIGN_CSV)
+    table = stats.table()
+    table.to_csv(TOPICS_CSV, index=False)
+    return table
+
+
+def fit(path, k=K, features="hash", epochs=EPOCHS, seed=0, chunksize=CHUNK_ROWS):
+    feat = Featurizer(features, path).fit_idf(chunksize)
+    tm = TopicModel(k, features, seed)
+    for _ in range(epochs):
+        for chunk in _chunks(path, chunksize):
+            tm.partial_fit(chunk, feat.transform(chunk))
+        tm.flush()
+    tm.save(feat.idf)
+    return tm, feat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Online topic clustering per domain × sentiment")
+    parser.add_argument("--input", type=str, default=str(WITH_SENT_CSV))
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    f = sub.add_parser("fit", help="train topic centers (streaming), then assign")
+    f.add_argument("--k", type=int, default=K)
+    f.add_argument("--features", type=str, default="hash", choices=["hash", "embeddings"])
+    f.add_argument("--epochs", type=int, default=EPOCHS)
+    f.add_argument("--seed", type=int, default=0)
+    a = sub.add_parser("assign", help="assign comments to the saved topics (no retraining)")
+    a.add_argument("--update", action="store_true", help="fold comments not assigned before into the centers first")
+    s = sub.add_parser("show", help="print the topic table")
+    s.add_argument("--domain", type=str, default=None)
+    s.add_argument("--sentiment", type=str, default=None)
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    if args.cmd == "show":
+        if not TOPICS_CSV.exists():
+            raise SystemExit(f"No topics at {TOPICS_CSV}; run 'fit' first")
+        t = pd.read_csv(TOPICS_CSV)
+        for col in ["domain", "sentiment"]:
+            if getattr(args, col):
+                t = t[t[col] == getattr(args, col)]
+        with pd.option_context("display.max_colwidth", 70, "display.width", 220):
+            print(t[GROUP + ["topic", "n", "share", "mean_likes", "label", "example"]].round(3).to_string(index=False))
+        return
+    if args.cmd == "fit":
+        tm, feat = fit(Path(args.input), args.k, args.features, args.epochs, args.seed)
+        print(f"Fitted {len(tm.models)} groups × k={args.k} ({args.features}) in {time.perf_counter() - t0:.1f}s")
+    else:
+        tm, idf = TopicModel.load()
+        feat = Featurizer(tm.features, Path(args.input), idf)
+    table = assign(Path(args.input), tm, feat, update=getattr(args, "update", False))
+    print(f"{int(table['n'].sum()) if len(table) else 0} comments → {len(table)} topics; "
+          f"{ASSIGN_CSV}, {TOPICS_CSV} ({time.perf_counter() - t0:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
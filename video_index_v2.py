@@ -0,0 +1,221 @@
+# video_index_v2.py
+# Per-video engagement index: a SQLite file built from WITH_SENT_CSV so video-level questions
+# ("which steam videos have the most negative comments with 10+ likes?") are index lookups instead
+# of a scan of the full CSV.
+#   comments  one row per (comment_id, domain); indexed on video_id, (domain, published_at),
+#             (domain, sentiment, like_count) and (domain, sentiment, prob_*) for top-k lookups
+#   videos    precomputed per-video aggregates: comment count, like sum, sentiment mix, first/last date
+# Building is incremental: each chunk goes to a staging table and is compared with the stored
+# rows by (comment_id, domain). Only new or changed rows (likes, label, probabilities, text, ...)
+# are written, and only their videos are re-aggregated, so a rerun over an unchanged CSV writes
+# nothing.
+# File: RESULTS_DIR/video_index.sqlite
+# Usage:
+#     python video_index_v2.py build [--rebuild]
+#     python video_index_v2.py top --domain steam --sentiment negative --min_likes 10 --k 10
+#     python video_index_v2.py videos --domain food --order share_negative --min_comments 50
+#     python video_index_v2.py drill --video_id jokAXdH2IQ0 --sentiment negative --k 5
+
+from settings import RESULTS_DIR, WITH_SENT_CSV
+import argparse, sqlite3, time
+from pathlib import Path
+
+import pandas as pd
+
+from dataset_v2 import SENTIMENT_ORDER, text_of
+
+INDEX_DB = RESULTS_DIR / "video_index.sqlite"
+CHUNK_ROWS = 100_000
+PROB_COL = {s: f"prob_{s}" for s in SENTIMENT_ORDER}
+
+COMMENT_COLS = ["comment_id", "domain", "video_id", "video_title", "published_at", "sentiment",
+                "like_count", "prob_negative", "prob_neutral", "prob_positive", "clean_text"]
+VIDEO_ORDERS = ("n", "like_sum", "n_negative", "n_positive", "share_negative", "share_positive", "mean_likes")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS comments (
+    comment_id TEXT NOT NULL, domain TEXT NOT NULL, video_id TEXT, video_title TEXT,
+    published_at TEXT, sentiment TEXT, like_count INTEGER,
+    prob_negative REAL, prob_neutral REAL, prob_positive REAL, clean_text TEXT,
+    PRIMARY KEY (comment_id, domain)
+);
+CREATE INDEX IF NOT EXISTS ix_comments_video ON comments(video_id, sentiment);
+CREATE INDEX IF NOT EXISTS ix_comments_time ON comments(domain, published_at);
+CREATE INDEX IF NOT EXISTS ix_comments_likes ON comments(domain, sentiment, like_count DESC);
+CREATE INDEX IF NOT EXISTS ix_comments_pos ON comments(domain, sentiment, prob_positive DESC);
+CREATE INDEX IF NOT EXISTS ix_comments_neu ON comments(domain, sentiment, prob_neutral DESC);
+CREATE INDEX IF NOT EXISTS ix_comments_neg ON comments(domain, sentiment, prob_negative DESC);
+CREATE TABLE IF NOT EXISTS videos (
+    video_id TEXT NOT NULL, domain TEXT NOT NULL, video_title TEXT,
+    n INTEGER, like_sum INTEGER, mean_likes REAL,
+    n_negative INTEGER, n_neutral INTEGER, n_positive INTEGER,
+    share_negative REAL, share_neutral REAL, share_positive REAL,
+    first_at TEXT, last_at TEXT,
+    PRIMARY KEY (video_id, domain)
+);
+CREATE INDEX IF NOT EXISTS ix_videos_domain ON videos(domain, n DESC);
+"""
+
+VIDEO_AGG = """
+INSERT OR REPLACE INTO videos
+SELECT video_id, domain, MAX(video_title), COUNT(*), SUM(like_count), AVG(like_count),
+       SUM(sentiment = 'negative'), SUM(sentiment = 'neutral'), SUM(sentiment = 'positive'),
+       AVG(sentiment = 'negative'), AVG(sentiment = 'neutral'), AVG(sentiment = 'positive'),
+       MIN(published_at), MAX(published_at)
+FROM comments WHERE video_id IN (SELECT video_id FROM touched)
+GROUP BY video_id, domain
+"""
+
+
+def connect(path=INDEX_DB):
+    con = sqlite3.connect(path)
+    con.row_factory = sqlite3.Row
+    con.executescript(SCHEMA)
+    return con
+
+
+def _prepare(chunk):
+    chunk = chunk.dropna(subset=["comment_id", "domain"])
+    out = pd.DataFrame({c: chunk[c] if c in chunk.columns else None for c in COMMENT_COLS})
+    out["like_count"] = pd.to_numeric(out["like_count"], errors="coerce").fillna(0).astype("int64")
+    out = out.astype(object).where(out.notna(), None)
+    return out
+
+
+# staged rows that are new or differ from the stored row in any column (IS NOT: NULL-safe)
+CHANGED = ("s LEFT JOIN comments c ON c.comment_id = s.comment_id AND c.domain = s.domain WHERE (c.comment_id IS NULL OR "
+           + " OR ".join(f"c.{col} IS NOT s.{col}" for col in COMMENT_COLS[2:]) + ")")
+
+
+def build(path=WITH_SENT_CSV, db=INDEX_DB, rebuild=False, chunksize=CHUNK_ROWS):
+    """Write new / changed scored comments and refresh aggregates of their videos.
+    Returns rows written."""
+    if rebuild:
+        Path(db).unlink(missing_ok=True)
+    con = connect(db)
+    cols = ",".join(COMMENT_COLS)
+    con.execute("CREATE TEMP TABLE touched (video_id TEXT PRIMARY KEY)")
+    con.execute(f"CREATE TEMP TABLE staged AS SELECT {cols} FROM comments WHERE 0")
+    placeholders = ",".join("?" * len(COMMENT_COLS))
+    total = 0
+    with con:
+        for chunk in pd.read_csv(path, chunksize=chunksize, dtype={"video_id": str, "comment_id": str}):
+            rows = _prepare(chunk).drop_duplicates(["comment_id", "domain"], keep="last")
+            con.execute("DELETE FROM staged")
+            con.executemany(f"INSERT INTO staged VALUES ({placeholders})", rows.itertuples(index=False, name=None))
+            # old and new video of a changed row both need re-aggregating
+            con.execute(f"""INSERT OR IGNORE INTO touched
+                            SELECT s.video_id FROM staged {CHANGED} AND s.video_id IS NOT NULL
+                            UNION SELECT c.video_id FROM staged {CHANGED} AND c.video_id IS NOT NULL""")
+            cur = con.execute(f"INSERT OR REPLACE INTO comments ({cols}) SELECT s.* FROM staged {CHANGED}")
+            total += cur.rowcount
+        con.execute("DELETE FROM videos WHERE video_id IN (SELECT video_id FROM touched)")
+        con.execute(VIDEO_AGG)
+    con.execute("ANALYZE")
+    con.close()
+    return total
+
+
+def _frame(cur):
+    return pd.DataFrame([dict(r) for r in cur.fetchall()])
+
+
+def top_comments(con, domain, sentiment, k=3, order="prob", min_likes=0):
+    """Top-k comments of one domain × sentiment, by model confidence ('prob') or 'likes'."""
+    col = PROB_COL[sentiment] if order == "prob" else "like_count"
+    return _frame(con.execute(
+        f"""SELECT video_id, like_count, {PROB_COL[sentiment]} AS prob, clean_text FROM comments
+            WHERE domain = ? AND sentiment = ? AND like_count >= ?
+            ORDER BY {col} DESC LIMIT ?""", (domain, sentiment, min_likes, k)))
+
+
+def top_videos_by_comments(con, domain, sentiment, min_likes=0, k=10):
+    """Videos with the most <sentiment> comments that have at least min_likes likes."""
+    return _frame(con.execute(
+        """SELECT c.video_id, v.video_title, COUNT(*) AS n_match, SUM(c.like_count) AS like_sum, v.n
+           FROM comments c JOIN videos v ON v.video_id = c.video_id AND v.domain = c.domain
+           WHERE c.domain = ? AND c.sentiment = ? AND c.like_count >= ?
+           GROUP BY c.video_id ORDER BY n_match DESC, like_sum DESC LIMIT ?""",
+        (domain, sentiment, min_likes, k)))
+
+
+def videos(con, domain=None, order="n", min_comments=1, k=20):
+    if order not in VIDEO_ORDERS:
+        raise ValueError(f"order must be one of {VIDEO_ORDERS}")
+    where, args = "n >= ?", [min_comments]
+    if domain:
+        where += " AND domain = ?"
+        args.append(domain)
+    return _frame(con.execute(f"SELECT * FROM videos WHERE {where} ORDER BY {order} DESC LIMIT ?", (*args, k)))
+
+
+def drill(con, video_id, sentiment=None, k=10, order="likes"):
+    """Comments of one video, optionally one sentiment, by likes or by confidence."""
+    where, args = "video_id = ?", [video_id]
+    if sentiment:
+        where += " AND sentiment = ?"
+        args.append(sentiment)
+    col = "like_count" if order == "likes" or not sentiment else PROB_COL[sentiment]
+    return _frame(con.execute(
+        f"""SELECT comment_id, published_at, sentiment, like_count, prob_negative, prob_positive, clean_text
+            FROM comments WHERE {where} ORDER BY {col} DESC LIMIT ?""", (*args, k)))
+
+
+def representative(df, sentiment, k=3):
+    """In-memory counterpart of top_comments for every domain at once: one groupby-nlargest on
+    the sentiment's probability instead of a filter + full sort per domain. → {domain: [text]}."""
+    col = PROB_COL[sentiment]
+    sub = df.loc[df["sentiment"] == sentiment, ["domain", col]]
+    top = sub.groupby("domain", observed=True)[col].nlargest(k)
+    texts = text_of(df, top.index.get_level_values(-1)).to_numpy()
+    out = {}
+    for dom, t in zip(top.index.get_level_values(0), texts):
+        out.setdefault(dom, []).append(t)
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-video engagement index (SQLite) with top-k / drill-down queries")
+    parser.add_argument("--db", type=str, default=str(INDEX_DB))
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build")
+    b.add_argument("--input", type=str, default=str(WITH_SENT_CSV))
+    b.add_argument("--rebuild", action="store_true")
+    t = sub.add_parser("top", help="videos with the most <sentiment> comments having >= min_likes likes")
+    t.add_argument("--domain", type=str, required=True)
+    t.add_argument("--sentiment", type=str, default="negative", choices=SENTIMENT_ORDER)
+    t.add_argument("--min_likes", type=int, default=0)
+    t.add_argument("--k", type=int, default=10)
+    v = sub.add_parser("videos", help="per-video aggregates")
+    v.add_argument("--domain", type=str, default=None)
+    v.add_argument("--order", type=str, default="n", choices=VIDEO_ORDERS)
+    v.add_argument("--min_comments", type=int, default=1)
+    v.add_argument("--k", type=int, default=20)
+    d = sub.add_parser("drill", help="comments of one video")
+    d.add_argument("--video_id", type=str, required=True)
+    d.add_argument("--sentiment", type=str, default=None, choices=SENTIMENT_ORDER)
+    d.add_argument("--order", type=str, default="likes", choices=["likes", "prob"])
+    d.add_argument("--k", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    if args.cmd == "build":
+        n = build(Path(args.input), Path(args.db), rebuild=args.rebuild)
+        print(f"Wrote {n} new or changed comments → {args.db} ({time.perf_counter() - t0:.1f}s)")
+        return
+    if not Path(args.db).exists():
+        raise SystemExit(f"No index at {args.db}; run 'build' first")
+    con = connect(args.db)
+    if args.cmd == "top":
+        res = top_videos_by_comments(con, args.domain, args.sentiment, args.min_likes, args.k)
+    elif args.cmd == "videos":
+        res = videos(con, args.domain, args.order, args.min_comments, args.k)
+    else:
+        res = drill(con, args.video_id, args.sentiment, args.k, args.order)
+    with pd.option_context("display.max_colwidth", 80, "display.width", 200):
+        print(res.to_string(index=False) if len(res) else "No rows.")
+    print(f"({time.perf_counter() - t0:.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+# youtube_client_v2.py
+# Pool of YouTube Data API keys behind the usual client interface:
+#     yt = build_pooled_client()
+#     yt.commentThreads().list(videoId=..., pageToken=tok).execute()
+# Each execute() goes to the key with the most remaining daily budget. Costs come from
+# pipeline_metrics_v2.QUOTA_COST. On quotaExceeded the key is marked exhausted and the same
+# request (same kwargs, so the same pageToken) is retried on the next key. A revoked or invalid
+# key is disabled the same way. Other errors (commentsDisabled, videoNotFound, ...) are counted
+# on the key and re-raised. QuotaExhausted is raised once no key has budget left.
+# Keys: YOUTUBE_API_KEYS=key1,key2,...   (falls back to YOUTUBE_API_KEY), in .env or the environment.
+# Budget per key: YOUTUBE_DAILY_QUOTA (default 10000). Usage is persisted per quota day
+# (Pacific time, when Google resets quotas) in RESULTS_DIR/api_keys/usage_<date>.json, so a restart
+# does not hand an exhausted key more work. Keys are stored as short hashes, never in clear.
+# Clients are built lazily, one per key and thread (httplib2 connections are not thread-safe);
+# pass factory=lambda key: <client> to run against a fake backend.
+# Usage:
+#     python youtube_client_v2.py            # today's usage per key
+
+from settings import RESULTS_DIR
+import argparse, atexit, hashlib, json, os, threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from pipeline_metrics_v2 import QUOTA_COST, current
+
+USAGE_DIR = RESULTS_DIR / "api_keys"
+DAILY_QUOTA = 10_000
+SAVE_EVERY = 200            # calls between usage snapshots
+QUOTA_TZ = ZoneInfo("America/Los_Angeles")
+EXHAUSTED_REASONS = {"quotaExceeded", "dailyLimitExceeded"}
+DISABLED_REASONS = {"keyInvalid", "keyExpired", "accessNotConfigured", "ipRefererBlocked"}
+
+
+class QuotaExhausted(RuntimeError):
+    pass
+
+
+def load_api_keys():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    raw = os.getenv("YOUTUBE_API_KEYS") or os.getenv("YOUTUBE_API_KEY") or ""
+    keys = list(dict.fromkeys(k.strip() for k in raw.split(",") if k.strip()))
+    if not keys:
+        raise RuntimeError("Missing YOUTUBE_API_KEYS / YOUTUBE_API_KEY in .env")
+    return keys
+
+
+def error_reason(exc):
+    """'quotaExceeded' etc. from a googleapiclient HttpError (None if not an API error)."""
+    content = getattr(exc, "content", None)
+    if not content:
+        return None
+    try:
+        err = json.loads(content.decode("utf-8") if isinstance(content, bytes) else content)["error"]
+    except (ValueError, KeyError, TypeError):
+        return None
+    errors = err.get("errors") or []
+    return errors[0].get("reason") if errors else err.get("status")
+
+
+def _label(key):
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:8]
+
+
+def _quota_day():
+    return datetime.now(QUOTA_TZ).strftime("%Y-%m-%d")
+
+
+def _google_factory(key):
+    from googleapiclient.discovery import build
+
+    return build("youtube", "v3", developerKey=key, cache_discovery=False)
+
+
+class KeyPool:
+    def __init__(self, keys, daily_quota=DAILY_QUOTA, factory=None, usage_dir=USAGE_DIR, persist=True):
+        self.keys = list(keys)
+        self.daily_quota = daily_quota
+        self.factory = factory or _google_factory
+        self.usage_path = usage_dir / f"usage_{_quota_day()}.json" if persist else None
+        self.stats = {_label(k): {"units": 0, "calls": 0, "errors": 0, "failovers": 0, "state": "ok"}
+                      for k in self.keys}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._since_save = 0
+        self._load_usage()
+
+    # ---- usage persistence
+    def _load_usage(self):
+        if self.usage_path is None or not self.usage_path.exists():
+            return
+        with open(self.usage_path, encoding="utf-8") as f:
+            saved = json.load(f)
+        for lab, st in saved.items():
+            if lab in self.stats:
+                self.stats[lab].update(st)
+
+    def save_usage(self):
+        if self.usage_path is None:
+            return
+        self.usage_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            data = json.dumps(self.stats, indent=1)
+            self._since_save = 0
+        tmp = self.usage_path.with_suffix(".tmp")
+        tmp.write_text(data, encoding="utf-8")
+        tmp.replace(self.usage_path)
+
+    # ---- routing
+    def client(self, key):
+        clients = getattr(self._local, "clients", None)
+        if clients is None:
+            clients = self._local.clients = {}
+        if key not in clients:
+            clients[key] = self.factory(key)
+        return clients[key]
+
+    def acquire(self, cost, exclude=()):
+        """Key with the most budget left that can pay `cost`; the cost is reserved up front."""
+        with self._lock:
+            best, best_left = None, -1
+            for k in self.keys:
+                st = self.stats[_label(k)]
+                left = self.daily_quota - st["units"]
+                if st["state"] == "ok" and k not in exclude and left >= cost and left > best_left:
+                    best, best_left = k, left
+            if best is None:
+                raise QuotaExhausted(f"no API key with {cost} quota units left ({self.summary_line()})")
+            st = self.stats[_label(best)]
+            st["units"] += cost
+            st["calls"] += 1
+            self._since_save += 1
+            return best
+
+    def release(self, key, cost, error=None, state=None):
+        with self._lock:
+            st = self.stats[_label(key)]
+            if error is not None:
+                st["errors"] += 1
+            if state is not None:
+                st["units"] -= cost             # the rejected call was not charged
+                st["failovers"] += 1
+                st["state"] = state
+                if state == "exhausted":
+                    st["units"] = max(st["units"], self.daily_quota)
+
+    def execute(self, resource, method, args, kwargs):
+        cost = QUOTA_COST.get(f"{resource}.{method}", 1)
+        tried = set()
+        while True:
+            key = self.acquire(cost, exclude=tried)
+            try:
+                req = getattr(getattr(self.client(key), resource)(), method)(*args, **kwargs)
+                resp = req.execute()
+            except Exception as e:
+                reason = error_reason(e)
+                state = ("exhausted" if reason in EXHAUSTED_REASONS
+                         else "disabled" if reason in DISABLED_REASONS else None)
+                self.release(key, cost, error=e, state=state)
+                if state is None:
+                    raise
+                tried.add(key)
+                print(f"[keys] {_label(key)} {reason} → failover")
+                self.save_usage()
+                continue
+            if self._since_save >= SAVE_EVERY:
+                self.save_usage()
+            return resp
+
+    def summary(self):
+        with self._lock:
+            return {lab: dict(st, left=max(self.daily_quota - st["units"], 0)) for lab, st in self.stats.items()}
+
+    def summary_line(self):
+        return ", ".join(f"{lab}:{st['state']}/{st['units']}u" for lab, st in self.stats.items())
+
+
+class _PooledRequest:
+    def __init__(self, pool, resource, method, args, kwargs):
+        self._pool, self._resource, self._method = pool, resource, method
+        self._args, self._kwargs = args, kwargs
+
+    def execute(self):
+        return self._pool.execute(self._resource, self._method, self._args, self._kwargs)
+
+
+class _PooledResource:
+    def __init__(self, pool, name):
+        self._pool, self._name = pool, name
+
+    def __getattr__(self, method):
+        return lambda *a, **kw: _PooledRequest(self._pool, self._name, method, a, kw)
+
+
+class PooledClient:
+    """Drop-in for the googleapiclient youtube resource: yt.X().method(**kw).execute()."""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __getattr__(self, name):
+        return lambda: _PooledResource(self.pool, name)
+
+    def close(self):
+        """Persist usage and attach per-key stats to the current metrics run."""
+        self.pool.save_usage()
+        current().extra["api_keys"] = self.pool.summary()
+
+
+def build_pooled_client(keys=None, daily_quota=None, factory=None, persist=True):
+    keys = keys or load_api_keys()
+    daily_quota = daily_quota or int(os.getenv("YOUTUBE_DAILY_QUOTA", DAILY_QUOTA))
+    client = PooledClient(KeyPool(keys, daily_quota, factory, persist=persist))
+    atexit.register(client.close)       # runs before the metrics report registered earlier by start_run
+    return client
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API key pool usage for the current quota day")
+    parser.add_argument("--quota", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    daily_quota = args.quota or int(os.getenv("YOUTUBE_DAILY_QUOTA", DAILY_QUOTA))
+    pool = KeyPool(load_api_keys(), daily_quota)
+    print(f"Quota day {_quota_day()} (Pacific), {len(pool.keys)} keys × {pool.daily_quota} units")
+    for lab, st in pool.summary().items():
+        print(f"  {lab}  {st['state']:<9} used={st['units']:>6}  left={st['left']:>6}  "
+              f"calls={st['calls']}  errors={st['errors']}  failovers={st['failovers']}")
+
+
+if __name__ == "__main__":
+    main()